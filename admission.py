@@ -0,0 +1,289 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is turned away; carries the HTTP status and Retry-After"""
+
+    def __init__(self, message, status, reason, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """Per-session token buckets: `rate` tokens a second, up to `burst` saved up.
+
+    Idle sessions are forgotten least-recently-used first beyond max_sessions;
+    a forgotten session simply starts again with a full bucket.
+    """
+
+    def __init__(self, rate=1.0, burst=10.0, max_sessions=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_sessions = max_sessions
+        self._buckets = OrderedDict()  # session -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, session, cost=1.0):
+        """Spend cost tokens; returns 0.0 if allowed, else seconds until it would be"""
+        now = time.monotonic()
+        cost = min(cost, self.burst)  # a big batch may drain the bucket, but can always run eventually
+        with self._lock:
+            tokens, updated = self._buckets.pop(session, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / self.rate if self.rate > 0 else 60.0
+            self._buckets[session] = (tokens, now)
+            while len(self._buckets) > self.max_sessions:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def refund(self, session, cost=1.0):
+        """Give back tokens taken for a request that was then turned away"""
+        cost = min(cost, self.burst)
+        with self._lock:
+            entry = self._buckets.get(session)
+            if entry is not None:
+                tokens, updated = entry
+                self._buckets[session] = (min(self.burst, tokens + cost), updated)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+class WorkClass:
+    """One kind of work (cheap text or heavy OCR/voice) with its own queue"""
+
+    def __init__(self, name, weight=1, max_in_flight=None, max_queue=32, deadline=2.0, cost=1.0):
+        self.name = name
+        self.weight = weight
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.cost = cost
+        self.waiters = deque()
+        self.in_flight = 0
+        self.credit = 0
+        self.admitted = 0
+        self.queued_total = 0
+        self.rate_limited = 0
+        self.queue_full = 0
+        self.shed = 0
+        self.waited = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def has_room(self):
+        return self.max_in_flight is None or self.in_flight < self.max_in_flight
+
+
+class _Waiter:
+    __slots__ = ('event', 'granted')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Ticket:
+    """An admitted request's slot; release() is safe to call more than once"""
+
+    def __init__(self, controller, work, session):
+        self._controller = controller
+        self.work = work
+        self.session = session
+        self._released = False
+
+    def release(self):
+        # The close hook and an error path can race to release; only one may hand the slot back
+        with self._controller._lock:
+            if self._released:
+                return
+            self._released = True
+            self._controller._free(self.work, self.session)
+
+
+class AdmissionController:
+    """Decides whether a query runs now, waits briefly, or is turned away.
+
+    Three checks run before a query gets a request slot:
+    - per-session token buckets, where heavy work costs more, answered with 429
+    - a per-session cap on concurrent queries, answered with 429
+    - a shared pool of slots
+
+    Waiting requests sit in one queue per work class. Freed slots go to the
+    queues by smooth weighted round-robin, so text keeps flowing while
+    OCR/voice is backed up. Heavy work also has its own in-flight cap. A
+    request that can't start within its class's deadline, or finds its queue
+    full, gets a fast 503 rather than an ever longer wait.
+    """
+
+    def __init__(self, slots=16, classes=None, rate=1.0, burst=10.0, session_max_in_flight=2):
+        self.slots = slots
+        self.classes = {work.name: work for work in (classes or [WorkClass('text')])}
+        self.buckets = TokenBuckets(rate=rate, burst=burst) if rate > 0 else None
+        self.session_max_in_flight = session_max_in_flight
+        self.in_flight = 0
+        self._sessions = {}  # session -> admitted or queued requests
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a controller from ADMISSION_* and SESSION_RATE_* environment variables"""
+        cores = os.cpu_count() or 1
+        return cls(
+            slots=int(os.getenv('ADMISSION_SLOTS', '16')),
+            classes=[
+                WorkClass(
+                    'text',
+                    weight=int(os.getenv('ADMISSION_TEXT_WEIGHT', '3')),
+                    max_queue=int(os.getenv('ADMISSION_TEXT_QUEUE', '64')),
+                    deadline=float(os.getenv('ADMISSION_TEXT_DEADLINE', '2')),
+                    cost=1.0,
+                ),
+                WorkClass(
+                    'heavy',
+                    weight=int(os.getenv('ADMISSION_HEAVY_WEIGHT', '1')),
+                    max_in_flight=int(os.getenv('ADMISSION_HEAVY_MAX', str(max(2, cores)))),
+                    max_queue=int(os.getenv('ADMISSION_HEAVY_QUEUE', '16')),
+                    deadline=float(os.getenv('ADMISSION_HEAVY_DEADLINE', '5')),
+                    cost=float(os.getenv('SESSION_RATE_HEAVY_COST', '3')),
+                ),
+            ],
+            rate=float(os.getenv('SESSION_RATE', '1')),
+            burst=float(os.getenv('SESSION_RATE_BURST', '10')),
+            session_max_in_flight=int(os.getenv('SESSION_MAX_IN_FLIGHT', '2')),
+        )
+
+    def admit(self, work, session, units=1):
+        """Wait for a slot and return a Ticket, or raise AdmissionRejected.
+
+        units scales the token cost, e.g. the number of questions in a batch.
+        """
+        work_class = self.classes[work]
+        session = session or 'anonymous'
+        cost = work_class.cost * units
+
+        started = time.perf_counter()
+        with self._lock:
+            # The session's check and its reservation happen together, so two requests can't both squeeze in
+            if self.session_max_in_flight and self._sessions.get(session, 0) >= self.session_max_in_flight:
+                work_class.rate_limited += 1
+                raise AdmissionRejected('Please wait for your current question to finish before asking another.',
+                                        429, 'session_busy', 1.0)
+            if self.buckets is not None:
+                wait = self.buckets.take(session, cost)
+                if wait > 0:
+                    work_class.rate_limited += 1
+                    raise AdmissionRejected(
+                        "You're sending questions very quickly. Please wait a moment and try again.",
+                        429, 'rate_limited', wait)
+            self._sessions[session] = self._sessions.get(session, 0) + 1
+
+            if self.in_flight < self.slots and work_class.has_room() and not self._waiting():
+                self._grant(work_class)
+                work_class.admitted += 1
+                return Ticket(self, work, session)
+            if len(work_class.waiters) >= work_class.max_queue:
+                work_class.queue_full += 1
+                self._turn_away(session, cost)
+                raise AdmissionRejected('EduMentor is very busy right now. Please try again in a moment.',
+                                        503, 'queue_full', work_class.deadline)
+            waiter = _Waiter()
+            work_class.waiters.append(waiter)
+            work_class.queued_total += 1
+            self._dispatch()
+
+        waiter.event.wait(work_class.deadline)
+        waited_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            if not waiter.granted:
+                work_class.waiters.remove(waiter)
+                work_class.shed += 1
+                self._turn_away(session, cost)
+                raise AdmissionRejected('EduMentor is busy right now. Please try again in a moment.',
+                                        503, 'deadline', work_class.deadline)
+            work_class.admitted += 1
+            work_class.waited += 1
+            work_class.total_wait_ms += waited_ms
+            work_class.max_wait_ms = max(work_class.max_wait_ms, waited_ms)
+        return Ticket(self, work, session)
+
+    def _waiting(self):
+        return any(work_class.waiters for work_class in self.classes.values())
+
+    def _grant(self, work_class):
+        self.in_flight += 1
+        work_class.in_flight += 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting requests, weighted across work classes"""
+        while self.in_flight < self.slots:
+            ready = [work_class for work_class in self.classes.values() if work_class.waiters and work_class.has_room()]
+            if not ready:
+                return
+            total = sum(work_class.weight for work_class in ready)
+            for work_class in ready:
+                work_class.credit += work_class.weight
+            chosen = max(ready, key=lambda work_class: work_class.credit)
+            chosen.credit -= total
+            waiter = chosen.waiters.popleft()
+            waiter.granted = True
+            self._grant(chosen)
+            waiter.event.set()
+
+    def _turn_away(self, session, cost):
+        """Undo a rejected request's reservation; the server turned it away, so its tokens go back"""
+        self._forget(session)
+        if self.buckets is not None:
+            self.buckets.refund(session, cost)
+
+    def _forget(self, session):
+        count = self._sessions.get(session, 0) - 1
+        if count > 0:
+            self._sessions[session] = count
+        else:
+            self._sessions.pop(session, None)
+
+    def _free(self, work, session):
+        """Return a slot and hand it on; the caller holds the lock"""
+        self.in_flight -= 1
+        self.classes[work].in_flight -= 1
+        self._forget(session)
+        self._dispatch()
+
+    def stats(self):
+        """Return slot usage plus queue depth and rejections per work class"""
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'in_flight': self.in_flight,
+                'active_sessions': len(self._sessions),
+                'tracked_sessions': len(self.buckets) if self.buckets is not None else 0,
+                **{
+                    work_class.name: {
+                        'weight': work_class.weight,
+                        'in_flight': work_class.in_flight,
+                        'queued': len(work_class.waiters),
+                        'max_queue': work_class.max_queue,
+                        'deadline_seconds': work_class.deadline,
+                        'admitted': work_class.admitted,
+                        'queued_total': work_class.queued_total,
+                        'rejected_rate_limited': work_class.rate_limited,
+                        'rejected_queue_full': work_class.queue_full,
+                        'shed_deadline': work_class.shed,
+                        'avg_wait_ms': round(work_class.total_wait_ms / work_class.waited, 1)
+                        if work_class.waited else 0.0,
+                        'max_wait_ms': round(work_class.max_wait_ms, 1),
+                    }
+                    for work_class in self.classes.values()
+                },
+            }
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Question words carry no topic; dropping them keeps "what is photosynthesis"
+# and "explain photosynthesis" equally confident matches.
+STOPWORDS = frozenset("""
+a about an and are as at be by can could define describe difference do does
+explain for from give how i in is it its list me meaning my of on or our own
+please s state tell that the their this to was what whats when where which who
+why with you your
+""".split())
+
+# Bumped when the saved index layout changes, so old files are rebuilt
+INDEX_VERSION = 2
+
+TIER_ORDER = ('primary', 'secondary', 'senior')
+
+
+def stem(token):
+    """Fold simple English plurals so 'fractions' finds 'fraction'"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith(('ches', 'shes', 'sses', 'xes')):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lowercased whole-word tokens; 'ai' never matches inside 'rain' or 'explain'"""
+    return [stem(t) for t in TOKEN_RE.findall(text.lower().replace("'", '')) if t not in STOPWORDS]
+
+
+def class_tier(class_level):
+    """Map a class label ('Class 7', 'Undergraduate') to primary, secondary or senior"""
+    level = (class_level or '').lower()
+    number = re.search(r'\d+', level)
+    if number:
+        grade = int(number.group())
+        return 'primary' if grade <= 5 else 'secondary' if grade <= 10 else 'senior'
+    if 'primary' in level:
+        return 'primary'
+    if 'secondary' in level and 'senior' not in level and 'higher' not in level:
+        return 'secondary'
+    return 'senior'
+
+
+def render(answer, student_info):
+    return (answer
+            .replace('{name}', student_info.get('name') or 'my friend')
+            .replace('{class}', student_info.get('class') or 'your level'))
+
+
+class AnswerIndex:
+    """BM25 index over pre-written, class-tiered answers to common syllabus questions.
+
+    Built from a JSON source file and saved next to it as a compact index so
+    later starts only load it. BM25 over each answer's questions and keywords
+    ranks the candidates, but a match is only trusted when one of its sample
+    questions and the query cover most of each other's weighted terms. "What
+    is a plant" shares a word with "How do plants make their own food?" yet
+    asks something else, so it goes to the LLM.
+    """
+
+    def __init__(self, source_path, index_path=None, min_confidence=0.8, k1=1.2, b=0.75):
+        self.source_path = source_path
+        self.index_path = index_path
+        self.min_confidence = min_confidence
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.docs = []
+        self.postings = {}
+        self.doc_lengths = []
+        self.avg_length = 0.0
+        self.fallback = ''
+        self.build_ms = 0.0
+        self.load_ms = 0.0
+        self.lookups = 0
+        self.served = 0
+        self.demo_served = 0
+        self.queries = 0
+        self.total_lookup_ms = 0.0
+        self.load()
+
+    @classmethod
+    def from_env(cls):
+        """Build an index from ANSWER_* environment variables"""
+        source = os.getenv('ANSWER_SOURCE', os.path.join('data', 'answers.json'))
+        return cls(
+            source,
+            index_path=os.getenv('ANSWER_INDEX_PATH', os.path.join('data', 'answer_index.json')),
+            min_confidence=float(os.getenv('ANSWER_MIN_CONFIDENCE', '0.8')),
+        )
+
+    def load(self):
+        """Load the saved index, rebuilding it if the source file changed"""
+        started = time.perf_counter()
+        if not os.path.exists(self.source_path):
+            print(f"Warning: answer source {self.source_path} not found; local answers disabled")
+            return
+        with open(self.source_path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+
+        index = None
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, encoding='utf-8') as f:
+                    index = json.load(f)
+            except ValueError:
+                index = None
+        if index is None or index.get('source_sha1') != digest or index.get('version') != INDEX_VERSION:
+            index = self.build(json.loads(raw), digest)
+            if self.index_path:
+                self.save(index)
+        else:
+            self.build_ms = index.get('build_ms', 0.0)
+
+        self.docs = index['docs']
+        self.postings = index['postings']
+        self.doc_lengths = index['doc_lengths']
+        self.avg_length = index['avg_length']
+        self.fallback = index['fallback']
+        self.load_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def save(self, index):
+        """Write the index atomically; a read-only data directory just means rebuilding on each start"""
+        path = os.path.abspath(self.index_path)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: couldn't save the answer index to {self.index_path} ({e}); using it from memory")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def build(self, source, digest=''):
+        """Tokenize every answer's questions and keywords into BM25 postings"""
+        started = time.perf_counter()
+        docs, doc_lengths, postings = [], [], {}
+        for doc_id, entry in enumerate(source['answers']):
+            text = ' '.join(entry.get('questions', []) + entry.get('keywords', []) + [entry.get('subject', '')])
+            terms = Counter(tokenize(text))
+            for term, count in terms.items():
+                postings.setdefault(term, []).append([doc_id, count])
+            doc_lengths.append(sum(terms.values()))
+            docs.append({
+                'id': entry['id'],
+                'tier': entry.get('tier', 'any'),
+                'boards': entry.get('boards', []),
+                'languages': entry.get('languages', ['English']),
+                'demo_only': entry.get('demo_only', False),
+                'questions': [sorted(set(tokenize(question))) for question in entry.get('questions', [])],
+                'answer': entry['answer'],
+            })
+        self.build_ms = round((time.perf_counter() - started) * 1000, 2)
+        return {
+            'version': INDEX_VERSION,
+            'source_sha1': digest,
+            'build_ms': self.build_ms,
+            'docs': docs,
+            'postings': postings,
+            'doc_lengths': doc_lengths,
+            'avg_length': sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0,
+            'fallback': source.get('fallback', ''),
+        }
+
+    def _idf(self, term):
+        frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.docs) - frequency + 0.5) / (frequency + 0.5))
+
+    def search(self, query, student_info):
+        """Best answer for the student's tier, board and language.
+
+        Returns (doc, confidence) or (None, 0.0). Confidence compares the query
+        with each of the answer's sample questions and keeps the best: the
+        smaller of the share of the query's IDF weight the question covers and
+        the share of the question's weight the query covers.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.docs:
+            return None, 0.0
+        tier = class_tier(student_info.get('class'))
+        board = (student_info.get('board') or '').upper()
+        language = student_info.get('language') or 'English'
+
+        idf = {}
+        scores = {}
+        for term in terms:
+            idf[term] = self._idf(term)
+            for doc_id, count in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf[term] * count * (self.k1 + 1) / (count + norm)
+
+        query_weight = sum(idf.values())
+        best, best_key = None, None
+        for doc_id, score in scores.items():
+            doc = self.docs[doc_id]
+            if doc['tier'] not in ('any', tier) or language not in doc['languages']:
+                continue
+            if doc['boards'] and board not in doc['boards']:
+                continue
+            confidence = max((self._coverage(terms, question, idf, query_weight) for question in doc['questions']),
+                             default=0.0)
+            # Prefer the answer written for this tier over a generic one at equal confidence and score
+            key = (confidence, round(score, 6), doc['tier'] == tier)
+            if best_key is None or key > best_key:
+                best, best_key = doc_id, key
+        if best is None:
+            return None, 0.0
+        return self.docs[best], round(best_key[0], 3)
+
+    def _coverage(self, terms, question, idf, query_weight):
+        """How well a query and one sample question cover each other, from 0 to 1"""
+        if not question:
+            return 0.0
+        for term in question:
+            if term not in idf:
+                idf[term] = self._idf(term)
+        shared = sum(idf[term] for term in question if term in terms)
+        return min(shared / query_weight, shared / sum(idf[term] for term in question))
+
+    def lookup(self, query, student_info, demo=False):
+        """Return a ready-to-send answer, or None when the match isn't confident.
+
+        In demo mode any match will do and the generic fallback covers the rest.
+        """
+        started = time.perf_counter()
+        doc, confidence = self.search(query, student_info)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        if demo:
+            answer = render(doc['answer'] if doc else self.fallback, student_info)
+        elif doc is not None and not doc['demo_only'] and confidence >= self.min_confidence:
+            answer = render(doc['answer'], student_info)
+        else:
+            answer = None
+
+        with self._lock:
+            self.lookups += 1
+            self.total_lookup_ms += elapsed
+            if not demo:
+                self.queries += 1
+                if answer is not None:
+                    self.served += 1
+            elif doc is not None:
+                self.demo_served += 1
+        return answer
+
+    def stats(self):
+        """Return index size, build/lookup timings and the share of queries answered locally"""
+        with self._lock:
+            return {
+                'answers': len(self.docs),
+                'terms': len(self.postings),
+                'build_ms': self.build_ms,
+                'load_ms': self.load_ms,
+                'min_confidence': self.min_confidence,
+                'lookups': self.lookups,
+                'avg_lookup_ms': round(self.total_lookup_ms / self.lookups, 3) if self.lookups else 0.0,
+                'served_locally': self.served,
+                'demo_matches': self.demo_served,
+                'local_share': round(self.served / self.queries, 4) if self.queries else 0.0,
+            }
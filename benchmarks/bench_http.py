@@ -0,0 +1,265 @@
+"""Benchmark bytes on the wire and page-load time, with and without the HTTP-layer tuning.
+
+Each configuration runs the app in a fresh process against the fake completion
+server:
+- before: no compression, plain static files, no keep-alive (a new connection per request)
+- after: gzip/brotli, hashed long-cached static URLs with ETag/304, keep-alive
+
+The app is served by gunicorn with gunicorn.conf.py (one worker), since the
+Werkzeug dev server closes every connection.
+
+A scripted browser then makes two visits. The first loads the page and its
+local assets, asks a question and streams another answer. The repeat visit
+does the same with the browser cache from the first: it skips fresh assets and
+revalidates the rest with If-None-Match. Each visit reports:
+- the bytes received, headers included
+- requests and new connections
+- local wall time
+- modeled load time on slow links: one round trip per new connection and per
+  request, plus the bytes over the link's bandwidth
+
+    python benchmarks/bench_http.py
+    python benchmarks/bench_http.py --encoding gzip --json http.json
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_openai import start_in_thread  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# (name, downlink kbit/s, round trip ms), roughly rural 2G/EDGE and 3G
+LINKS = (('2g', 240, 650), ('3g', 750, 300))
+
+CONFIGS = {
+    'before': {'COMPRESS': '0', 'STATIC_CACHE': '0', 'GUNICORN_KEEPALIVE': '0'},
+    'after': {'COMPRESS': '1', 'STATIC_CACHE': '1', 'GUNICORN_KEEPALIVE': '20'},
+}
+
+# A typical long Markdown answer, so the answer payloads are realistic
+ANSWER = (
+    "## Photosynthesis 🌿\n\n"
+    "**Photosynthesis** is the process green plants use to make their own food from sunlight.\n\n"
+    "### What the plant needs\n"
+    "- **Sunlight**, absorbed by chlorophyll in the leaves\n"
+    "- **Water**, taken up by the roots and carried to the leaves through the xylem\n"
+    "- **Carbon dioxide**, which enters the leaves through tiny pores called stomata\n\n"
+    "### What happens\n"
+    "1. Chlorophyll traps light energy.\n"
+    "2. The energy splits water into hydrogen and oxygen.\n"
+    "3. Hydrogen combines with carbon dioxide to form glucose.\n"
+    "4. Oxygen is released into the air through the stomata.\n\n"
+    "### The equation\n"
+    "6CO₂ + 6H₂O + light energy → C₆H₁₂O₆ + 6O₂\n\n"
+    "### Why it matters\n"
+    "- It makes the food that almost every living thing depends on.\n"
+    "- It releases the oxygen we breathe.\n"
+    "- It removes carbon dioxide from the air.\n\n"
+    "**Example:** A mango tree in sunlight makes glucose in its leaves and stores some of it as starch in "
+    "its fruit, which is why ripe mangoes taste sweet.\n\n"
+    "Would you like a diagram of a leaf cross-section or some practice questions? 😊"
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit('gunicorn exited before it started serving')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/healthz')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit('gunicorn did not start serving in time')
+
+
+class Browser:
+    """A tiny browser: one connection reused while the server allows it, plus a cache"""
+
+    def __init__(self, port, accept_encoding):
+        self.port = port
+        self.accept_encoding = accept_encoding
+        self.cache = {}  # url -> (etag, fresh until)
+        self.connection = None
+        self.reset()
+
+    def reset(self):
+        self.received = 0
+        self.requests = 0
+        self.connections = 0
+        self.not_modified = 0
+        self.skipped = 0
+
+    def fetch(self, method, url, body=None, cacheable=False):
+        cached = self.cache.get(url) if cacheable else None
+        if cached is not None and cached[1] > time.time():
+            self.skipped += 1
+            return None
+        headers = {'Accept-Encoding': self.accept_encoding}
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if cached is not None and cached[0]:
+            headers['If-None-Match'] = cached[0]
+
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            self.connections += 1
+        self.connection.request(method, url, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()  # http.client doesn't decode, so this is what went over the wire
+        self.requests += 1
+        self.received += len(data) + 17 + sum(len(key) + len(value) + 4 for key, value in response.getheaders())
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+
+        if response.status == 304:
+            self.not_modified += 1
+        elif cacheable:
+            cache_control = response.getheader('Cache-Control') or ''
+            max_age = re.search(r'max-age=(\d+)', cache_control)
+            fresh_until = time.time() + int(max_age.group(1)) if max_age else 0
+            self.cache[url] = (response.getheader('ETag'), fresh_until)
+        return response, data
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def decode(data, encoding):
+    if encoding == 'gzip':
+        import gzip
+        return gzip.decompress(data)
+    if encoding == 'br':
+        import brotli
+        return brotli.decompress(data)
+    return data
+
+
+def page_assets(html):
+    """Local scripts and stylesheets referenced by the page"""
+    return [url for url in re.findall(r'(?:src|href)="(/[^"]+)"', html) if not url.startswith('//')]
+
+
+def visit(browser, question):
+    """Load the page and its assets, ask a question, then stream another answer"""
+    started = time.perf_counter()
+    page = browser.fetch('GET', '/', cacheable=True)
+    assets = getattr(browser, 'assets', [])
+    if page is not None and page[0].status == 200:
+        assets = browser.assets = page_assets(decode(page[1], page[0].getheader('Content-Encoding')).decode('utf-8'))
+    for url in assets:
+        browser.fetch('GET', url, cacheable=True)
+    page_ms = (time.perf_counter() - started) * 1000
+    page_bytes = browser.received
+
+    answer = browser.fetch('POST', '/api/query/text', {'session_id': 'bench-http', 'query': question})
+    answer_bytes = browser.received - page_bytes
+    browser.fetch('POST', '/api/query/text/stream', {'session_id': 'bench-http', 'query': f'{question} (again)'})
+    stream_bytes = browser.received - page_bytes - answer_bytes
+    if not json.loads(decode(answer[1], answer[0].getheader('Content-Encoding'))).get('success'):
+        print('Warning: the question failed')
+
+    return {
+        'page_bytes': page_bytes,
+        'answer_bytes': answer_bytes,
+        'stream_bytes': stream_bytes,
+        'total_bytes': browser.received,
+        'requests': browser.requests,
+        'connections': browser.connections,
+        'not_modified': browser.not_modified,
+        'cache_skipped': browser.skipped,
+        'page_wall_ms': round(page_ms, 1),
+        'modeled_ms': {
+            name: round((browser.connections + browser.requests) * rtt + browser.received * 8 / kbps, 1)
+            for name, kbps, rtt in LINKS
+        },
+    }
+
+
+def run_config(name, upstream_url, encoding):
+    port = free_port()
+    env = dict(os.environ, OPENAI_API_KEY='bench-http', OPENAI_BASE_URL=upstream_url, WARM_UP='none',
+               BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY='1', SESSION_RATE='0',
+               SESSION_MAX_IN_FLIGHT='0', **CONFIGS[name])
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    try:
+        wait_ready(port, process)
+
+        browser = Browser(port, encoding)
+        browser.fetch('POST', '/api/student/register', {'session_id': 'bench-http', 'class': 'Class 8', 'board': 'CBSE'})
+        browser.close()
+        browser.reset()
+        first = visit(browser, 'Explain photosynthesis with an example')
+        browser.close()
+        browser.reset()
+        repeat = visit(browser, 'Explain photosynthesis in simple words')
+        browser.close()
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {'first': first, 'repeat': repeat}
+
+
+def show(results):
+    link_names = [name for name, _, _ in LINKS]
+    print(f"{'config':<8}{'visit':<8}{'page B':>9}{'answer B':>10}{'stream B':>10}{'total B':>9}{'req':>5}{'conn':>6}"
+          + ''.join(f"{name + ' ms':>10}" for name in link_names))
+    for config, visits in results.items():
+        for name, row in visits.items():
+            print(f"{config:<8}{name:<8}{row['page_bytes']:>9}{row['answer_bytes']:>10}{row['stream_bytes']:>10}"
+                  f"{row['total_bytes']:>9}{row['requests']:>5}{row['connections']:>6}"
+                  + ''.join(f"{row['modeled_ms'][link]:>10.0f}" for link in link_names))
+
+    if 'before' in results and 'after' in results:
+        print()
+        for name in ('first', 'repeat'):
+            before, after = results['before'][name], results['after'][name]
+            saved = 1 - after['total_bytes'] / before['total_bytes']
+            times = ', '.join(f"{link} {before['modeled_ms'][link]:.0f} → {after['modeled_ms'][link]:.0f} ms"
+                              for link in link_names)
+            print(f"{name} visit: {saved:.0%} fewer bytes; {times}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark EduMentor AI bytes on the wire and page-load time')
+    parser.add_argument('--config', choices=sorted(CONFIGS), action='append', help='default: before and after')
+    parser.add_argument('--encoding', default='gzip, deflate, br', help='Accept-Encoding sent by the browser')
+    parser.add_argument('--token-delay', type=float, default=0.002)
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    upstream, upstream_url = start_in_thread(latency=0.0, token_delay=args.token_delay, answer=ANSWER)
+    results = {name: run_config(name, upstream_url, args.encoding) for name in (args.config or ['before', 'after'])}
+    upstream.shutdown()
+
+    show(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
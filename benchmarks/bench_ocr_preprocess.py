@@ -0,0 +1,183 @@
+"""Benchmark OCR preprocessing: time per stage and OCR accuracy.
+
+Compares the original preprocessing (median filter, fixed contrast boost,
+threshold at 140, full resolution) with the configurable NumPy pipeline on a
+fixed, seeded set of synthetic 12MP homework photos. Real samples can be added
+with --images DIR, where each photo.jpg has its transcript in photo.txt.
+
+    python benchmarks/bench_ocr_preprocess.py
+    python benchmarks/bench_ocr_preprocess.py --images samples/ --stages downscale,threshold
+"""
+import argparse
+import difflib
+import glob
+import io
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_preprocess import PreprocessPipeline  # noqa: E402
+
+SAMPLE_TEXTS = [
+    "Homework for Monday\nMaths: Exercise 4.2 questions 1 to 5\nScience: Draw the parts of a flower\nEnglish: Write a paragraph on my school",
+    "Q1. What is photosynthesis?\nQ2. Name the gas released by plants.\nQ3. Why are leaves green?",
+    "Solve for x:\n2x + 5 = 15\n3x - 7 = 11\nx / 4 = 6",
+    "Social Studies\nList the states of South India\nWhat is the capital of Telangana?\nWrite two lines about the Godavari river",
+]
+
+FONT_PATHS = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/Library/Fonts/Arial.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+]
+
+
+def load_font(size):
+    for path in FONT_PATHS:
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    return ImageFont.load_default()
+
+
+def make_sample(text, seed, size=(4032, 3024)):
+    """Render text as a skewed, unevenly lit, noisy 12MP phone photo (JPEG bytes)"""
+    rng = np.random.default_rng(seed)
+    page = Image.new('L', (2400, 1800), 235)
+    draw = ImageDraw.Draw(page)
+    font = load_font(64)
+    y = 160
+    for line in text.split('\n'):
+        draw.text((180, y), line, fill=40, font=font)
+        y += 130
+
+    angle = float(rng.uniform(-6, 6))
+    page = page.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=235)
+    page = page.resize((int(page.width * 1.6), int(page.height * 1.6)), Image.Resampling.BICUBIC)
+
+    photo = Image.new('L', size, 90)  # desk around the page
+    photo.paste(page, ((size[0] - page.width) // 2, (size[1] - page.height) // 2))
+
+    pixels = np.asarray(photo, dtype=np.float32)
+    # Lamp on one side: brightness falls off across the page
+    gradient = np.linspace(1.0, 0.6, size[0], dtype=np.float32)[None, :]
+    pixels = pixels * gradient + rng.normal(0, 8, pixels.shape).astype(np.float32)
+    photo = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    buffer = io.BytesIO()
+    photo.convert('RGB').save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def legacy_preprocess(image_bytes):
+    """The original process_image_query preprocessing, for comparison"""
+    timings = {}
+    started = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes)).convert("L")
+    timings['decode'] = elapsed_ms(started)
+
+    started = time.perf_counter()
+    image = image.filter(ImageFilter.MedianFilter())
+    timings['median'] = elapsed_ms(started)
+
+    started = time.perf_counter()
+    image = ImageEnhance.Contrast(image).enhance(2.5)
+    timings['contrast'] = elapsed_ms(started)
+
+    started = time.perf_counter()
+    image = image.point(lambda x: 0 if x < 140 else 255)
+    timings['threshold'] = elapsed_ms(started)
+    return image, timings
+
+
+def elapsed_ms(started):
+    return (time.perf_counter() - started) * 1000
+
+
+def accuracy(expected, actual):
+    """Character-level similarity of two transcripts, ignoring layout whitespace"""
+    expected = ' '.join(expected.split()).lower()
+    actual = ' '.join(actual.split()).lower()
+    if not expected:
+        return 1.0 if not actual else 0.0
+    return difflib.SequenceMatcher(None, expected, actual, autojunk=False).ratio()
+
+
+def load_samples(images_dir, count):
+    samples = []
+    for index in range(count):
+        text = SAMPLE_TEXTS[index % len(SAMPLE_TEXTS)]
+        samples.append((f'synthetic-{index}', make_sample(text, seed=index), text))
+    if images_dir:
+        for path in sorted(glob.glob(os.path.join(images_dir, '*'))):
+            stem, ext = os.path.splitext(path)
+            if ext.lower() not in ('.jpg', '.jpeg', '.png') or not os.path.exists(stem + '.txt'):
+                continue
+            with open(path, 'rb') as f, open(stem + '.txt', encoding='utf-8') as t:
+                samples.append((os.path.basename(path), f.read(), t.read()))
+    return samples
+
+
+def run(name, preprocess, samples, use_ocr, repeat):
+    import pytesseract
+
+    stage_totals = {}
+    ocr_total = 0.0
+    scores = []
+    for _, image_bytes, expected in samples:
+        for _ in range(repeat):
+            image, timings = preprocess(image_bytes)
+            for stage, ms in timings.items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + ms
+        if use_ocr:
+            started = time.perf_counter()
+            text = pytesseract.image_to_string(image, config=r'--oem 3 --psm 6')
+            ocr_total += elapsed_ms(started)
+            scores.append(accuracy(expected, text))
+
+    runs = len(samples) * repeat
+    print(f"\n== {name} ==")
+    for stage, total in stage_totals.items():
+        print(f"  {stage:<12} {total / runs:9.1f} ms")
+    print(f"  {'preprocess':<12} {sum(stage_totals.values()) / runs:9.1f} ms total")
+    if use_ocr:
+        print(f"  {'tesseract':<12} {ocr_total / len(samples):9.1f} ms")
+        print(f"  {'accuracy':<12} {100 * sum(scores) / len(scores):9.1f} %")
+    print(f"  output size  {image.width}x{image.height} (last sample)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', help='directory of extra photo.jpg + photo.txt samples')
+    parser.add_argument('--count', type=int, default=4, help='number of synthetic samples')
+    parser.add_argument('--repeat', type=int, default=3, help='preprocessing runs per sample')
+    parser.add_argument('--stages', help='comma-separated pipeline stages (default: OCR_PIPELINE or built-in)')
+    parser.add_argument('--threshold', choices=['adaptive', 'otsu'], help='thresholding method')
+    parser.add_argument('--no-ocr', action='store_true', help='time preprocessing only')
+    args = parser.parse_args()
+
+    pipeline = PreprocessPipeline.from_env()
+    if args.stages:
+        pipeline.stages = tuple(s.strip() for s in args.stages.split(',') if s.strip())
+    if args.threshold:
+        pipeline.threshold = args.threshold
+
+    use_ocr = not args.no_ocr and shutil.which('tesseract') is not None
+    if not use_ocr and not args.no_ocr:
+        print("tesseract not found on PATH; reporting preprocessing time only")
+
+    samples = load_samples(args.images, args.count)
+    print(f"{len(samples)} samples, pipeline stages: {','.join(pipeline.stages)} "
+          f"(threshold={pipeline.threshold}, max edge {pipeline.max_edge}px)")
+
+    run('legacy (median + contrast + threshold 140)', legacy_preprocess, samples, use_ocr, args.repeat)
+    run('pipeline', pipeline.run, samples, use_ocr, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
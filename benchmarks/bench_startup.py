@@ -0,0 +1,145 @@
+"""Benchmark cold start: import time, time until serving, and the first text answer.
+
+Each run starts a fresh interpreter that imports main.py, calls create_app()
+and serves on a free port against the fake completion server. The harness
+times:
+- import_ms: importing main.py
+- ready_ms: process start until the port is open
+- first_answer_ms: the first (uncached) text query
+
+It also checks that importing main.py leaves the image, voice and OpenAI
+libraries unloaded. The exit status is 1 when the median import time is over
+--budget-ms or a heavy module is loaded eagerly, so the script can gate CI.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --warm-up none --budget-ms 400
+    python benchmarks/bench_startup.py --importtime   # slowest imports, from python -X importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_openai import start_in_thread  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Only image and voice requests (or the first upstream call) should pay for these
+HEAVY_MODULES = ('openai', 'httpx', 'numpy', 'PIL', 'pytesseract', 'speech_recognition', 'vosk', 'voice_stream',
+                 'image_preprocess')
+
+CHILD = """
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+os.chdir({root!r})
+import main
+import_ms = (time.perf_counter() - started) * 1000
+loaded = [name for name in {heavy!r} if name in sys.modules]
+app = main.create_app(warm={warm!r})
+from werkzeug.serving import make_server
+server = make_server('127.0.0.1', 0, app, threaded=True)
+print(json.dumps({{'import_ms': import_ms, 'loaded': loaded, 'port': server.server_port}}), flush=True)
+sys.stdout = open(os.devnull, 'w')
+server.serve_forever()
+"""
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, json.dumps(payload).encode('utf-8'), {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.loads(response.read())
+
+
+def run_once(upstream_url, warm_up, warm):
+    env = dict(os.environ, OPENAI_API_KEY='bench-startup', OPENAI_BASE_URL=upstream_url, WARM_UP=warm_up)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', CHILD.format(root=ROOT, heavy=HEAVY_MODULES, warm=warm)],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env, text=True)
+    try:
+        for line in process.stdout:
+            if line.startswith('{'):
+                child = json.loads(line)
+                break
+        else:
+            raise SystemExit('The app process exited before it started serving')
+        ready_ms = (time.perf_counter() - started) * 1000
+
+        base = f"http://127.0.0.1:{child['port']}"
+        post(f'{base}/api/student/register', {'session_id': 'startup', 'class': 'Class 8', 'board': 'CBSE'})
+        asked = time.perf_counter()
+        answer = post(f'{base}/api/query/text', {'session_id': 'startup', 'query': 'Explain gravity with an example'})
+        first_answer_ms = (time.perf_counter() - asked) * 1000
+        if not answer.get('success'):
+            print(f"First query failed: {answer.get('error')}")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    return {
+        'import_ms': child['import_ms'],
+        'ready_ms': ready_ms,
+        'first_answer_ms': first_answer_ms,
+        'loaded': child['loaded'],
+    }
+
+
+def show_importtime(limit):
+    """Print the slowest cumulative imports under main"""
+    env = dict(os.environ, OPENAI_API_KEY='bench-startup')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:limit]:
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark EduMentor AI cold start')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warm-up', default='text', help='WARM_UP for the app: text, image, voice, all or none')
+    parser.add_argument('--no-warm', action='store_true', help='call create_app(warm=False): load everything on first use')
+    parser.add_argument('--budget-ms', type=float, default=600.0, help='maximum median import time of main.py')
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest imports')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    upstream, upstream_url = start_in_thread(latency=0.0)
+    runs = [run_once(upstream_url, args.warm_up, not args.no_warm) for _ in range(args.runs)]
+    upstream.shutdown()
+
+    print(f"{'run':>4}{'import ms':>12}{'ready ms':>12}{'first answer ms':>18}")
+    for index, run in enumerate(runs, 1):
+        print(f"{index:>4}{run['import_ms']:>12.1f}{run['ready_ms']:>12.1f}{run['first_answer_ms']:>18.1f}")
+    medians = {key: statistics.median(run[key] for run in runs) for key in ('import_ms', 'ready_ms', 'first_answer_ms')}
+    print(f"{'med':>4}{medians['import_ms']:>12.1f}{medians['ready_ms']:>12.1f}{medians['first_answer_ms']:>18.1f}")
+
+    if args.importtime:
+        show_importtime(args.limit)
+
+    failures = []
+    loaded = sorted({name for run in runs for name in run['loaded']})
+    if loaded:
+        failures.append(f"importing main.py loaded {', '.join(loaded)}")
+    if medians['import_ms'] > args.budget_ms:
+        failures.append(f"median import {medians['import_ms']:.0f}ms is over the {args.budget_ms:.0f}ms budget")
+    if failures:
+        print('\nFAIL: ' + '; '.join(failures))
+        sys.exit(1)
+    print(f"\nOK: import within {args.budget_ms:.0f}ms, no heavy modules loaded at import")
+
+
+if __name__ == '__main__':
+    main()
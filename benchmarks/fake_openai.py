@@ -0,0 +1,166 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Serves POST /v1/chat/completions (plain and streamed) with configurable
+latency and injected 429/500 errors, so the upstream client can be exercised
+offline:
+
+    python benchmarks/fake_openai.py --port 8089 --latency 0.5 --error-rate 0.1
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python main.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = (
+    "**Photosynthesis** is how plants make their own food using sunlight. 🌿\n\n"
+    "- Leaves absorb sunlight with chlorophyll\n"
+    "- Roots bring water and leaves take in carbon dioxide\n"
+    "- The plant makes glucose and releases oxygen\n\n"
+    "Would you like to know more about this?"
+)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        config = self.server.config
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        with self.server.lock:
+            self.server.requests += 1
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+        if random.random() < config.error_rate:
+            if random.random() < 0.5:
+                return self._send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_error'}},
+                                       headers={'Retry-After': str(config.retry_after)})
+            return self._send_json(500, {'error': {'message': 'Injected server error', 'type': 'server_error'}})
+
+        time.sleep(config.latency + random.uniform(0, config.jitter))
+
+        answer = config.answer
+        model = body.get('model', 'gpt-3.5-turbo')
+        if body.get('stream'):
+            return self._send_stream(answer, model, config.token_delay)
+
+        # Rough token counts (~4 characters per token) so prompt-size changes show up
+        prompt_tokens = sum(len(m.get('content') or '') for m in body.get('messages', [])) // 4
+        completion_tokens = len(answer) // 4
+        self._send_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': answer},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, answer, model, token_delay):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:12]}'
+        tokens = [word + ' ' for word in answer.split(' ')]
+        for token in tokens:
+            self._write_chunk(completion_id, model, {'content': token}, None)
+            if token_delay:
+                time.sleep(token_delay)
+        self._write_chunk(completion_id, model, {}, 'stop')
+        self._write_raw(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, completion_id, model, delta, finish_reason):
+        payload = {
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+        }
+        self._write_raw(f'data: {json.dumps(payload)}\n\n'.encode('utf-8'))
+
+    def _write_raw(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+
+def make_server(host='127.0.0.1', port=0, latency=0.2, jitter=0.0, token_delay=0.0,
+                error_rate=0.0, retry_after=0.1, answer=DEFAULT_ANSWER):
+    """Create (but don't start) a fake completion server; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.config = argparse.Namespace(
+        latency=latency,
+        jitter=jitter,
+        token_delay=token_delay,
+        error_rate=error_rate,
+        retry_after=retry_after,
+        answer=answer
+    )
+    server.lock = threading.Lock()
+    server.requests = 0
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start a fake server in a daemon thread and return (server, base_url)"""
+    server = make_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f'http://{host}:{port}/v1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake OpenAI chat completions server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds before the first byte')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, seconds')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='seconds between streamed tokens')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 429/500')
+    parser.add_argument('--retry-after', type=float, default=0.1, help='Retry-After sent with 429s')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.jitter, args.token_delay,
+                         args.error_rate, args.retry_after)
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
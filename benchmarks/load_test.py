@@ -0,0 +1,483 @@
+"""Load test: replay a mixed text/image/voice workload against the app, offline.
+
+Starts the fake completion server and the Flask app in this process. The app
+is served over real HTTP by werkzeug's threaded server, so every request goes
+through the socket, parsing and serialization paths. The harness then replays
+each workload at a fixed concurrency and reports, per endpoint:
+- p50/p95/p99 latency (and time to first byte for streams)
+- throughput
+- errors
+- peak RSS of the process
+
+Questions come from data/answers.json, generated variants that miss the local
+index, and any JSONL file given with --requests. Each line of that file needs
+"query", "title" or "body"; an optional "endpoint" key selects a workload.
+Images are rendered worksheets and voice clips are synthetic WAVs. A fake
+recognizer stands in for Google speech, so the run needs no network. OCR
+still needs the tesseract binary.
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --workloads text,text_stream --concurrency 32 --requests requests.jsonl
+    python benchmarks/load_test.py --latency 0.8 --token-delay 0.01 --error-rate 0.05 --mixed
+    python benchmarks/load_test.py --json results.json
+    python benchmarks/load_test.py --baseline results.json --max-regression 0.15   # exit 1 on regression
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import wave
+from urllib.parse import urlsplit
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ocr_preprocess import SAMPLE_TEXTS, load_font  # noqa: E402
+from fake_openai import start_in_thread  # noqa: E402
+
+WORKLOADS = ('text', 'text_stream', 'batch', 'image', 'voice')
+
+PROFILES = [
+    {'class': 'Class 4', 'board': 'CBSE', 'language': 'English'},
+    {'class': 'Class 7', 'board': 'ICSE', 'language': 'English'},
+    {'class': 'Class 9', 'board': 'State Board', 'language': 'Hindi + English'},
+    {'class': 'Class 12', 'board': 'CBSE', 'language': 'English'},
+    {'class': 'Undergraduate', 'board': '', 'language': 'Telugu + English'},
+]
+
+TOPICS = [
+    'the water cycle', 'photosynthesis', "Newton's second law", 'equivalent fractions', 'the French Revolution',
+    'acids and bases', 'the parts of a cell', 'simple interest', 'the solar system', 'democracy in India',
+    'Ohm\'s law', 'the Pythagoras theorem', 'food chains', 'the monsoon', 'prime numbers',
+]
+
+TEMPLATES = [
+    'Explain {topic} with an example',
+    'Can you help me understand {topic} for my exam tomorrow?',
+    'Give me three practice questions on {topic}',
+    'Why is {topic} important?',
+]
+
+
+class FakeRecognizer:
+    """Stands in for the speech service: waits like a network call, then returns a fixed transcript"""
+
+    name = 'fake'
+
+    def __init__(self, latency=0.3, transcript='What is photosynthesis?'):
+        self.latency = latency
+        self.transcript = transcript
+
+    def recognize(self, pcm, sample_rate):
+        time.sleep(self.latency)
+        return self.transcript
+
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # No /proc (macOS): fall back to the lifetime peak
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RssSampler:
+    """Track the peak RSS while a phase runs"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+
+def percentile(sorted_values, share):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(share * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def load_questions(path):
+    """Questions from data/answers.json plus generated ones the local index won't answer"""
+    questions = []
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for entry in json.load(f)['answers']:
+                if not entry.get('demo_only'):
+                    questions.extend(entry.get('questions', []))
+    questions.extend(template.format(topic=topic) for template in TEMPLATES for topic in TOPICS)
+    return questions
+
+
+def load_requests(path):
+    """Replay items from a JSONL file as (workload, query) pairs"""
+    items = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            query = record.get('query') or record.get('title') or record.get('body')
+            if query:
+                items.append((record.get('endpoint', 'text'), query[:2000]))
+    return items
+
+
+def make_image(text, seed, size=(1600, 1200)):
+    """A photographed-worksheet-sized JPEG of the given text"""
+    rng = np.random.default_rng(seed)
+    page = Image.new('L', size, 235)
+    draw = ImageDraw.Draw(page)
+    font = load_font(42)
+    y = 120
+    for line in text.split('\n'):
+        draw.text((120, y), line, fill=40, font=font)
+        y += 90
+    noise = rng.normal(0, 6, (size[1], size[0]))
+    page = Image.fromarray(np.clip(np.asarray(page, dtype=np.float32) + noise, 0, 255).astype(np.uint8))
+    buffer = io.BytesIO()
+    page.convert('RGB').save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def make_wav(seconds, seed, rate=48000):
+    """A voice-like clip: harmonic tone bursts over background noise, 16-bit mono WAV"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 110 + 60 * rng.random()
+    voice = sum(np.sin(2 * np.pi * pitch * h * t) / h for h in range(1, 6))
+    envelope = (np.sin(2 * np.pi * 2.5 * t) > -0.2).astype(np.float32)
+    samples = 0.25 * voice * envelope + rng.normal(0, 0.01, t.size)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+class Client:
+    """One keep-alive HTTP connection per worker thread"""
+
+    def __init__(self, base_url, timeout=120):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """Return (status, body bytes, seconds to first byte)"""
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            started = time.perf_counter()
+            try:
+                self.conn.request(method, path, body=body, headers=headers or {})
+                response = self.conn.getresponse()
+                first = response.read(1)
+                ttfb = time.perf_counter() - started
+                data = first + response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response.status, data, ttfb
+            except (http.client.HTTPException, ConnectionError):
+                # Stale keep-alive connection: reconnect once
+                self.close()
+                if attempt:
+                    raise
+
+    def post_json(self, path, payload):
+        return self.request('POST', path, json.dumps(payload).encode('utf-8'),
+                            {'Content-Type': 'application/json'})
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def build_jobs(workload, count, sessions, questions, fixtures, replay, seed):
+    """Requests for one workload as (workload, method, path, body, headers)"""
+    rng = random.Random(seed)
+    replayed = [query for kind, query in replay if kind == workload] or questions
+    pool = replayed + questions if workload in ('text', 'text_stream') else questions
+    jobs = []
+    for index in range(count):
+        session_id = sessions[index % len(sessions)]
+        if workload == 'text':
+            payload = {'session_id': session_id, 'query': rng.choice(pool)}
+            jobs.append((workload, 'POST', '/api/query/text', json.dumps(payload).encode('utf-8'),
+                         {'Content-Type': 'application/json'}))
+        elif workload == 'text_stream':
+            payload = {'session_id': session_id, 'query': rng.choice(pool)}
+            jobs.append((workload, 'POST', '/api/query/text/stream', json.dumps(payload).encode('utf-8'),
+                         {'Content-Type': 'application/json'}))
+        elif workload == 'batch':
+            payload = {'session_id': session_id, 'queries': rng.sample(pool, min(10, len(pool)))}
+            jobs.append((workload, 'POST', '/api/query/batch', json.dumps(payload).encode('utf-8'),
+                         {'Content-Type': 'application/json'}))
+        elif workload == 'image':
+            jobs.append((workload, 'POST', f'/api/query/image/upload?session_id={session_id}',
+                         rng.choice(fixtures['image']), {'Content-Type': 'image/jpeg'}))
+        elif workload == 'voice':
+            jobs.append((workload, 'POST', f'/api/query/voice/upload?session_id={session_id}',
+                         rng.choice(fixtures['voice']), {'Content-Type': 'audio/wav'}))
+        else:
+            raise ValueError(f'Unknown workload {workload!r}; choose from {", ".join(WORKLOADS)}')
+    return jobs
+
+
+def run_phase(base_url, jobs, concurrency):
+    """Send jobs from `concurrency` threads; return per-workload samples and the phase duration"""
+    samples = {}
+    lock = threading.Lock()
+    source = iter(jobs)
+
+    def worker():
+        client = Client(base_url)
+        while True:
+            with lock:
+                job = next(source, None)
+            if job is None:
+                break
+            workload, method, path, body, headers = job
+            started = time.perf_counter()
+            try:
+                status, data, ttfb = client.request(method, path, body, headers)
+                # Streams always answer 200; failures arrive as an error event
+                ok = (status == 200 and b'event: error' not in data
+                      and b'"success": false' not in data and b'"success":false' not in data)
+            except Exception:
+                status, ok, ttfb = 0, False, None
+                client.close()
+            elapsed = time.perf_counter() - started
+            with lock:
+                entry = samples.setdefault(workload, {'latency': [], 'ttfb': [], 'errors': 0, 'statuses': {}})
+                entry['latency'].append(elapsed)
+                if ttfb is not None and 'stream' in path:
+                    entry['ttfb'].append(ttfb)
+                entry['errors'] += 0 if ok else 1
+                entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+        client.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, duration, peak_rss):
+    latency = sorted(samples['latency'])
+    ttfb = sorted(samples['ttfb'])
+    summary = {
+        'requests': len(latency),
+        'errors': samples['errors'],
+        'statuses': {str(status): count for status, count in sorted(samples['statuses'].items())},
+        'throughput_rps': round(len(latency) / duration, 2) if duration else 0.0,
+        'p50_ms': round(percentile(latency, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latency, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latency, 0.99) * 1000, 1),
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1),
+    }
+    if ttfb:
+        summary['ttfb_p50_ms'] = round(percentile(ttfb, 0.50) * 1000, 1)
+        summary['ttfb_p95_ms'] = round(percentile(ttfb, 0.95) * 1000, 1)
+    return summary
+
+
+def print_table(results):
+    header = f"{'phase/workload':<24}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb p50':>10}{'peak MB':>9}"
+    print(header)
+    print('-' * len(header))
+    for name, row in results.items():
+        ttfb = f"{row['ttfb_p50_ms']:.1f}" if 'ttfb_p50_ms' in row else '-'
+        print(f"{name:<24}{row['requests']:>7}{row['errors']:>6}{row['throughput_rps']:>9.2f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{ttfb:>10}{row['peak_rss_mb']:>9.1f}")
+
+
+def check_regressions(results, baseline_path, max_regression):
+    """Compare p95 latency and throughput against a saved run; return the list of regressions"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for name, row in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if before['p95_ms'] and row['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {row['p95_ms']} ms")
+        if before['throughput_rps'] and row['throughput_rps'] < before['throughput_rps'] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {row['throughput_rps']} rps")
+        if row['errors'] > before['errors'] and row['errors'] > row['requests'] * max_regression:
+            regressions.append(f"{name}: errors {before['errors']} -> {row['errors']}")
+    return regressions
+
+
+def start_app(args, upstream_url):
+    """Import the app against the fake upstream and serve it on a free port; return its base URL"""
+    os.environ['OPENAI_API_KEY'] = 'load-test'
+    os.environ['OPENAI_BASE_URL'] = upstream_url
+    if not args.rate_limits:
+        # A handful of sessions stand in for a whole school; don't throttle them per session
+        os.environ.setdefault('SESSION_RATE', '0')
+        os.environ.setdefault('SESSION_MAX_IN_FLIGHT', '0')
+    os.chdir(ROOT)
+
+    import main
+    from werkzeug.serving import make_server
+
+    if not args.real_recognizer:
+        main.voice_pipeline.recognizer = FakeRecognizer(args.recognizer_latency)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def register_sessions(base_url, count):
+    client = Client(base_url)
+    sessions = []
+    for index in range(count):
+        session_id = f'load-{os.getpid()}-{index}'
+        profile = dict(PROFILES[index % len(PROFILES)], session_id=session_id, name=f'Student {index}')
+        status, data, _ = client.post_json('/api/student/register', profile)
+        if status != 200:
+            raise SystemExit(f'Could not register a session ({status}): {data[:200]!r}')
+        sessions.append(session_id)
+    client.close()
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test for EduMentor AI')
+    parser.add_argument('--workloads', default='text,text_stream,batch,image,voice',
+                        help=f'comma-separated, from: {", ".join(WORKLOADS)}')
+    parser.add_argument('--requests-per-workload', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--sessions', type=int, default=25)
+    parser.add_argument('--mixed', action='store_true', help='also run all workloads interleaved in one phase')
+    parser.add_argument('--requests', help='JSONL file of questions to replay')
+    parser.add_argument('--url', help='test an already running server instead of starting one here '
+                                      '(peak RSS is then the client\'s)')
+    parser.add_argument('--latency', type=float, default=0.3, help='fake upstream seconds before the first byte')
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--token-delay', type=float, default=0.005, help='seconds between streamed tokens')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--recognizer-latency', type=float, default=0.3)
+    parser.add_argument('--rate-limits', action='store_true', help='keep per-session rate limits on')
+    parser.add_argument('--real-recognizer', action='store_true', help='use VOICE_RECOGNIZER instead of the fake one')
+    parser.add_argument('--verbose', action='store_true', help='show the app\'s own log lines')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.15)
+    args = parser.parse_args()
+
+    workloads = [name.strip() for name in args.workloads.split(',') if name.strip()]
+    for name in workloads:
+        if name not in WORKLOADS:
+            parser.error(f'unknown workload {name!r}')
+
+    questions = load_questions(os.path.join(ROOT, 'data', 'answers.json'))
+    replay = load_requests(args.requests) if args.requests else []
+    fixtures = {
+        'image': [make_image(text, seed) for seed, text in enumerate(SAMPLE_TEXTS)] if 'image' in workloads else [],
+        'voice': [make_wav(seconds, seed) for seed, seconds in enumerate((1.5, 3.0, 5.0))] if 'voice' in workloads else [],
+    }
+
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        upstream, upstream_url = start_in_thread(latency=args.latency, jitter=args.jitter,
+                                                 token_delay=args.token_delay, error_rate=args.error_rate)
+        base_url = start_app(args, upstream_url)
+    sessions = register_sessions(base_url, args.sessions)
+    print(f"Load test against {base_url}: {len(sessions)} sessions, concurrency {args.concurrency}, "
+          f"{len(questions)} questions + {len(replay)} replayed")
+
+    phases = [(name, build_jobs(name, args.requests_per_workload, sessions, questions, fixtures, replay,
+                                args.seed + index))
+              for index, name in enumerate(workloads)]
+    if args.mixed:
+        mixed = list(itertools.chain.from_iterable(jobs for _, jobs in phases))
+        random.Random(args.seed).shuffle(mixed)
+        phases.append(('mixed', mixed))
+
+    results = {}
+    for phase, jobs in phases:
+        print(f"Running {phase}: {len(jobs)} requests")
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet, RssSampler() as rss:
+            samples, duration = run_phase(base_url, jobs, args.concurrency)
+        for workload, entry in sorted(samples.items()):
+            name = workload if phase != 'mixed' else f'mixed/{workload}'
+            results[name] = summarize(entry, duration, rss.peak)
+        if phase == 'mixed':
+            combined = {'latency': [], 'ttfb': [], 'errors': 0, 'statuses': {}}
+            for entry in samples.values():
+                combined['latency'].extend(entry['latency'])
+                combined['ttfb'].extend(entry['ttfb'])
+                combined['errors'] += entry['errors']
+                for status, count in entry['statuses'].items():
+                    combined['statuses'][status] = combined['statuses'].get(status, 0) + count
+            results['mixed'] = summarize(combined, duration, rss.peak)
+
+    print()
+    print_table(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.baseline:
+        regressions = check_regressions(results, args.baseline, args.max_regression)
+        if regressions:
+            print(f"\nRegressions beyond {args.max_regression:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.max_regression:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
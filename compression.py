@@ -0,0 +1,190 @@
+import gzip
+import os
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only text compresses well; images and audio are already compressed
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/')
+
+
+def parse_accept_encoding(header):
+    """{coding: q} from an Accept-Encoding header"""
+    codings = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def compress_bytes(data, coding, gzip_level=6, brotli_quality=5):
+    if coding == 'br':
+        return brotli.compress(data, quality=brotli_quality, mode=brotli.MODE_TEXT)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+class _StreamEncoder:
+    """Compresses a response chunk by chunk, flushing after each so SSE events aren't held back"""
+
+    def __init__(self, coding, gzip_level, brotli_quality):
+        self.coding = coding
+        if coding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality, mode=brotli.MODE_TEXT)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data):
+        if self.coding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.coding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class Compressor:
+    """Negotiated gzip/brotli compression for JSON, HTML and streamed answers.
+
+    Buffered responses are compressed when they're at least min_bytes. Server-
+    Sent Event streams are compressed as they go, with a flush after every
+    event. Because one compressor spans the whole stream, the repeated event
+    framing costs almost nothing after the first few tokens. Brotli is used
+    when the client accepts it and the brotli package is installed; otherwise
+    gzip is used.
+    """
+
+    def __init__(self, enabled=True, min_bytes=1024, gzip_level=6, brotli_quality=5, streams=True):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.streams = streams
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.streamed = 0
+        self.skipped_small = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.by_coding = {}
+
+    @classmethod
+    def from_env(cls):
+        """Build a compressor from COMPRESS_* environment variables"""
+        return cls(
+            enabled=os.getenv('COMPRESS', '1') != '0',
+            min_bytes=int(os.getenv('COMPRESS_MIN_BYTES', '1024')),
+            gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+            brotli_quality=int(os.getenv('COMPRESS_BROTLI_QUALITY', '5')),
+            streams=os.getenv('COMPRESS_STREAMS', '1') != '0',
+        )
+
+    @property
+    def codings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def negotiate(self, accept_encoding):
+        """The coding to use for a request's Accept-Encoding, or None"""
+        accepted = parse_accept_encoding(accept_encoding)
+        for coding in self.codings:
+            q = accepted.get(coding, accepted.get('*', 0.0))
+            if q > 0:
+                return coding
+        return None
+
+    def encode(self, data, coding):
+        """Compress a whole body (also used for static files ahead of time)"""
+        return compress_bytes(data, coding, self.gzip_level, self.brotli_quality)
+
+    def compress_response(self, response, accept_encoding):
+        """Compress a Flask response in place when it's worth it; returns the response"""
+        response.vary.add('Accept-Encoding')
+        if (not self.enabled or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers or response.direct_passthrough
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        coding = self.negotiate(accept_encoding)
+        if coding is None:
+            return response
+
+        if response.is_streamed:
+            if not self.streams or response.mimetype != 'text/event-stream':
+                return response
+            response.response = self._stream(response.response, coding)
+            response.headers.pop('Content-Length', None)
+            with self._lock:
+                self.streamed += 1
+        else:
+            data = response.get_data()
+            if len(data) < self.min_bytes:
+                with self._lock:
+                    self.skipped_small += 1
+                return response
+            compressed = self.encode(data, coding)
+            response.set_data(compressed)
+            self._count(coding, len(data), len(compressed))
+
+        response.headers['Content-Encoding'] = coding
+        # The bytes differ per coding, so the validator can only match weakly
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, chunks, coding):
+        encoder = _StreamEncoder(coding, self.gzip_level, self.brotli_quality)
+        size_in = size_out = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                out = encoder.chunk(chunk)
+                size_in += len(chunk)
+                size_out += len(out)
+                yield out
+            out = encoder.finish()
+            size_out += len(out)
+            yield out
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            self._count(coding, size_in, size_out)
+
+    def _count(self, coding, size_in, size_out):
+        with self._lock:
+            self.responses += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+            self.by_coding[coding] = self.by_coding.get(coding, 0) + 1
+
+    def stats(self):
+        """Return how many responses were compressed and the bytes saved"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'codings': list(self.codings),
+                'min_bytes': self.min_bytes,
+                'compressed': self.responses,
+                'streamed': self.streamed,
+                'skipped_small': self.skipped_small,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else 0.0,
+                'by_coding': dict(self.by_coding),
+            }
@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s')
+
+
+def truncate_tokens(text, max_tokens, counter):
+    """Cut text to roughly max_tokens, keeping the beginning"""
+    tokens = counter.count(text)
+    if tokens <= max_tokens:
+        return text
+    return text[:max(1, int(len(text) * max_tokens / tokens))].rstrip() + '…'
+
+
+def extractive_summary(summary, turns, max_tokens, counter):
+    """Fold evicted turns into the summary: each question plus the first sentence of its answer.
+
+    The oldest lines are dropped first when the summary outgrows its budget.
+    """
+    lines = [line for line in (summary or '').split('\n') if line]
+    question = None
+    for role, text in turns:
+        text = ' '.join(text.split())
+        if role == 'user':
+            question = text[:160]
+        else:
+            first = SENTENCE_RE.split(text.replace('*', ''), 1)[0][:200]
+            lines.append(f"- Asked: {question or '(earlier question)'} / Answered: {first}")
+            question = None
+    if question:
+        lines.append(f"- Asked: {question}")
+    while len(lines) > 1 and counter.count('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return truncate_tokens('\n'.join(lines), max_tokens, counter)
+
+
+class ConversationMemory:
+    """Per-session tutoring history under a hard token budget.
+
+    Recent turns are kept verbatim in a small ring. Turns pushed out of the
+    ring are folded into a rolling summary, so the history sent upstream stays
+    within max_tokens however long the session runs. State lives in a session
+    store (memory or SQLite) next to the student profiles. Updates run on a
+    single background thread, so they never delay an answer and a session's
+    turns are applied in order.
+    """
+
+    def __init__(self, store, counter, summarizer=None, max_tokens=1200, summary_tokens=300,
+                 max_turns=8, turn_tokens=300):
+        self.store = store
+        self.counter = counter
+        self.summarizer = summarizer
+        self.max_tokens = max_tokens
+        self.summary_tokens = min(summary_tokens, max_tokens // 2)
+        self.max_turns = max_turns
+        self.turn_tokens = turn_tokens
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='memory')
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.summaries = 0
+        self.summary_failures = 0
+        self.max_bytes = 0
+        self.total_bytes = 0
+        self.total_tokens = 0
+
+    @classmethod
+    def from_env(cls, store, counter, summarizer=None):
+        """Build memory from MEMORY_* environment variables; MEMORY_MAX_TOKENS=0 disables it"""
+        return cls(
+            store,
+            counter,
+            summarizer=summarizer,
+            max_tokens=int(os.getenv('MEMORY_MAX_TOKENS', '1200')),
+            summary_tokens=int(os.getenv('MEMORY_SUMMARY_TOKENS', '300')),
+            max_turns=int(os.getenv('MEMORY_MAX_TURNS', '8')),
+            turn_tokens=int(os.getenv('MEMORY_TURN_TOKENS', '300')),
+        )
+
+    @property
+    def enabled(self):
+        return self.max_tokens > 0
+
+    def messages(self, session_id):
+        """History to place between the system prefix and the new question"""
+        if not self.enabled or not session_id:
+            return []
+        state = self.store.get(session_id)
+        if not state:
+            return []
+        messages = []
+        if state.get('summary'):
+            messages.append({'role': 'system', 'content': f"Earlier in this conversation:\n{state['summary']}"})
+        messages.extend({'role': role, 'content': text} for role, text in state.get('turns', []))
+        return messages
+
+    def remember(self, session_id, question, answer):
+        """Record a question and its answer; runs in the background"""
+        if self.enabled and session_id and question and answer:
+            self._executor.submit(self._remember, session_id, question, answer)
+
+    def _remember(self, session_id, question, answer):
+        try:
+            # The memory store hands out its own dict, so work on a copy readers won't see half-updated
+            stored = self.store.get(session_id) or {'summary': '', 'turns': []}
+            turns = list(stored['turns'])
+            state = dict(stored, turns=turns)
+            turns.append(['user', truncate_tokens(question.strip(), self.turn_tokens, self.counter)])
+            turns.append(['assistant', truncate_tokens(answer.strip(), self.turn_tokens, self.counter)])
+
+            # Keep whole question/answer pairs in the ring; spill the oldest into the summary
+            budget = self.max_tokens - self.summary_tokens
+            evicted = []
+            while len(turns) > 2 and (len(turns) > self.max_turns or self._tokens(turns) > budget):
+                evicted.extend(turns[:2])
+                del turns[:2]
+            if evicted:
+                state['summary'] = self._summarize(state.get('summary', ''), evicted)
+            self.store[session_id] = state
+
+            size = len(json.dumps(state).encode('utf-8'))
+            tokens = self._tokens(turns) + self.counter.count(state['summary'])
+            with self._lock:
+                self.updates += 1
+                self.total_bytes += size
+                self.total_tokens += tokens
+                self.max_bytes = max(self.max_bytes, size)
+        except Exception as e:
+            print(f"Conversation memory error: {e}")
+
+    def _summarize(self, summary, turns):
+        if self.summarizer is not None:
+            try:
+                text = self.summarizer(summary, turns, self.summary_tokens)
+                with self._lock:
+                    self.summaries += 1
+                return truncate_tokens(text.strip(), self.summary_tokens, self.counter)
+            except Exception as e:
+                print(f"Summarizer failed, keeping an extractive summary: {e}")
+                with self._lock:
+                    self.summary_failures += 1
+        return extractive_summary(summary, turns, self.summary_tokens, self.counter)
+
+    def _tokens(self, turns):
+        return sum(self.counter.count(text) + 4 for _, text in turns)
+
+    def flush(self, timeout=None):
+        """Wait for queued updates to be written, e.g. before the process exits"""
+        self._executor.submit(lambda: None).result(timeout=timeout)
+
+    def clear(self, session_id):
+        del self.store[session_id]
+
+    def stats(self):
+        """Return budget settings and observed per-session memory size"""
+        with self._lock:
+            return {
+                'max_tokens': self.max_tokens,
+                'summary_tokens': self.summary_tokens,
+                'max_turns': self.max_turns,
+                'sessions': len(self.store),
+                'updates': self.updates,
+                'summaries': self.summaries,
+                'summary_failures': self.summary_failures,
+                'avg_tokens': round(self.total_tokens / self.updates, 1) if self.updates else 0.0,
+                'avg_bytes': round(self.total_bytes / self.updates) if self.updates else 0,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,80 @@
+"""Gunicorn settings for production: gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment. WEB_CONCURRENCY worker
+processes, each with GUNICORN_THREADS request threads, so throughput scales
+with cores rather than one GIL-bound process.
+"""
+import multiprocessing
+import os
+import signal
+
+cores = multiprocessing.cpu_count()
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(cores)))
+# Threads suit this app: most of a request is spent waiting on the upstream API,
+# OCR processes or speech recognition, and SSE/WebSocket streams hold a thread open
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Import main.py (Flask, prompts, answer index) once in the master, then load
+# the WARM_UP libraries there (default "text": the OpenAI client). Workers fork
+# with those pages shared copy-on-write. NumPy, Pillow and speech recognition
+# load on first use unless WARM_UP names image or voice.
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+# Streams and long OCR jobs stay open well past the 30s default
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '30'))
+# Idle keep-alive connections are parked by gthread rather than holding a thread,
+# so keep them long enough to cover a page load and the first question on a
+# slow mobile link. Behind a load balancer, set this above its idle timeout.
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '20'))
+# Recycle workers now and then to bound slow memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '500'))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+# Workers don't share memory: sessions must live in SQLite so any worker can
+# serve any student. Each worker gets its own share of the OCR processes, and
+# those start via forkserver rather than forking a threaded worker.
+if workers > 1:
+    os.environ.setdefault('SESSION_STORE', 'sqlite')
+os.environ.setdefault('OCR_WORKERS', str(max(1, cores // max(1, workers))))
+os.environ.setdefault('OCR_START_METHOD', 'forkserver')
+
+
+def when_ready(server):
+    # Load WARM_UP libraries once in the master so workers inherit them, or
+    # in each worker's background thread when the app isn't preloaded
+    if preload_app:
+        import main
+        main.warm_up()
+
+
+def post_fork(server, worker):
+    import main
+    main.reset_after_fork()
+
+
+def post_worker_init(worker):
+    # Report not-ready as soon as SIGTERM arrives, while gunicorn finishes
+    # in-flight requests, so load balancers stop sending new ones
+    import main
+    if not preload_app:
+        main.start_warm_up()
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def on_term(signum, frame):
+        main.shutting_down.set()
+        handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_exit(server, worker):
+    # The master can run this hook too, when it reaps a worker that is already
+    # gone; draining there would leave later forks with stopped executors
+    if os.getpid() != worker.pid:
+        return
+    import main
+    main.drain(timeout=graceful_timeout)
@@ -0,0 +1,257 @@
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+DEFAULT_STAGES = ('downscale', 'normalize', 'deskew', 'threshold', 'crop')
+
+
+def otsu_threshold(gray):
+    """Return the Otsu threshold of a uint8 image"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    omega = np.cumsum(hist) / total
+    mu = np.cumsum(hist * np.arange(256)) / total
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (mu[-1] * omega - mu) ** 2 / (omega * (1.0 - omega))
+    between = np.nan_to_num(between)
+    return int(np.argmax(between))
+
+
+def stretch_contrast(gray, low_pct=2.0, high_pct=98.0):
+    """Stretch the 2nd..98th percentile range to full contrast via a lookup table"""
+    cdf = np.cumsum(np.bincount(gray.ravel(), minlength=256)) / gray.size
+    low = int(np.searchsorted(cdf, low_pct / 100.0))
+    high = int(np.searchsorted(cdf, high_pct / 100.0))
+    if high <= low:
+        return gray
+    lut = np.clip((np.arange(256, dtype=np.float32) - low) * (255.0 / (high - low)), 0, 255)
+    return lut.astype(np.uint8)[gray]
+
+
+def adaptive_threshold(gray, block=31, offset=10):
+    """Binarize against the local mean of a block x block window.
+
+    Both the local mean and a 3x3 smoothed pixel value come from one integral
+    image, so sensor noise doesn't turn into speckles.
+    """
+    block = max(3, block | 1)
+    pad = block // 2
+    height, width = gray.shape
+    padded = np.pad(gray, pad, mode='edge').astype(np.float64)
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.float64)
+    integral[1:, 1:] = padded.cumsum(0).cumsum(1)
+
+    def box_mean(size):
+        start = pad - size // 2
+        end = start + size
+        window = (integral[end:end + height, end:end + width]
+                  - integral[start:start + height, end:end + width]
+                  - integral[end:end + height, start:start + width]
+                  + integral[start:start + height, start:start + width])
+        return window / (size * size)
+
+    return np.where(box_mean(3) > box_mean(block) - offset, 255, 0).astype(np.uint8)
+
+
+def estimate_skew(gray, max_angle=10.0, step=0.5, sample_edge=800, max_points=20000):
+    """Estimate text skew in degrees with a projection profile over candidate angles.
+
+    Rotating by the returned angle straightens the text lines.
+    """
+    height, width = gray.shape
+    scale = min(1.0, sample_edge / max(height, width))
+    if scale < 1.0:
+        stride = int(round(1 / scale))
+        gray = gray[::stride, ::stride]
+
+    ys, xs = np.nonzero(gray <= otsu_threshold(gray))
+    if len(ys) < 50:
+        return 0.0
+    if len(ys) > max_points:
+        pick = np.random.default_rng(0).choice(len(ys), max_points, replace=False)
+        ys, xs = ys[pick], xs[pick]
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    radians = np.deg2rad(angles)[:, None]
+    rows = ys[None, :] * np.cos(radians) + xs[None, :] * np.sin(radians)
+    rows = np.round(rows - rows.min()).astype(np.int64)
+    bins = int(rows.max()) + 1
+    # One histogram per candidate angle; sharp peaks mean lines are level
+    offsets = np.arange(len(angles))[:, None] * bins
+    hist = np.bincount((rows + offsets).ravel(), minlength=bins * len(angles)).reshape(len(angles), bins)
+    scores = (hist.astype(np.float64) ** 2).sum(axis=1)
+    return float(-angles[int(np.argmax(scores))])
+
+
+def ink_bounding_box(binary, min_fraction=0.002, margin=12):
+    """Bounding box (left, top, right, bottom) of rows/columns that carry ink"""
+    ink = binary == 0
+    rows = np.flatnonzero(ink.mean(axis=1) > min_fraction)
+    cols = np.flatnonzero(ink.mean(axis=0) > min_fraction)
+    if len(rows) == 0 or len(cols) == 0:
+        return None
+    height, width = binary.shape
+    return (
+        max(0, int(cols[0]) - margin),
+        max(0, int(rows[0]) - margin),
+        min(width, int(cols[-1]) + margin + 1),
+        min(height, int(rows[-1]) + margin + 1),
+    )
+
+
+def _ink_runs(profile, min_gap):
+    """(start, end) runs of inked rows/columns, joining runs separated by fewer than min_gap blank ones"""
+    inked = np.flatnonzero(profile)
+    if len(inked) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(inked) > min_gap)
+    starts = np.concatenate(([inked[0]], inked[breaks + 1]))
+    ends = np.concatenate((inked[breaks], [inked[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def find_text_regions(binary, row_gap=None, col_gap=None, min_size=12, max_regions=24, max_depth=8):
+    """Text blocks (left, top, right, bottom) on a binarized page, in reading order.
+
+    Recursive XY-cut: split the page into bands at wide blank rows, each band
+    into columns at wide blank columns, and so on until no block splits
+    further. Question boxes and two-column worksheets come out as separate
+    blocks, top to bottom and left to right. A page that breaks into more than
+    max_regions blocks (noise, dense scribbles) is returned as one block.
+    """
+    ink = binary < 128
+    height, width = ink.shape
+    row_gap = row_gap or max(12, height // 40)
+    col_gap = col_gap or max(24, width // 16)
+    regions = []
+
+    def cut(left, top, right, bottom, axis, depth, settled):
+        block = ink[top:bottom, left:right]
+        runs = _ink_runs(block.any(axis=1 - axis), row_gap if axis == 0 else col_gap)
+        if not runs:
+            return
+        if len(runs) == 1 or depth >= max_depth:
+            start, end = runs[0][0], runs[-1][1]
+            if axis == 0:
+                top, bottom = top + start, top + end
+            else:
+                left, right = left + start, left + end
+            if settled or depth >= max_depth:
+                if right - left >= min_size and bottom - top >= min_size:
+                    regions.append((left, top, right, bottom))
+                return
+            # Didn't split this way; trim to the ink and try the other direction
+            cut(left, top, right, bottom, 1 - axis, depth + 1, True)
+            return
+        for start, end in runs:
+            if axis == 0:
+                cut(left, top + start, right, top + end, 1, depth + 1, False)
+            else:
+                cut(left + start, top, left + end, bottom, 0, depth + 1, False)
+
+    cut(0, 0, width, height, 0, 0, False)
+    if len(regions) > max_regions:
+        return [(min(r[0] for r in regions), min(r[1] for r in regions),
+                 max(r[2] for r in regions), max(r[3] for r in regions))]
+    return regions
+
+
+class PreprocessPipeline:
+    """Configurable NumPy preprocessing for photographed homework before Tesseract.
+
+    Stages run in the order given; each stage's time is reported so slow steps
+    are easy to spot. Instances are plain data and safe to send to OCR workers.
+    """
+
+    def __init__(self, stages=DEFAULT_STAGES, target_dpi=300, page_inches=8.0,
+                 threshold='adaptive', block=31, offset=10, max_skew=10.0):
+        self.stages = tuple(stages)
+        self.target_dpi = target_dpi
+        self.page_inches = page_inches
+        self.threshold = threshold
+        self.block = block
+        self.offset = offset
+        self.max_skew = max_skew
+
+    @classmethod
+    def from_env(cls):
+        """Build a pipeline from OCR_PIPELINE / OCR_TARGET_DPI / OCR_THRESHOLD etc."""
+        stages = os.getenv('OCR_PIPELINE')
+        return cls(
+            stages=[s.strip() for s in stages.split(',') if s.strip()] if stages else DEFAULT_STAGES,
+            target_dpi=int(os.getenv('OCR_TARGET_DPI', '300')),
+            page_inches=float(os.getenv('OCR_PAGE_INCHES', '8')),
+            threshold=os.getenv('OCR_THRESHOLD', 'adaptive'),
+            block=int(os.getenv('OCR_THRESHOLD_BLOCK', '31')),
+            offset=int(os.getenv('OCR_THRESHOLD_OFFSET', '10')),
+            max_skew=float(os.getenv('OCR_MAX_SKEW', '10')),
+        )
+
+    @property
+    def max_edge(self):
+        """Longest image edge, in pixels, that gives target_dpi over the page"""
+        return int(self.target_dpi * self.page_inches)
+
+    def run(self, image_bytes):
+        """Decode and preprocess image bytes; returns (PIL image, {stage: ms})"""
+        timings = {}
+        started = time.perf_counter()
+
+        image = Image.open(io.BytesIO(image_bytes))
+        if 'downscale' in self.stages and image.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of the full 12MP
+            image.draft('L', (self.max_edge, self.max_edge))
+        image = ImageOps.exif_transpose(image).convert('L')
+        timings['decode'] = _elapsed_ms(started)
+
+        gray = None
+        for stage in self.stages:
+            stage_started = time.perf_counter()
+            if stage == 'downscale':
+                if image is None:
+                    image = Image.fromarray(gray)
+                longest = max(image.size)
+                if longest > self.max_edge:
+                    ratio = self.max_edge / longest
+                    size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+                    image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+                gray = None
+            else:
+                if gray is None:
+                    gray = np.asarray(image, dtype=np.uint8)
+                if stage == 'normalize':
+                    gray = stretch_contrast(gray)
+                elif stage == 'deskew':
+                    angle = estimate_skew(gray, max_angle=self.max_skew)
+                    if abs(angle) >= 0.25:
+                        image = Image.fromarray(gray).rotate(
+                            angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255
+                        )
+                        gray = np.asarray(image, dtype=np.uint8)
+                elif stage == 'threshold':
+                    if self.threshold == 'otsu':
+                        gray = np.where(gray > otsu_threshold(gray), 255, 0).astype(np.uint8)
+                    else:
+                        gray = adaptive_threshold(gray, self.block, self.offset)
+                elif stage == 'crop':
+                    box = ink_bounding_box(gray)
+                    if box is not None:
+                        left, top, right, bottom = box
+                        gray = gray[top:bottom, left:right]
+                else:
+                    raise ValueError(f'Unknown preprocessing stage: {stage}')
+                image = None
+            timings[stage] = _elapsed_ms(stage_started)
+
+        if image is None:
+            image = Image.fromarray(gray)
+        return image, timings
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
@@ -0,0 +1,220 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+TERMINAL = ('done', 'error')
+
+# Answer events whose fields are kept on the job as-is
+TEXT_FIELDS = ('extracted_text', 'transcribed_text', 'ocr_timing', 'voice_timing')
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already waiting"""
+
+
+class JobQueue:
+    """Background jobs for image and voice queries, with their progress kept for polling.
+
+    A job runs one of the answer event generators (text first, then tokens,
+    then done or error) on a worker thread, folding the events into a state
+    dict whose 'response' grows as tokens arrive. The state lives in a
+    session store with its own TTL, so with the SQLite store any worker
+    process can answer a poll. Updates are also pushed to watchers in this
+    process, so a stream served by the worker running the job sees every
+    token. The store is written when the text is ready, when the job
+    finishes, and at most every checkpoint_interval while tokens arrive.
+    """
+
+    def __init__(self, store, workers=4, max_pending=64, checkpoint_interval=0.5, poll_interval=0.25):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.checkpoint_interval = checkpoint_interval
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._live = {}  # job_id -> state, for jobs running in this process
+        self._changed = threading.Condition()
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_queue_ms = 0.0
+        self.total_run_ms = 0.0
+
+    @classmethod
+    def from_env(cls, store):
+        """Build a queue from JOB_* environment variables"""
+        return cls(
+            store,
+            workers=int(os.getenv('JOB_WORKERS', '4')),
+            max_pending=int(os.getenv('JOB_MAX_PENDING', '64')),
+        )
+
+    def submit(self, kind, session_id, events):
+        """Queue a job that runs events() and return its ID straight away"""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise JobQueueFull('Too many questions are waiting right now. Please try again in a moment.')
+            self.pending += 1
+            self.submitted += 1
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        state = {
+            'job_id': job_id,
+            'kind': kind,
+            'session_id': session_id,
+            'status': 'queued',
+            'created_at': now,
+            'updated_at': now,
+            'response': '',
+        }
+        self.store[job_id] = dict(state)
+        with self._changed:
+            self._live[job_id] = state
+        # Keep the submitting request's context (metrics endpoint label) in the job
+        self._executor.submit(contextvars.copy_context().run, self._run, job_id, state, events)
+        return job_id
+
+    def _run(self, job_id, state, events):
+        started = time.time()
+        with self._lock:
+            self.pending -= 1
+            self.running += 1
+            self.total_queue_ms += (started - state['created_at']) * 1000
+        self._update(job_id, state, {'status': 'running', 'started_at': started}, save=True)
+
+        parts = []
+        last_saved = time.monotonic()
+        try:
+            for event in events():
+                name = event.pop('event')
+                if name == 'token':
+                    parts.append(event['content'])
+                    save = time.monotonic() - last_saved >= self.checkpoint_interval
+                    self._update(job_id, state, {'response': ''.join(parts)}, save=save)
+                    if save:
+                        last_saved = time.monotonic()
+                elif name == 'done':
+                    self._update(job_id, state, dict(event, status='done', response=''.join(parts)), save=True)
+                    break
+                elif name == 'error':
+                    self._update(job_id, state, {'status': 'error', 'error': event.get('error')}, save=True)
+                    break
+                else:
+                    self._update(job_id, state, {key: event[key] for key in TEXT_FIELDS if key in event}, save=True)
+                    last_saved = time.monotonic()
+            else:
+                self._update(job_id, state, {'status': 'done', 'response': ''.join(parts)}, save=True)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._update(job_id, state, {'status': 'error', 'error': f'Processing failed: {e}'}, save=True)
+        finally:
+            finished = time.time()
+            with self._lock:
+                self.running -= 1
+                self.total_run_ms += (finished - started) * 1000
+                if state['status'] == 'done':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            with self._changed:
+                self._live.pop(job_id, None)
+                self._changed.notify_all()
+
+    def _update(self, job_id, state, changes, save=False):
+        with self._changed:
+            state.update(changes)
+            state['updated_at'] = time.time()
+            if state['status'] in TERMINAL:
+                state['finished_at'] = state['updated_at']
+                state['timing'] = {
+                    'queue_ms': round((state.get('started_at', state['created_at']) - state['created_at']) * 1000, 1),
+                    'run_ms': round((state['finished_at'] - state.get('started_at', state['created_at'])) * 1000, 1),
+                }
+            snapshot = dict(state)
+            self._changed.notify_all()
+        if save:
+            self.store[job_id] = snapshot
+
+    def get(self, job_id):
+        """Current state of a job, or None if it's unknown or expired"""
+        with self._changed:
+            state = self._live.get(job_id)
+            if state is not None:
+                return dict(state)
+        state = self.store.get(job_id)
+        return dict(state) if state is not None else None
+
+    def watch(self, job_id, timeout=300.0):
+        """Yield the job's state each time it changes, until it finishes or timeout passes"""
+        deadline = time.monotonic() + timeout
+        last = None
+        while True:
+            state = self.get(job_id)
+            if state is None:
+                return
+            if state != last:
+                yield state
+                last = state
+            if state['status'] in TERMINAL or time.monotonic() >= deadline:
+                return
+            with self._changed:
+                # Local jobs notify on every update; jobs run by another process are polled
+                self._changed.wait(self.poll_interval)
+
+    def events(self, job_id, timeout=300.0):
+        """Answer events for a job, in the same shape as the streaming endpoints.
+
+        Can be called at any point in the job's life; the text and any answer
+        so far are replayed first.
+        """
+        sent_fields = set()
+        sent = 0
+        for state in self.watch(job_id, timeout):
+            for key, timing_key in (('extracted_text', 'ocr_timing'), ('transcribed_text', 'voice_timing')):
+                if key in state and key not in sent_fields:
+                    sent_fields.add(key)
+                    event = {'event': key, key: state[key]}
+                    if timing_key in state:
+                        event[timing_key] = state[timing_key]
+                    yield event
+            response = state.get('response') or ''
+            if len(response) > sent:
+                yield {'event': 'token', 'content': response[sent:]}
+                sent = len(response)
+            if state['status'] == 'done':
+                yield {'event': 'done', **{key: state[key] for key in ('cached', 'source', 'note') if key in state}}
+                return
+            if state['status'] == 'error':
+                yield {'event': 'error', 'error': state.get('error')}
+                return
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        """Return queue depth, outcomes and average queue/run time"""
+        with self._lock:
+            finished = self.completed + self.failed
+            started = finished + self.running
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'running': self.running,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'stored': len(self.store),
+                'avg_queue_ms': round(self.total_queue_ms / started, 1) if started else 0.0,
+                'avg_run_ms': round(self.total_run_ms / finished, 1) if finished else 0.0,
+            }
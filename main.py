@@ -1,35 +1,39 @@
-def process_voice_query_simple(self, audio_data, student_info):
-        """Simplified voice processing - fallback method"""
-        try:
-            # For now, return a helpful message about voice input
-            return {
-                'success': True,
-                'response': f"I heard your voice message! However, voice-to-text processing needs some additional setup. For now, please type your question in the text box and I'll be happy to help! 🎤➡️📝",
-                'transcribed_text': "[Voice input received - please type your question]",
-                'timestamp': datetime.now().isoformat(),
-                'note': 'Voice processing temporarily disabled - needs FFmpeg installation'
-            }
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f'Voice processing error: {str(e)}'
-            }
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, make_response, render_template, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import openai
 #from openai.error import AuthenticationError, RateLimitError, APIError
 import base64
-import io
-from PIL import Image
-from PIL import ImageEnhance, ImageFilter
-import pytesseract
-import speech_recognition as sr
-import tempfile
+import contextvars
+import hmac
 import os
+import threading
 from datetime import datetime
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from response_cache import ResponseCache, make_cache_key, normalize_query
+from answer_index import AnswerIndex
+from prompts import PromptRegistry
+from conversation_memory import ConversationMemory
+from upstream import UpstreamClient, UpstreamTimeoutError, CircuitOpenError, request_deadline
+from session_store import create_session_store
+from jobs import JobQueue, JobQueueFull
+from ocr_pool import OCRPool, OCRBusyError
+from ocr_cache import OCRCache, perceptual_hash
+from voice_pipeline import VoicePipeline, VoiceInputError
+from metrics import metrics, current_endpoint
+from admission import AdmissionController, AdmissionRejected
+from profiler import profiler
+from compression import Compressor
+from static_assets import StaticAssets
+from model_router import ModelRouter
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 # Load environment variables
 load_dotenv()
@@ -37,122 +41,199 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# Configure OpenAI API key from environment variable
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
-# Verify API key is loaded
-if not openai.api_key:
-    print("WARNING: OPENAI_API_KEY not found in environment variables!")
-    print("Please set your OpenAI API key in a .env file or environment variable.")
-else:
-    print("✓ OpenAI API key loaded successfully")
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default JSON handling, with response serialization timed as a request stage"""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.span('serialization'):
+            return super().dumps(obj, **kwargs)
+
+
+app.json = TimedJSONProvider(app)
+
+# WebSocket support for live voice input (pip install flask-sock)
+sock = Sock(app) if Sock else None
+
+# gzip/brotli for answers and pages, and hashed, long-cached static files
+compressor = Compressor.from_env()
+static_assets = StaticAssets.from_env(app.static_folder, compressor)
+
+# Shared OpenAI client: pooled connections, bounded concurrency, deadlines and retries
+upstream = UpstreamClient.from_env()
+
+class QueryInputError(Exception):
+    """Raised when a student's upload can't be turned into a question"""
+
+
+# Student session storage: in-memory by default, SQLite (WAL) to share sessions
+# across worker processes and restarts. See SESSION_STORE in the README.
+student_sessions = create_session_store()
+
+# OCR runs in its own process pool so image uploads don't pin request threads
+ocr_pool = OCRPool.from_env()
+
+# Perceptual-hash cache of OCR text for repeated homework photos
+ocr_cache = OCRCache.from_env()
+
+# In-memory audio decoding and speech recognition (google, sphinx or vosk)
+voice_pipeline = VoicePipeline.from_env()
+
+# System prompts from config/, with a stable per-profile prefix for upstream prompt caching
+prompt_registry = PromptRegistry.from_env()
+
+# Model, max_tokens and temperature per question, from the tier table in config/model_tiers.json
+model_router = ModelRouter.from_env()
+
+
+def summarize_conversation(summary, turns, max_tokens):
+    """Ask the model to fold older turns into the running conversation summary"""
+    transcript = '\n'.join(f"{'Student' if role == 'user' else 'Tutor'}: {text}" for role, text in turns)
+    return upstream.complete(
+        [
+            {"role": "system", "content": "Summarize this tutoring conversation in a few short bullet points: "
+                                          "topics covered, what the student struggled with, and any numbered "
+                                          "steps or examples they may refer back to. Plain text only."},
+            {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"}
+        ],
+        model="gpt-3.5-turbo",
+        max_tokens=max_tokens,
+        temperature=0.2
+    )
+
+
+# Recent turns plus a rolling summary per session, stored next to the student profiles.
+# MEMORY_SUMMARIZER=llm summarizes older turns with the model instead of extractively.
+conversation_memory = ConversationMemory.from_env(
+    create_session_store(namespace='conversations'),
+    prompt_registry.counter,
+    summarizer=summarize_conversation if os.getenv('MEMORY_SUMMARIZER', 'extractive') == 'llm' else None
+)
+
+# Pre-written answers to common syllabus questions, served without an LLM call
+answer_index = AnswerIndex.from_env()
+
+# Worker threads shared by all batch requests; upstream concurrency is bounded separately
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('BATCH_WORKERS', '8')),
+    thread_name_prefix='batch'
+)
+BATCH_MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', '50'))
+
+# Image and voice queries submitted as background jobs, polled or streamed by ID.
+# Job state is kept for JOB_TTL seconds in the session store backend, so with
+# SESSION_STORE=sqlite any worker process can answer a poll.
+job_queue = JobQueue.from_env(create_session_store(namespace='jobs', ttl=int(os.getenv('JOB_TTL', '3600'))))
+
+# Shared answer cache for upstream completions, keyed on query + class/board/language
+response_cache = ResponseCache(
+    max_size=int(os.getenv('RESPONSE_CACHE_SIZE', '512')),
+    ttl=int(os.getenv('RESPONSE_CACHE_TTL', '600'))
+)
+
+# Per-session rate limits and weighted text/heavy queues in front of the query endpoints
+admission = AdmissionController.from_env()
+ADMISSION_ENABLED = os.getenv('ADMISSION', 'on').lower() not in ('0', 'off', 'false')
+
+# View functions by the kind of work they do; other endpoints skip admission.
+# The live voice WebSocket holds its connection for the whole recording, so it
+# is not queued here.
+WORK_CLASSES = {
+    'handle_text_query': 'text',
+    'handle_text_query_stream': 'text',
+    'handle_batch_query': 'text',
+    'handle_image_query': 'heavy',
+    'handle_image_query_stream': 'heavy',
+    'handle_image_upload': 'heavy',
+    'handle_voice_query': 'heavy',
+    'handle_voice_query_stream': 'heavy',
+    'handle_voice_upload': 'heavy',
+    'handle_pages_query': 'heavy',
+    'submit_image_job': 'heavy',
+    'submit_voice_job': 'heavy',
+}
+
+# Latency budget per endpoint, in seconds from arrival. Upstream calls made for
+# the request get whatever is left, so time spent queueing or on OCR shortens
+# the completion's deadline instead of stretching the request past its budget.
+# The live voice socket stays open while the student speaks, so its budget
+# (VOICE_SOCKET_BUDGET) starts at end of speech instead.
+LATENCY_BUDGETS = {
+    'handle_text_query': float(os.getenv('LATENCY_BUDGET_TEXT', '20')),
+    'handle_text_query_stream': float(os.getenv('LATENCY_BUDGET_STREAM', '30')),
+    'handle_batch_query': float(os.getenv('LATENCY_BUDGET_BATCH', '60')),
+    **dict.fromkeys((
+        'handle_image_query', 'handle_image_query_stream', 'handle_image_upload', 'handle_voice_query',
+        'handle_voice_query_stream', 'handle_voice_upload', 'handle_pages_query',
+    ), float(os.getenv('LATENCY_BUDGET_HEAVY', '45'))),
+    **dict.fromkeys(('submit_image_job', 'submit_voice_job'), float(os.getenv('LATENCY_BUDGET_JOB', '120'))),
+}
+
+# Component stats (cache hits, queue depths, ...) exposed as gauges on /metrics
+for name, component in (
+    ('response_cache', response_cache), ('upstream', upstream), ('sessions', student_sessions),
+    ('ocr', ocr_pool), ('ocr_cache', ocr_cache), ('voice', voice_pipeline),
+    ('answer_index', answer_index), ('prompts', prompt_registry), ('memory', conversation_memory),
+    ('admission', admission), ('jobs', job_queue), ('compression', compressor),
+):
+    metrics.add_collector(name, component.stats)
+# Collectors flatten one level, so tiers are exported as model_tiers_<tier>_<field>
+metrics.add_collector('model_tiers', lambda: model_router.stats()['tiers'])
+
+
+def count_answer(source, fallback=None):
+    """Count where an answer came from: local, cache, upstream or demo"""
+    endpoint = current_endpoint.get()
+    metrics.inc('answers_total', help='Answers by endpoint and source', endpoint=endpoint, source=source)
+    if fallback:
+        metrics.inc('demo_fallbacks_total', help='Answers served in demo mode, by reason',
+                    endpoint=endpoint, reason=fallback)
+
+
+def fallback_reason(error):
+    """(metric reason, student-facing note) for an answer served locally instead of upstream"""
+    if isinstance(error, CircuitOpenError):
+        return 'breaker_open', 'Answering offline while the AI service recovers'
+    if isinstance(error, UpstreamTimeoutError):
+        return 'deadline', 'Answering offline because the AI service is slow right now'
+    return 'upstream_error', f'Using demo mode due to error: {str(error)}'
+
+
+def record_tier(tier, seconds, prompt_tokens, completion_tokens, first_token_seconds=None):
+    """Record an upstream call's latency and token use against its model tier"""
+    model_router.record(tier, seconds, prompt_tokens, completion_tokens, first_token_seconds)
+    metrics.observe('model_tier_seconds', seconds, help='Upstream completion time by model tier', tier=tier.name)
+    metrics.inc('model_tier_tokens_total', prompt_tokens, help='Tokens by model tier and kind',
+                tier=tier.name, kind='prompt')
+    metrics.inc('model_tier_tokens_total', completion_tokens, help='Tokens by model tier and kind',
+                tier=tier.name, kind='completion')
+
+def record_voice_timing(voice_timing):
+    conversion_ms = voice_timing.get('decode_ms', 0.0) + voice_timing.get('resample_ms', 0.0)
+    metrics.stage('audio_conversion', conversion_ms / 1000)
+    metrics.stage('speech_recognition', voice_timing.get('recognize_ms', 0.0) / 1000)
+
 
-# Student session storage (in production, use a proper database)
-student_sessions = {}
 class EduMentorAI:
-    def __init__(self):
-        self.system_prompt = """
-        🧠 Capabilities:
-            Accept student questions via:
-				Text
-				Voice            
-				Image (including printed questions, textbook photos, and handwritten homework) 
-			  
-            Accurately interpret:            
-				Handwritten notes, even if messy, casual, or incomplete
-				Imperfect grammar or spelling, especially from young learners
-				Partial queries, inferring intelligently using context
-
-			Understand student's:
-				Class level (e.g., Class 5, PG)
-				Academic board (CBSE, ICSE, SSC, IB, IGCSE)
-				Preferred language style (English, Desi Mix, Telugu-English, Urdu-English)
-
-📝 When students upload images (e.g., homework diary):
-	Use OCR to extract visible text (printed or handwritten)
-	Prioritize understanding handwritten content
-	If homework-related:
-		Summarize the tasks
-		Offer guidance on how to complete them
-		Provide relevant support material, like steps, examples, or concepts
-
-	If handwriting is unclear:
-		Infer intelligently
-		Politely ask for clarification or better images if needed
-
-🗣️ Language & Style Support:
-	✅ Pure English
-	✅ Hindi
-	✅ English-Hindi (Desi Style)
-	✅ English-Telugu (Andhra Style)
-	✅ English-Urdu (Andhra Urdu Style)
-
-	❗ For mixed styles, reply in Romanized transliteration using English letters — never use native scripts like देवनागरी or اردو.
-
-📚 Textbook-Aligned Tutoring:
-	Use internal syllabus-aligned explanations for major Indian boards
-	DO NOT ask for chapter names or textbook uploads
-	When a topic is mentioned, intelligently align your explanation to the typical textbook structure
-
-🧑‍🏫 Teaching Method:
-	Be friendly, patient, and encouraging
-	Use step-by-step explanations
-	Include:
-		Examples
-		Analogies
-		Diagrams (if referenced)
-		Simplified concepts based on student’s level
-
-	Prompt students with follow-up questions or curiosity boosters
-
-🔊 Voice & Audio Optimization:
-	Keep sentences short and clear for text-to-speech
-	Avoid reading special symbols like #, *, =
-	Respond in a natural, non-robotic tone
-
-📐 Response Formatting Guidelines:
-	Use clean and engaging Markdown formatting:
-
-✅ Use bold for:
-	Important terms
-	Definitions
-	Key concepts
-
-✅ Use bullet points:
-	Use - or numbered 1. 2. 3. format
-	Put each point on a new line
-✅ Use emojis sparingly:
-	Help highlight key ideas (e.g. 🌱, 💡, 📘, ➕)
-	Do not overuse
-✅ Use short paragraphs:
-	Max 2–3 sentences per paragraph
-	Avoid long blocks of text
-
-💡 Example Format:
-Photosynthesis is the process by which plants make their own food. 🌿
-Steps:
-	Sunlight is absorbed by chlorophyll in the leaves.
-	Carbon dioxide enters from the air.
-	Water comes from the roots.
-	The plant makes glucose and releases oxygen.
-
-🧭 Conversation Flow:
-	Understand the student’s class, board, and language preference
-	Determine the input type: text, voice, or image
-	Provide:
-		A clear, structured, and age-appropriate answer
-		Help with understanding homework if from image
-		Motivation and encouragement
-		Follow-up suggestions or curiosity prompts
-		
-Respond like a caring, intelligent teacher who adapts your language, tone, and depth to the student’s age, style, and input type.
-"""
-
-    def process_text_query(self, query, student_info):
+    def process_text_query(self, query, student_info, origin='text'):
         """Process text-based queries using OpenAI API"""
+        session_id = student_info.get('session_id')
+        result = self.answer_text_query(query, student_info, conversation_memory.messages(session_id), origin)
+        if result.get('success'):
+            conversation_memory.remember(session_id, query, result['response'])
+        return result
+
+    def answer_text_query(self, query, student_info, history=None, origin='text'):
+        """Answer a text query from the local index, the cache or OpenAI.
+
+        history is the conversation so far; standalone questions (e.g. a batch
+        of worksheet questions) leave it out and share cache entries. origin
+        (text, image, pages or voice) feeds the model routing.
+        """
         try:
             # Check if OpenAI API key is available
-            if not openai.api_key:
+            if not upstream.api_key:
+                count_answer('demo', fallback='no_api_key')
                 return {
                     'success': True,
                     'response': self.generate_demo_response(query, student_info),
@@ -160,223 +241,388 @@ Respond like a caring, intelligent teacher who adapts your language, tone, and d
                     'note': 'Using demo mode - OpenAI API key not configured'
                 }
 
-            # Format the query with student context
-            student_context = f"""
-Student Information:
-- Class/Level: {student_info.get('class', 'Not specified')}
-- Academic Board: {student_info.get('board', 'Not specified')}
-- Language Preference: {student_info.get('language', 'English')}
-- Name: {student_info.get('name', 'Student')}
-
-Instructions: You are EduMentor AI. Respond according to the student's class level and language preference. 
-Be encouraging, educational, and age-appropriate. Use simple language for younger students and more detailed 
-explanations for older students. If the language preference includes mixed languages, respond in Romanized 
-transliteration using English script only.
-"""
-
-            user_message = f"{student_context}\n\nStudent's Question: {query}"
-
-            # Make API call to OpenAI
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                max_tokens=1000,
-                temperature=0.7
+            # Common syllabus questions are answered from the local index in milliseconds
+            local_response = answer_index.lookup(query, student_info)
+            if local_response is not None:
+                count_answer('local')
+                return {
+                    'success': True,
+                    'response': local_response,
+                    'timestamp': datetime.now().isoformat(),
+                    'source': 'local'
+                }
+
+            # Identical questions from the same class/board/language profile (and the
+            # same conversation so far, for follow-ups) share one completion
+            tier = model_router.route(query, student_info, origin)
+            cache_key = make_cache_key(query, student_info, history, tier.name)
+            ai_response, cached = response_cache.get_or_compute(
+                cache_key,
+                lambda: self.complete_text_query(query, student_info, history, tier)
             )
 
-            ai_response = response.choices[0].message.content.strip()
-            
-            return {
+            result = {
                 'success': True,
                 'response': ai_response,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now().isoformat(),
+                'tier': tier.name
             }
+            if cached:
+                result['cached'] = True
+            count_answer('cache' if cached else 'upstream')
+            return result
 
-        except openai.AuthenticationError:
-            return {
-                'success': False,
-                'error': 'OpenAI API key is invalid. Please check your API key configuration.'
-            }
-        except openai.RateLimitError:
-            return {
-                'success': False,
-                'error': 'API rate limit exceeded. Please try again in a moment.'
-            }
-        except openai.APIError as e:
-            return {
-                'success': False,
-                'error': f'OpenAI API error: {str(e)}'
-            }
         except Exception as e:
+            error = self.upstream_error_message(e)
+            if error:
+                return {
+                    'success': False,
+                    'error': error
+                }
             # Fallback to demo response if API fails
+            fallback, note = fallback_reason(e)
+            count_answer('demo', fallback=fallback)
             return {
                 'success': True,
                 'response': self.generate_demo_response(query, student_info),
                 'timestamp': datetime.now().isoformat(),
-                'note': f'Using demo mode due to error: {str(e)}'
+                'note': note
             }
 
-    def process_image_query(self, image_data, student_info):
-        """Process image-based queries using enhanced OCR for handwriting"""
+    def stream_text_query(self, query, student_info, origin='text'):
+        """Yield answer events for a text query as tokens arrive from OpenAI"""
+        parts = []
+        for event in self.stream_text_answer(query, student_info, origin):
+            if event['event'] == 'token':
+                parts.append(event['content'])
+            elif event['event'] == 'done':
+                conversation_memory.remember(student_info.get('session_id'), query, ''.join(parts))
+            yield event
+
+    def stream_text_answer(self, query, student_info, origin='text'):
+        """Answer events from the local index, the cache or a streamed OpenAI completion"""
+        if not upstream.api_key:
+            count_answer('demo', fallback='no_api_key')
+            yield {'event': 'token', 'content': self.generate_demo_response(query, student_info)}
+            yield {'event': 'done', 'note': 'Using demo mode - OpenAI API key not configured'}
+            return
+
+        local_response = answer_index.lookup(query, student_info)
+        if local_response is not None:
+            count_answer('local')
+            yield {'event': 'token', 'content': local_response}
+            yield {'event': 'done', 'source': 'local'}
+            return
+
+        history = conversation_memory.messages(student_info.get('session_id'))
+        tier = model_router.route(query, student_info, origin)
+        cache_key = make_cache_key(query, student_info, history, tier.name)
+        messages = self.build_messages(query, student_info, history)
+        # A burst of identical questions shares one upstream stream; followers replay the leader's tokens
+        tokens, source = response_cache.stream(cache_key, lambda: self.stream_completion(messages, tier))
+        if source == 'cache':
+            count_answer('cache')
+            yield {'event': 'token', 'content': next(tokens)}
+            yield {'event': 'done', 'cached': True, 'tier': tier.name}
+            return
+
+        leader = source == 'upstream'
+        parts = []
+        first_token = None
+        started = time.perf_counter()
         try:
-            # Decode base64 image
-            image_bytes = base64.b64decode(image_data.split(',')[1])
-            image = Image.open(io.BytesIO(image_bytes)).convert("L")  # Convert to grayscale
+            for token in tokens:
+                if not parts and leader:
+                    first_token = time.perf_counter() - started
+                    metrics.stage('upstream_first_token', first_token)
+                parts.append(token)
+                yield {'event': 'token', 'content': token}
+            if leader:
+                elapsed = time.perf_counter() - started
+                metrics.stage('upstream_completion', elapsed)
+                # Streams carry no usage, so tokens are counted locally
+                record_tier(tier, elapsed, prompt_registry.counter.count_messages(messages),
+                            prompt_registry.counter.count(''.join(parts)), first_token)
+        except Exception as e:
+            if leader and not isinstance(e, CircuitOpenError):
+                model_router.record(tier, time.perf_counter() - started, failed=True)
+            error = self.upstream_error_message(e)
+            if error or parts:
+                yield {'event': 'error', 'error': error or f'Answer stream interrupted: {str(e)}'}
+                return
+            # Nothing was sent yet, so the demo answer can still stand in
+            fallback, note = fallback_reason(e)
+            count_answer('demo', fallback=fallback)
+            yield {'event': 'token', 'content': self.generate_demo_response(query, student_info)}
+            yield {'event': 'done', 'note': note}
+            return
+        finally:
+            tokens.close()
 
-             # Apply preprocessing to enhance handwriting
-            image = image.filter(ImageFilter.MedianFilter())  # Reduce noise
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(2.5)  # Boost contrast
-            image = image.point(lambda x: 0 if x < 140 else 255)  # Binarize (threshold)
+        if leader:
+            count_answer('upstream')
+            yield {'event': 'done', 'tier': tier.name}
+        else:
+            count_answer('cache')
+            yield {'event': 'done', 'cached': True, 'tier': tier.name}
 
-            # Enhance image for OCR (optional: binarize, sharpen, etc.)
-            #image = image.point(lambda x: 0 if x < 150 else 255)  # Simple thresholding
+    def upstream_error_message(self, error):
+        """Map an OpenAI error to a student-facing message, or None to fall back to demo mode"""
+        import openai
 
-            # Optional save for debugging
-            # image.save("preprocessed.png")
+        metrics.error(type(error).__name__)
+        if isinstance(error, openai.AuthenticationError):
+            return 'OpenAI API key is invalid. Please check your API key configuration.'
+        if isinstance(error, openai.RateLimitError):
+            return 'API rate limit exceeded. Please try again in a moment.'
+        if isinstance(error, openai.APIError):
+            return f'OpenAI API error: {str(error)}'
+        return None
 
-            # Use pytesseract with appropriate config for handwriting
-            custom_config = r'--oem 3 --psm 6'  # OEM 3 = default + LSTM; PSM 6 = block of text
-            extracted_text = pytesseract.image_to_string(image, config=custom_config)
+    def build_messages(self, query, student_info, history=None):
+        """Build the chat messages sent upstream for a query.
 
-            # OCR config optimized for handwritten-like text
-            #ocr_config = "--psm 6"  # Assume a block of text
-            
-            # Extract text using OCR
-            #extracted_text = pytesseract.image_to_string(image, config=ocr_config)
-            
-            if not extracted_text.strip():
-                return {
-                    'success': False,
-                    'error': '❌ Could not read handwriting. Please upload a clearer image or retake the photo.'
-                }
+        The system prompt and student profile form one memoized prefix per
+        (class, board, language); the student's name is left out on purpose so
+        answers and upstream prompt caching are shared across classmates.
+        Conversation history goes after the prefix so the prefix stays stable.
+        """
+        with metrics.span('prompt_assembly'):
+            return prompt_registry.messages(query, student_info, history)
+
+    def complete_text_query(self, query, student_info, history=None, tier=None):
+        """Call OpenAI for a single answer; results are shared across students via the cache"""
+        tier = tier or model_router.default
+        messages = self.build_messages(query, student_info, history)
+        usage = []
+        started = time.perf_counter()
+        try:
+            with metrics.span('upstream_completion'):
+                response = upstream.complete(
+                    messages,
+                    model=tier.model,
+                    max_tokens=tier.max_tokens,
+                    temperature=tier.temperature,
+                    on_usage=lambda prompt_tokens, completion_tokens: usage.extend((prompt_tokens, completion_tokens))
+                )
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                model_router.record(tier, time.perf_counter() - started, failed=True)
+            raise
+        record_tier(tier, time.perf_counter() - started, *(usage or (0, 0)))
+        return response
+
+    def stream_completion(self, messages, tier=None):
+        """Call OpenAI with streaming enabled; returns an iterator of content tokens"""
+        tier = tier or model_router.default
+        return upstream.stream(
+            messages,
+            model=tier.model,
+            max_tokens=tier.max_tokens,
+            temperature=tier.temperature
+        )
+
+    def extract_image_text(self, image_bytes):
+        """Run handwriting-tuned OCR on uploaded image bytes.
+
+        Returns (extracted_text, ocr_timing); the OCR itself runs in the worker pool.
+        """
+        # Re-photographed worksheets hit the perceptual-hash cache and skip OCR
+        try:
+            # A blank page hashes to 0; don't let blank photos match each other
+            image_hash = perceptual_hash(image_bytes) or None
+        except Exception:
+            image_hash = None  # Let the OCR worker report unreadable images
+        cached = ocr_cache.get(image_hash) if image_hash is not None else None
+        metrics.inc('cache_lookups_total', help='Cache lookups by cache and result',
+                    endpoint=current_endpoint.get(), cache='ocr', result='hit' if cached else 'miss')
+        if cached is not None:
+            extracted_text, ocr_ms = cached
+            return extracted_text, {'cached': True, 'ocr_ms_saved': ocr_ms}
+
+        try:
+            result = ocr_pool.ocr(image_bytes)
+        except OCRBusyError as e:
+            metrics.error('ocr_busy')
+            raise QueryInputError(str(e))
+        metrics.stage('ocr_queue', result['queue_ms'] / 1000)
+        metrics.stage('image_preprocess', result['preprocess_ms'] / 1000)
+        metrics.stage('tesseract', result['ocr_ms'] / 1000)
+
+        extracted_text = result.pop('text')
+        if not extracted_text.strip():
+            raise QueryInputError('❌ Could not read handwriting. Please upload a clearer image or retake the photo.')
 
-            print("📄 OCR Extracted Text:", extracted_text)
+        if image_hash is not None:
+            ocr_cache.put(image_hash, extracted_text, result['preprocess_ms'] + result['ocr_ms'])
+
+        print("📄 OCR Extracted Text:", extracted_text)
+        return extracted_text, result
+
+    def process_image_query(self, image_bytes, student_info):
+        """Process image-based queries using enhanced OCR for handwriting"""
+        try:
+            extracted_text, ocr_timing = self.extract_image_text(image_bytes)
             
             # Process the extracted text
-            response = self.process_text_query(extracted_text, student_info)
+            response = self.process_text_query(extracted_text, student_info, origin='image')
             response['extracted_text'] = extracted_text
+            response['ocr_timing'] = ocr_timing
             
             return response
+        except QueryInputError as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
         except Exception as e:
             return {
                 'success': False,
                 'error': f'Image processing failed: {str(e)}'
             }
 
-    def process_voice_query(self, audio_data, student_info):
-        """Process voice-based queries using speech recognition"""
+    def stream_image_query(self, image_bytes, student_info):
+        """Yield the OCR text first, then stream the answer to it"""
         try:
-            # Decode base64 audio data
-            audio_bytes = base64.b64decode(audio_data.split(',')[1])
-            
-            # Create temporary file with proper extension
-            temp_audio_path = None
-            
+            extracted_text, ocr_timing = self.extract_image_text(image_bytes)
+        except QueryInputError as e:
+            yield {'event': 'error', 'error': str(e)}
+            return
+        except Exception as e:
+            yield {'event': 'error', 'error': f'Image processing failed: {str(e)}'}
+            return
+
+        yield {'event': 'extracted_text', 'extracted_text': extracted_text, 'ocr_timing': ocr_timing}
+        yield from self.stream_text_query(extracted_text, student_info, origin='image')
+
+    def extract_pages_text(self, pages):
+        """OCR a multi-page upload region by region.
+
+        Returns (pages, ocr_timing): each page's text, its regions with their
+        boxes and timings, and totals for the whole upload. Pages photographed
+        before come from the OCR cache.
+        """
+        started = time.perf_counter()
+        read = [None] * len(pages)
+        hashes = []
+        for index, page_bytes in enumerate(pages):
+            try:
+                image_hash = perceptual_hash(page_bytes) or None
+            except Exception:
+                image_hash = None
+            cached = ocr_cache.get(image_hash) if image_hash is not None else None
+            metrics.inc('cache_lookups_total', help='Cache lookups by cache and result',
+                        endpoint=current_endpoint.get(), cache='ocr', result='hit' if cached else 'miss')
+            if cached is not None:
+                read[index] = {'text': cached[0], 'cached': True, 'ocr_ms_saved': cached[1]}
+            hashes.append(image_hash)
+
+        pending = [index for index, page in enumerate(read) if page is None]
+        if pending:
+            ocr_started = time.perf_counter()
             try:
-                # Try to convert audio to WAV format using PIL/Pillow audio processing
-                # First, save the original audio
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as temp_original:
-                    temp_original.write(audio_bytes)
-                    temp_original_path = temp_original.name
-                
-                # Convert to WAV using system command (fallback method)
-                temp_wav_path = temp_original_path.replace('.webm', '.wav')
-                
-                try:
-                    # Try using pydub for audio conversion
-                    from pydub import AudioSegment
-                    from pydub.utils import which
-                    
-                    # Load the audio file
-                    if audio_data.startswith('data:audio/webm'):
-                        audio = AudioSegment.from_file(temp_original_path, format="webm")
-                    elif audio_data.startswith('data:audio/mp4'):
-                        audio = AudioSegment.from_file(temp_original_path, format="mp4")
-                    else:
-                        # Try as wav first
-                        audio = AudioSegment.from_file(temp_original_path, format="wav")
-                    
-                    # Export as WAV
-                    audio.export(temp_wav_path, format="wav")
-                    temp_audio_path = temp_wav_path
-                    
-                except ImportError:
-                    # Pydub not available, try direct approach
-                    print("Warning: pydub not installed. Trying direct audio processing...")
-                    
-                    # Rename the file to .wav and hope it works
-                    import shutil
-                    shutil.copy(temp_original_path, temp_wav_path)
-                    temp_audio_path = temp_wav_path
-                
-                except Exception as conversion_error:
-                    print(f"Audio conversion error: {conversion_error}")
-                    # Try using the original file directly
-                    temp_audio_path = temp_original_path
-                
-                # Initialize speech recognizer
-                r = sr.Recognizer()
-                
-                # Adjust for ambient noise and recognition settings
-                with sr.AudioFile(temp_audio_path) as source:
-                    # Adjust for ambient noise
-                    r.adjust_for_ambient_noise(source, duration=0.5)
-                    # Record the audio
-                    audio = r.record(source)
-                
-                # Try multiple recognition services for better accuracy
-                recognized_text = None
-                
-                try:
-                    # Try Google Speech Recognition (free)
-                    recognized_text = r.recognize_google(audio, language='en-IN')  # Indian English
-                except sr.UnknownValueError:
-                    try:
-                        # Fallback to US English
-                        recognized_text = r.recognize_google(audio, language='en-US')
-                    except sr.UnknownValueError:
-                        try:
-                            # Try with different audio settings
-                            recognized_text = r.recognize_google(audio)
-                        except sr.UnknownValueError:
-                            return {
-                                'success': False,
-                                'error': 'Could not understand the audio. Please speak clearly and try again.'
-                            }
-                except sr.RequestError as e:
-                    return {
-                        'success': False,
-                        'error': f'Speech recognition service error: {str(e)}. Please try again later.'
-                    }
-                
-                if not recognized_text:
-                    return {
-                        'success': False,
-                        'error': 'No speech detected. Please speak louder and try again.'
-                    }
-                
-            finally:
-                # Clean up temporary files
-                try:
-                    if temp_audio_path and os.path.exists(temp_audio_path):
-                        os.unlink(temp_audio_path)
-                    if 'temp_original_path' in locals() and os.path.exists(temp_original_path):
-                        os.unlink(temp_original_path)
-                    if 'temp_wav_path' in locals() and temp_wav_path != temp_audio_path and os.path.exists(temp_wav_path):
-                        os.unlink(temp_wav_path)
-                except Exception as cleanup_error:
-                    print(f"Cleanup error: {cleanup_error}")
+                results = ocr_pool.ocr_pages([pages[index] for index in pending])
+            except OCRBusyError as e:
+                metrics.error('ocr_busy')
+                raise QueryInputError(str(e))
+            ocr_wall_ms = round((time.perf_counter() - ocr_started) * 1000, 1)
+
+            for index, result in zip(pending, results):
+                metrics.stage('image_preprocess', result['preprocess_ms'] / 1000)
+                metrics.stage('region_detection', result['segment_ms'] / 1000)
+                metrics.stage('tesseract', result['ocr_ms'] / 1000)
+                result['text'] = '\n'.join(region['text'].strip() for region in result['regions']
+                                           if region['text'].strip())
+                if result['text'] and hashes[index] is not None:
+                    ocr_cache.put(hashes[index], result['text'],
+                                  result['preprocess_ms'] + result['segment_ms'] + result['ocr_ms'])
+                read[index] = result
+        else:
+            ocr_wall_ms = 0.0
+
+        if not any(page['text'] for page in read):
+            raise QueryInputError('❌ Could not read handwriting. Please upload clearer images or retake the photos.')
+
+        for number, page in enumerate(read, 1):
+            page['page'] = number
+        ocr_timing = {
+            'pages': len(read),
+            'cached_pages': len(read) - len(pending),
+            'regions': sum(len(page.get('regions', ())) for page in read),
+            'ocr_wall_ms': ocr_wall_ms,
+            'total_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+        return read, ocr_timing
+
+    def process_pages_query(self, pages, student_info):
+        """Answer every question on a multi-page upload with one completion"""
+        try:
+            read, ocr_timing = self.extract_pages_text(pages)
+
+            extracted_text = merge_pages_text(read)
+            response = self.process_text_query(extracted_text, student_info, origin='pages')
+            response['extracted_text'] = extracted_text
+            response['pages'] = read
+            response['ocr_timing'] = ocr_timing
+
+            return response
+        except QueryInputError as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Image processing failed: {str(e)}'
+            }
+
+    def stream_pages_query(self, pages, student_info):
+        """Yield the text of every page first, then stream one answer to all of it"""
+        try:
+            read, ocr_timing = self.extract_pages_text(pages)
+        except QueryInputError as e:
+            yield {'event': 'error', 'error': str(e)}
+            return
+        except Exception as e:
+            yield {'event': 'error', 'error': f'Image processing failed: {str(e)}'}
+            return
+
+        extracted_text = merge_pages_text(read)
+        yield {'event': 'extracted_text', 'extracted_text': extracted_text, 'pages': read, 'ocr_timing': ocr_timing}
+        yield from self.stream_text_query(extracted_text, student_info, origin='pages')
+
+    def transcribe_audio(self, audio_bytes, mime_type):
+        """Run speech recognition on an uploaded recording.
+
+        Returns (recognized_text, voice_timing); decoding and resampling happen
+        in memory and the recognizer backend is chosen by VOICE_RECOGNIZER.
+        """
+        try:
+            recognized_text, voice_timing = voice_pipeline.transcribe(audio_bytes, mime_type)
+        except VoiceInputError as e:
+            metrics.error('voice_input')
+            raise QueryInputError(str(e))
+        record_voice_timing(voice_timing)
+        return recognized_text, voice_timing
+
+    def process_voice_query(self, audio_bytes, mime_type, student_info):
+        """Process voice-based queries using speech recognition"""
+        try:
+            recognized_text, voice_timing = self.transcribe_audio(audio_bytes, mime_type)
             
             # Process the transcribed text
-            response = self.process_text_query(recognized_text, student_info)
+            response = self.process_text_query(recognized_text, student_info, origin='voice')
             response['transcribed_text'] = recognized_text
+            response['voice_timing'] = voice_timing
             
             return response
             
+        except QueryInputError as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
         except Exception as e:
             print(f"Voice processing error: {str(e)}")
             return {
@@ -384,52 +630,303 @@ transliteration using English script only.
                 'error': f'Voice processing failed: {str(e)}. Please try again or use text input.'
             }
 
+    def process_voice_query_simple(self, audio_bytes, mime_type, student_info):
+        """Simplified voice processing - fallback method"""
+        try:
+            # For now, return a helpful message about voice input
+            return {
+                'success': True,
+                'response': f"I heard your voice message! However, voice-to-text processing needs some additional setup. For now, please type your question in the text box and I'll be happy to help! 🎤➡️📝",
+                'transcribed_text': "[Voice input received - please type your question]",
+                'timestamp': datetime.now().isoformat(),
+                'note': 'Voice processing temporarily disabled - needs FFmpeg installation'
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Voice processing error: {str(e)}'
+            }
+
+    def stream_voice_query(self, audio_bytes, mime_type, student_info):
+        """Yield the transcript first, then stream the answer to it"""
+        try:
+            recognized_text, voice_timing = self.transcribe_audio(audio_bytes, mime_type)
+        except QueryInputError as e:
+            yield {'event': 'error', 'error': str(e)}
+            return
+        except Exception as e:
+            print(f"Voice processing error: {str(e)}")
+            yield {'event': 'error', 'error': f'Voice processing failed: {str(e)}. Please try again or use text input.'}
+            return
+
+        yield {'event': 'transcribed_text', 'transcribed_text': recognized_text, 'voice_timing': voice_timing}
+        yield from self.stream_text_query(recognized_text, student_info, origin='voice')
+
+    def stream_live_voice_query(self, voice_stream, student_info):
+        """Yield the final transcript of a live recording, then stream the answer to it"""
+        try:
+            recognized_text, voice_timing = voice_stream.finish()
+        except VoiceInputError as e:
+            metrics.error('voice_input')
+            yield {'event': 'error', 'error': str(e)}
+            return
+        except Exception as e:
+            print(f"Voice processing error: {str(e)}")
+            yield {'event': 'error', 'error': f'Voice processing failed: {str(e)}. Please try again or use text input.'}
+            return
+
+        record_voice_timing(voice_timing)
+        yield {'event': 'transcribed_text', 'transcribed_text': recognized_text, 'voice_timing': voice_timing}
+        yield from self.stream_text_query(recognized_text, student_info, origin='voice')
+
     def generate_demo_response(self, query, student_info):
-        """Generate enhanced demo responses based on query patterns"""
-        query_lower = query.lower()
-        class_level = student_info.get('class', '').lower()
-        language = student_info.get('language', 'English')
-        student_name = student_info.get('name', 'my friend')
-        
-        # Determine response complexity based on class
-        is_primary = any(x in class_level for x in ['1', '2', '3', '4', '5', 'primary'])
-        is_secondary = any(x in class_level for x in ['6', '7', '8', '9', '10', 'secondary'])
-        is_senior = any(x in class_level for x in ['11', '12', 'senior', 'plus'])
-        
-        # Enhanced responses for different topics
-        if any(word in query_lower for word in ['artificial intelligence', 'ai', 'machine learning']):
-            if is_primary:
-                return f"Hello {student_name}! Artificial Intelligence (AI) is like making computers think and learn like humans! 🤖\n\nThink of it this way:\n- When you play games on a tablet, the computer learns how you play\n- When you ask Alexa or Google something, that's AI helping you\n- AI helps cars drive themselves and helps doctors find diseases\n\nAI is everywhere around us, making our lives easier! It's like having a very smart computer friend who keeps learning new things every day.\n\nWould you like to know about any specific AI things you see around you?"
-            elif is_secondary:
-                return f"Great question, {student_name}! Artificial Intelligence (AI) is a branch of computer science that creates smart machines capable of performing tasks that typically require human intelligence.\n\nKey aspects of AI:\n\n🧠 **What AI does:**\n- Recognizes speech and images\n- Makes decisions based on data\n- Learns from experience (Machine Learning)\n- Solves complex problems\n\n🔧 **Types of AI:**\n- **Narrow AI:** Specific tasks (like Siri, recommendation systems)\n- **General AI:** Human-level intelligence (still being developed)\n\n🌟 **Real-world examples:**\n- Netflix suggesting movies you might like\n- Google Translate converting languages\n- Face recognition in photos\n- Medical diagnosis assistance\n\nAI works by processing lots of data and finding patterns, just like how you learn to recognize your friends' faces by seeing them many times!\n\nWhat specific aspect of AI interests you most?"
-            else:
-                return f"Excellent question, {student_name}! Artificial Intelligence represents one of the most transformative fields in modern computer science and technology.\n\n🎯 **Fundamental Definition:**\nAI encompasses computational systems designed to simulate, replicate, or augment human cognitive processes including learning, reasoning, perception, and decision-making.\n\n🔬 **Core Components:**\n\n**Machine Learning (ML):**\n- Supervised learning (labeled data training)\n- Unsupervised learning (pattern discovery)\n- Reinforcement learning (reward-based optimization)\n\n**Deep Learning:**\n- Neural networks with multiple hidden layers\n- Convolutional Neural Networks (CNNs) for image processing\n- Recurrent Neural Networks (RNNs) for sequence data\n\n**Natural Language Processing (NLP):**\n- Text analysis and generation\n- Sentiment analysis and language translation\n- Conversational AI and chatbots\n\n🚀 **Current Applications:**\n- Computer Vision (autonomous vehicles, medical imaging)\n- Predictive Analytics (financial markets, weather forecasting)\n- Robotics and automation\n- Personalization algorithms\n\n🔮 **Future Implications:**\nAI is driving the Fourth Industrial Revolution, with potential for Artificial General Intelligence (AGI) and eventual technological singularity.\n\nWhich specific domain of AI would you like to explore further - perhaps neural networks, ethical AI, or practical applications in your field of interest?"
-        
-        elif any(word in query_lower for word in ['photosynthesis']):
-            if is_primary:
-                return f"Hi {student_name}! Plants make their own food using sunlight! 🌱☀️\n\nIt's like cooking, but plants use:\n- Sunlight (like heat for cooking)\n- Water (from their roots)\n- Air (through tiny holes in leaves)\n\nWhen plants mix these together, they make sugar (their food) and give us fresh oxygen to breathe!\n\nThat's why we need to take care of plants - they help us breathe! 🌿\n\nDo you have any plants at home you'd like to know more about?"
-            elif is_secondary:
-                return f"Great question, {student_name}! Photosynthesis is how plants make their own food using sunlight energy.\n\n🌿 **The Process:**\n6CO₂ + 6H₂O + light energy → C₆H₁₂O₆ + 6O₂\n\n**What happens:**\n1. **Light absorption:** Chlorophyll in leaves captures sunlight\n2. **Water splitting:** Roots absorb water, which gets broken down\n3. **Carbon dioxide intake:** Stomata (leaf pores) take in CO₂ from air\n4. **Glucose production:** These combine to make glucose (plant food)\n5. **Oxygen release:** O₂ is released as a bonus for us!\n\n**Two main stages:**\n- **Light reactions:** In thylakoids, convert light to chemical energy\n- **Calvin cycle:** In stroma, use that energy to make glucose\n\n🌍 **Why it matters:**\n- Produces oxygen we breathe\n- Forms the base of all food chains\n- Removes CO₂ from atmosphere\n\nThis process happens in chloroplasts - the green parts of plants!\n\nWant to know more about any specific part of this process?"
-            else:
-                return f"Excellent question, {student_name}! Photosynthesis is a complex biochemical process fundamental to life on Earth.\n\n🔬 **Molecular Mechanism:**\n\n**Overall Equation:**\n6CO₂ + 6H₂O + photons → C₆H₁₂O₆ + 6O₂ + 6H₂O\n\n**Phase 1: Light-Dependent Reactions (Thylakoid Membrane)**\n- **Photosystem II (P680):** Water photolysis, oxygen evolution\n- **Electron Transport Chain:** Plastoquinone → Cytochrome b6f → Plastocyanin\n- **Photosystem I (P700):** NADP+ reduction to NADPH\n- **Chemiosmosis:** ATP synthesis via ATP synthase\n\n**Phase 2: Calvin-Benson-Bassham Cycle (Stroma)**\n- **Carboxylation:** RuBisCO catalyzes CO₂ fixation to RuBP\n- **Reduction:** 3-phosphoglycerate → glyceraldehyde-3-phosphate\n- **Regeneration:** RuBP regeneration for cycle continuation\n\n**Regulatory Mechanisms:**\n- Light regulation of enzyme activity\n- Stomatal conductance optimization\n- C4 and CAM adaptations for water/CO₂ efficiency\n\n**Global Significance:**\n- Primary productivity: ~120 Gt C/year globally\n- Atmospheric O₂ maintenance (~21%)\n- Climate regulation through carbon sequestration\n\nWhich aspect interests you most - the biochemical pathways, evolutionary adaptations, or environmental implications?"
-        
-        elif any(word in query_lower for word in ['math', 'mathematics', 'algebra', 'equation', 'solve']):
-            return f"I'd love to help you with mathematics, {student_name}! 📊\n\nFor solving problems effectively:\n\n1️⃣ **Understand the problem** - Read carefully\n2️⃣ **Identify what you know** - List given information\n3️⃣ **Find what you need** - What are you solving for?\n4️⃣ **Choose the right method** - Formula, equation, or strategy\n5️⃣ **Solve step by step** - Show all work\n6️⃣ **Check your answer** - Does it make sense?\n\nFor your class level ({student_info.get('class', 'your level')}), focus on understanding concepts rather than just memorizing formulas.\n\nCan you share the specific math problem you're working on? I'll guide you through it step by step! 🎯"
-        
-        elif any(word in query_lower for word in ['science', 'physics', 'chemistry', 'biology']):
-            return f"Science is amazing, {student_name}! 🔬✨\n\nScience helps us understand how everything works around us - from tiny atoms to massive galaxies!\n\n🧪 **The scientific method:**\n1. Observe something interesting\n2. Ask questions about it\n3. Form a hypothesis (educated guess)\n4. Test it with experiments\n5. Analyze results and draw conclusions\n\nFor {student_info.get('class', 'your level')}, focus on:\n- Making observations\n- Asking \"why\" and \"how\" questions\n- Connecting science to daily life\n- Hands-on experiments when possible\n\nWhat specific science topic or question do you have? Let's explore it together! 🌟"
-        
+        """Answer from the local answer index, or a generic encouraging reply"""
+        return answer_index.lookup(query, student_info, demo=True)
+
+def merge_pages_text(pages):
+    """One question for a whole upload: each page's text blocks in reading order, marked by page.
+
+    A single page with a single block is passed through unchanged, so it asks
+    the same question (and hits the same cache entries) as /api/query/image.
+    """
+    if len(pages) == 1 and len(pages[0].get('regions', ())) <= 1:
+        return pages[0]['text']
+
+    parts = [f'The student uploaded {len(pages)} page{"s" if len(pages) > 1 else ""} of homework. '
+             'Answer each question in order and say which page it is from.']
+    for page in pages:
+        parts.append(f"\n--- Page {page['page']} ---")
+        blocks = [region['text'].strip() for region in page.get('regions', ()) if region['text'].strip()]
+        if len(blocks) > 1:
+            parts.extend(f'[Block {number}]\n{text}' for number, text in enumerate(blocks, 1))
         else:
-            # Generic encouraging response
-            student_class = student_info.get('class', 'your level')
-            return f"That's a wonderful question, {student_name}! 🌟\n\nI can see you're curious and thinking deeply - that's exactly how great learners approach new topics!\n\nFor {student_class} students, I always recommend:\n- Breaking complex topics into smaller parts\n- Connecting new information to what you already know\n- Asking follow-up questions (like you're doing now!)\n- Using examples from your daily life\n\nCould you tell me more specifically what aspect of this topic you'd like to explore? The more details you give me about what you're curious about, the better I can tailor my explanation to help you understand it perfectly!\n\nRemember: Every expert was once a beginner, and every question you ask makes you smarter! 🎯"
+            parts.append(page['text'] or '(no readable text)')
+    return '\n'.join(parts)
 
 # Initialize EduMentor AI
 edu_mentor = EduMentorAI()
 
+# Upload size limits, enforced before the body is buffered
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(15 * 1024 * 1024)))
+MAX_AUDIO_BYTES = int(os.getenv('MAX_AUDIO_BYTES', str(10 * 1024 * 1024)))
+MAX_PAGES = int(os.getenv('MAX_PAGES', '10'))
+MAX_PAGES_BYTES = int(os.getenv('MAX_PAGES_BYTES', str(40 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Overall cap for any request body (base64 JSON is ~4/3 the size of the file)
+app.config['MAX_CONTENT_LENGTH'] = max(MAX_IMAGE_BYTES, MAX_AUDIO_BYTES, MAX_PAGES_BYTES) * 4 // 3 + 64 * 1024
+
+
+class UploadTooLargeError(QueryInputError):
+    """Raised when an upload exceeds its size limit"""
+
+
+def decode_data_url(data_url):
+    """Split a base64 data URL from the JSON API into (bytes, mime type)"""
+    if not data_url:
+        raise QueryInputError('No file data was received. Please try uploading again.')
+    header, _, encoded = data_url.partition(',')
+    try:
+        with metrics.span('base64_decode'):
+            data = base64.b64decode(encoded)
+    except (ValueError, TypeError):
+        raise QueryInputError('The uploaded file could not be decoded. Please try again.')
+    mime_type = header[5:].split(';')[0] if header.startswith('data:') else ''
+    return data, mime_type
+
+
+def read_upload(field, max_bytes):
+    """Read a multipart file field or a raw binary body as (bytes, mime type).
+
+    Oversized uploads are refused from Content-Length before anything is
+    buffered; chunked bodies are read incrementally and cut off at the limit.
+    """
+    if request.content_length is not None and request.content_length > max_bytes + UPLOAD_CHUNK_BYTES:
+        raise UploadTooLargeError(f'File is too large. The limit is {round(max_bytes / (1024 * 1024), 1):g} MB.')
+
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get(field)
+        if upload is None:
+            raise QueryInputError(f'No {field} file was uploaded.')
+        data = upload.read(max_bytes + 1)
+        mime_type = upload.mimetype
+    else:
+        chunks = []
+        size = 0
+        while size <= max_bytes:
+            chunk = request.stream.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        data = b''.join(chunks)
+        mime_type = request.mimetype
+
+    if len(data) > max_bytes:
+        raise UploadTooLargeError(f'File is too large. The limit is {round(max_bytes / (1024 * 1024), 1):g} MB.')
+    if not data:
+        raise QueryInputError(f'No {field} data was received. Please try uploading again.')
+    return data, mime_type
+
+
+def read_pages():
+    """Page images from a multipart upload (repeated `pages` fields) or JSON data URLs in `images`"""
+    if request.content_length is not None and request.content_length > MAX_PAGES_BYTES * 4 // 3 + UPLOAD_CHUNK_BYTES:
+        raise UploadTooLargeError(f'Upload is too large. The limit is {round(MAX_PAGES_BYTES / (1024 * 1024), 1):g} MB.')
+
+    if request.mimetype == 'multipart/form-data':
+        pages = [upload.read(MAX_IMAGE_BYTES + 1) for upload in request.files.getlist('pages')]
+    else:
+        data = request.get_json(silent=True)
+        images = data.get('images') if isinstance(data, dict) else None
+        pages = [decode_data_url(image)[0] for image in images] if isinstance(images, list) else []
+
+    if not pages:
+        raise QueryInputError('No pages were uploaded. Please add at least one photo.')
+    if len(pages) > MAX_PAGES:
+        raise QueryInputError(f'Please upload at most {MAX_PAGES} pages at a time.')
+    if any(len(page) > MAX_IMAGE_BYTES for page in pages):
+        raise UploadTooLargeError(f'A page is too large. The limit is {round(MAX_IMAGE_BYTES / (1024 * 1024), 1):g} MB per page.')
+    if not all(pages):
+        raise QueryInputError('One of the pages was empty. Please try uploading again.')
+    return pages
+
+
+def upload_session_id():
+    """Session ID for upload requests: query string or header, so the body needn't be parsed first"""
+    return (request.args.get('session_id')
+            or request.headers.get('X-Session-Id')
+            or (request.form.get('session_id') if request.mimetype == 'multipart/form-data' else None))
+
+
+def wants_stream():
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+@app.before_request
+def start_request_metrics():
+    current_endpoint.set(request.endpoint or 'unknown')
+    request.metrics_started = time.perf_counter()
+    if request.is_json:
+        # Parse once here so the time is measured; views get the cached result
+        with metrics.span('json_parse'):
+            try:
+                request.get_json()
+            except Exception:
+                pass  # Let the view report the bad body as it always has
+
+@app.before_request
+def set_latency_budget():
+    # Set on every request, since request threads are reused
+    budget = LATENCY_BUDGETS.get(request.endpoint)
+    request_deadline.set(time.monotonic() + budget if budget else None)
+
+@app.before_request
+def admit_request():
+    """Rate-limit and queue query endpoints; answers 429/503 straight away when turned away"""
+    work = WORK_CLASSES.get(request.endpoint)
+    if not ADMISSION_ENABLED or work is None:
+        return None
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data if isinstance(data, dict) else {}
+    # Multipart forms aren't parsed here, so uploads are never buffered before their size check
+    session_id = (data.get('session_id') or request.args.get('session_id')
+                  or request.headers.get('X-Session-Id') or request.remote_addr)
+    items = data.get('queries') or data.get('images')
+    units = len(items) if isinstance(items, list) and items else 1
+
+    started = time.perf_counter()
+    try:
+        request.admission_ticket = admission.admit(work, session_id, units)
+    except AdmissionRejected as e:
+        metrics.inc('admission_rejections_total', help='Requests turned away by admission control',
+                    work=work, reason=e.reason)
+        response = jsonify({
+            'success': False,
+            'error': str(e),
+            'retry_after': round(e.retry_after, 1)
+        })
+        response.status_code = e.status
+        response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+        return response
+    metrics.observe('admission_wait_seconds', time.perf_counter() - started,
+                    help='Time spent waiting for an admission slot', work=work)
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    metrics.inc('requests_total', help='Requests by endpoint and status', endpoint=endpoint,
+                status=response.status_code)
+    started = getattr(request, 'metrics_started', None)
+    if started is not None:
+        # Streaming responses are measured to the first byte
+        elapsed = time.perf_counter() - started
+        metrics.observe('request_duration_seconds', elapsed,
+                        help='Request latency by endpoint', endpoint=endpoint)
+        if elapsed > LATENCY_BUDGETS.get(endpoint, float('inf')):
+            metrics.inc('latency_budget_exceeded_total', help='Requests that took longer than their budget',
+                        endpoint=endpoint)
+    if response.status_code >= 400:
+        metrics.error(f'http_{response.status_code}', endpoint)
+    ticket = getattr(request, 'admission_ticket', None)
+    if ticket is not None:
+        # Streams keep their slot until the last byte is sent
+        response.call_on_close(ticket.release)
+    return response
+
+@app.teardown_request
+def release_admission(error=None):
+    # Safety net if the response never reached after_request; release is idempotent
+    ticket = getattr(request, 'admission_ticket', None)
+    if ticket is not None and error is not None:
+        ticket.release()
+
+@app.after_request
+def compress_response(response):
+    return compressor.compress_response(response, request.headers.get('Accept-Encoding'))
+
+@app.url_defaults
+def version_static_urls(endpoint, values):
+    """url_for('static', ...) gets ?v=<content hash>, so browsers may keep the file for a year"""
+    if endpoint == 'static' and 'v' not in values:
+        version = static_assets.version(values['filename'])
+        if version:
+            values['v'] = version
+
+def serve_static(filename):
+    """Static files from memory, pre-compressed, with ETag/304 and long caching for hashed URLs"""
+    asset = static_assets.get(filename)
+    if asset is None:
+        return app.send_static_file(filename)
+
+    coding = compressor.negotiate(request.headers.get('Accept-Encoding')) if compressor.enabled else None
+    coding = coding if coding in asset.bodies else 'identity'
+    # The content is the same in every coding, so the validator is weak
+    not_modified = request.if_none_match.contains_weak(asset.digest)
+    static_assets.count(not_modified)
+    if not_modified:
+        response = Response(status=304)
+    else:
+        response = Response(asset.bodies[coding], mimetype=asset.mimetype)
+        if coding != 'identity':
+            response.headers['Content-Encoding'] = coding
+    response.set_etag(asset.digest, weak=True)
+    response.vary.add('Accept-Encoding')
+    if request.args.get('v') == asset.digest:
+        response.headers['Cache-Control'] = f'public, max-age={static_assets.max_age}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+app.view_functions['static'] = serve_static
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    response = make_response(render_template('index.html'))
+    if static_assets.enabled:
+        # Revalidated on each visit; an unchanged page costs a 304 instead of the full HTML
+        response.headers['Cache-Control'] = 'no-cache'
+        response.add_etag()
+        return response.make_conditional(request)
+    return response
 
 @app.route('/api/student/register', methods=['POST'])
 def register_student():
@@ -443,6 +940,7 @@ def register_student():
             'board': data.get('board', ''),
             'language': data.get('language', 'English'),
             'name': data.get('name', ''),
+            'session_id': session_id,
             'registered_at': datetime.now().isoformat()
         }
         
@@ -467,13 +965,13 @@ def handle_text_query():
         session_id = data.get('session_id')
         query = data.get('query')
         
-        if not session_id or session_id not in student_sessions:
+        student_info = student_sessions.get(session_id) if session_id else None
+        if student_info is None:
             return jsonify({
                 'success': False,
                 'error': 'Student session not found. Please register first.'
             }), 400
         
-        student_info = student_sessions[session_id]
         response = edu_mentor.process_text_query(query, student_info)
         
         return jsonify(response)
@@ -491,16 +989,22 @@ def handle_image_query():
         session_id = data.get('session_id')
         image_data = data.get('image_data')
         
-        if not session_id or session_id not in student_sessions:
+        student_info = student_sessions.get(session_id) if session_id else None
+        if student_info is None:
             return jsonify({
                 'success': False,
                 'error': 'Student session not found. Please register first.'
             }), 400
         
-        student_info = student_sessions[session_id]
-        response = edu_mentor.process_image_query(image_data, student_info)
+        image_bytes, _ = decode_data_url(image_data)
+        response = edu_mentor.process_image_query(image_bytes, student_info)
         
         return jsonify(response)
+    except QueryInputError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -515,36 +1019,601 @@ def handle_voice_query():
         session_id = data.get('session_id')
         audio_data = data.get('audio_data')
         
-        if not session_id or session_id not in student_sessions:
+        student_info = student_sessions.get(session_id) if session_id else None
+        if student_info is None:
             return jsonify({
                 'success': False,
                 'error': 'Student session not found. Please register first.'
             }), 400
         
-        student_info = student_sessions[session_id]
+        audio_bytes, mime_type = decode_data_url(audio_data)
+
           # Try full voice processing first, fallback to simple if it fails
 
         try:
 
-            response = edu_mentor.process_voice_query(audio_data, student_info)
+            response = edu_mentor.process_voice_query(audio_bytes, mime_type, student_info)
 
         except Exception as voice_error:
 
             print(f"Full voice processing failed: {voice_error}")
 
-            response = edu_mentor.process_voice_query_simple(audio_data, student_info)
+            response = edu_mentor.process_voice_query_simple(audio_bytes, mime_type, student_info)
         
         return jsonify(response)
+    except QueryInputError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def event_stream(events):
+    """Serialize answer events as Server-Sent Events, adding TTFB and total timings"""
+    started = time.perf_counter()
+
+    def generate():
+        first_byte = None
+        first_token = None
+        for event in events:
+            name = event.pop('event')
+            now = time.perf_counter()
+            if first_byte is None:
+                first_byte = now
+            if name == 'token' and first_token is None:
+                first_token = now
+            if name == 'done':
+                event['timing'] = {
+                    'ttfb_ms': round((first_byte - started) * 1000, 1),
+                    'first_token_ms': round(((first_token or now) - started) * 1000, 1),
+                    'total_ms': round((now - started) * 1000, 1)
+                }
+            yield f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering tokens
+        }
+    )
+
+@app.route('/api/query/text/stream', methods=['POST'])
+def handle_text_query_stream():
+    """Stream the answer to a text query token by token"""
+    data = request.json
+    session_id = data.get('session_id')
+    query = data.get('query')
+
+    student_info = student_sessions.get(session_id) if session_id else None
+    if student_info is None:
+        return jsonify({
+            'success': False,
+            'error': 'Student session not found. Please register first.'
+        }), 400
+
+    return event_stream(edu_mentor.stream_text_query(query, student_info))
+
+def batch_results(queries, student_info):
+    """Answer a list of questions in parallel.
+
+    Repeated questions are answered once. Yields (indexes, result) as each
+    distinct question finishes; a failed question only fails its own items.
+    """
+    groups = {}
+    for index, query in enumerate(queries):
+        if not isinstance(query, str) or not query.strip():
+            yield [index], {'success': False, 'error': 'Empty question'}
+            continue
+        groups.setdefault(normalize_query(query), []).append(index)
+
+    futures = {
+        batch_executor.submit(
+            contextvars.copy_context().run, edu_mentor.answer_text_query, queries[indexes[0]], student_info
+        ): indexes
+        for indexes in groups.values()
+    }
+    for future in as_completed(futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        yield futures[future], result
+
+
+def batch_events(queries, student_info):
+    """Stream one result event per question as it completes, then a summary"""
+    failed = 0
+    unique = 0
+    for indexes, result in batch_results(queries, student_info):
+        unique += 1
+        for index in indexes:
+            if not result.get('success'):
+                failed += 1
+            yield dict(result, event='result', index=index, query=queries[index])
+    yield {'event': 'done', 'total': len(queries), 'unique': unique, 'failed': failed}
+
+@app.route('/api/query/batch', methods=['POST'])
+def handle_batch_query():
+    """Answer a list of questions (e.g. a pasted worksheet) for one session.
+
+    Returns results in input order, or streams them as they finish with
+    ?stream=1 (or "stream": true).
+    """
+    try:
+        data = request.json or {}
+        session_id = data.get('session_id')
+        queries = data.get('queries')
+
+        student_info = student_sessions.get(session_id) if session_id else None
+        if student_info is None:
+            return jsonify({
+                'success': False,
+                'error': 'Student session not found. Please register first.'
+            }), 400
+
+        if not isinstance(queries, list) or not queries:
+            return jsonify({
+                'success': False,
+                'error': 'Please send a list of questions in "queries".'
+            }), 400
+        if len(queries) > BATCH_MAX_QUERIES:
+            return jsonify({
+                'success': False,
+                'error': f'Too many questions. Please send at most {BATCH_MAX_QUERIES} at a time.'
+            }), 400
+
+        if wants_stream() or data.get('stream'):
+            return event_stream(batch_events(queries, student_info))
+
+        results = [None] * len(queries)
+        unique = 0
+        for indexes, result in batch_results(queries, student_info):
+            unique += 1
+            for index in indexes:
+                results[index] = dict(result, index=index, query=queries[index])
+        return jsonify({
+            'success': True,
+            'results': results,
+            'total': len(queries),
+            'unique': unique,
+            'failed': sum(1 for result in results if not result.get('success'))
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/query/image/stream', methods=['POST'])
+def handle_image_query_stream():
+    """Stream the OCR text and then the answer for an image query"""
+    data = request.json
+    session_id = data.get('session_id')
+    image_data = data.get('image_data')
+
+    student_info = student_sessions.get(session_id) if session_id else None
+    if student_info is None:
+        return jsonify({
+            'success': False,
+            'error': 'Student session not found. Please register first.'
+        }), 400
+
+    try:
+        image_bytes, _ = decode_data_url(image_data)
+    except QueryInputError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    return event_stream(edu_mentor.stream_image_query(image_bytes, student_info))
+
+@app.route('/api/query/voice/stream', methods=['POST'])
+def handle_voice_query_stream():
+    """Stream the transcript and then the answer for a voice query"""
+    data = request.json
+    session_id = data.get('session_id')
+    audio_data = data.get('audio_data')
+
+    student_info = student_sessions.get(session_id) if session_id else None
+    if student_info is None:
+        return jsonify({
+            'success': False,
+            'error': 'Student session not found. Please register first.'
+        }), 400
+
+    try:
+        audio_bytes, mime_type = decode_data_url(audio_data)
+    except QueryInputError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    return event_stream(edu_mentor.stream_voice_query(audio_bytes, mime_type, student_info))
+
+@app.route('/api/query/image/upload', methods=['POST'])
+def handle_image_upload():
+    """Handle image queries sent as multipart/form-data or a raw binary body"""
+    try:
+        session_id = upload_session_id()
+        student_info = student_sessions.get(session_id) if session_id else None
+        if student_info is None:
+            return jsonify({
+                'success': False,
+                'error': 'Student session not found. Please register first.'
+            }), 400
+
+        image_bytes, _ = read_upload('image', MAX_IMAGE_BYTES)
+
+        if wants_stream():
+            return event_stream(edu_mentor.stream_image_query(image_bytes, student_info))
+        return jsonify(edu_mentor.process_image_query(image_bytes, student_info))
+    except UploadTooLargeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
+    except QueryInputError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/query/voice/upload', methods=['POST'])
+def handle_voice_upload():
+    """Handle voice queries sent as multipart/form-data or a raw binary body"""
+    try:
+        session_id = upload_session_id()
+        student_info = student_sessions.get(session_id) if session_id else None
+        if student_info is None:
+            return jsonify({
+                'success': False,
+                'error': 'Student session not found. Please register first.'
+            }), 400
+
+        audio_bytes, mime_type = read_upload('audio', MAX_AUDIO_BYTES)
+
+        if wants_stream():
+            return event_stream(edu_mentor.stream_voice_query(audio_bytes, mime_type, student_info))
+        return jsonify(edu_mentor.process_voice_query(audio_bytes, mime_type, student_info))
+    except UploadTooLargeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
+    except QueryInputError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/query/pages', methods=['POST'])
+def handle_pages_query():
+    """Handle multi-page homework: every page's questions answered in one reply"""
+    try:
+        data = request.get_json(silent=True) if request.is_json else None
+        session_id = data.get('session_id') if isinstance(data, dict) else upload_session_id()
+        student_info = student_sessions.get(session_id) if session_id else None
+        if student_info is None:
+            return jsonify({
+                'success': False,
+                'error': 'Student session not found. Please register first.'
+            }), 400
+
+        pages = read_pages()
+
+        if wants_stream():
+            return event_stream(edu_mentor.stream_pages_query(pages, student_info))
+        return jsonify(edu_mentor.process_pages_query(pages, student_info))
+    except UploadTooLargeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
+    except QueryInputError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+def submit_job(kind, field, max_bytes):
+    """Queue an image or voice query as a background job and answer 202 with its ID.
+
+    Takes the same bodies as the existing endpoints: JSON with a base64 data
+    URL in image_data/audio_data, or a multipart/raw upload with the session
+    ID in the query string or X-Session-Id.
+    """
+    try:
+        data = request.get_json(silent=True) if request.is_json else None
+        if isinstance(data, dict):
+            session_id = data.get('session_id')
+        else:
+            data = None
+            session_id = upload_session_id()
+
+        student_info = student_sessions.get(session_id) if session_id else None
+        if student_info is None:
+            return jsonify({
+                'success': False,
+                'error': 'Student session not found. Please register first.'
+            }), 400
+
+        if data is not None:
+            file_bytes, mime_type = decode_data_url(data.get(f'{field}_data'))
+            if len(file_bytes) > max_bytes:
+                raise UploadTooLargeError(f'File is too large. The limit is {round(max_bytes / (1024 * 1024), 1):g} MB.')
+        else:
+            file_bytes, mime_type = read_upload(field, max_bytes)
+
+        if kind == 'image':
+            events = lambda: edu_mentor.stream_image_query(file_bytes, student_info)
+        else:
+            events = lambda: edu_mentor.stream_voice_query(file_bytes, mime_type, student_info)
+        job_id = job_queue.submit(kind, session_id, events)
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'poll_url': f'/api/jobs/{job_id}',
+            'stream_url': f'/api/jobs/{job_id}/stream'
+        }), 202
+    except JobQueueFull as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    except UploadTooLargeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
+    except QueryInputError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/jobs/image', methods=['POST'])
+def submit_image_job():
+    """Queue an image query; returns a job ID straight away"""
+    return submit_job('image', 'image', MAX_IMAGE_BYTES)
+
+@app.route('/api/jobs/voice', methods=['POST'])
+def submit_voice_job():
+    """Queue a voice query; returns a job ID straight away"""
+    return submit_job('voice', 'audio', MAX_AUDIO_BYTES)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a job: status, then extracted_text/transcribed_text, then the growing response"""
+    state = job_queue.get(job_id)
+    if state is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found. It may have expired.'
+        }), 404
+    return jsonify(dict(state, success=state['status'] != 'error'))
+
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+def stream_job(job_id):
+    """Stream a job's events as SSE, replaying anything that already happened"""
+    if job_queue.get(job_id) is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found. It may have expired.'
+        }), 404
+    return event_stream(job_queue.events(job_id, timeout=float(os.getenv('JOB_STREAM_TIMEOUT', '300'))))
+
+VOICE_SOCKET_IDLE = float(os.getenv('VOICE_SOCKET_IDLE', '10'))
+VOICE_SOCKET_BUDGET = float(os.getenv('LATENCY_BUDGET_VOICE_SOCKET', '30'))
+
+
+def handle_voice_socket(ws):
+    """Live voice queries over a WebSocket.
+
+    The client sends {"type": "start", "session_id": ..., "sample_rate": 16000},
+    then 16-bit mono PCM chunks as binary messages, and optionally
+    {"type": "stop"}. The server answers with JSON events: ready, speech_start,
+    partial, speech_end, transcribed_text, then the same token/done/error
+    events as the SSE endpoints. The answer starts as soon as end of speech is
+    detected, without waiting for the client to stop recording.
+    """
+    def send(event):
+        ws.send(json.dumps(event))
+
+    try:
+        start = json.loads(ws.receive(timeout=VOICE_SOCKET_IDLE) or '{}')
+    except (TypeError, ValueError):
+        start = {}
+    session_id = start.get('session_id')
+    student_info = student_sessions.get(session_id) if session_id else None
+    if start.get('type') != 'start' or student_info is None:
+        send({'event': 'error', 'error': 'Student session not found. Please register first.'})
+        return
+
+    try:
+        sample_rate = int(start.get('sample_rate') or 16000)
+    except (TypeError, ValueError):
+        sample_rate = 0
+    if not 8000 <= sample_rate <= 48000:
+        send({'event': 'error', 'error': 'Unsupported sample rate. Please send 16-bit mono audio at 8-48 kHz.'})
+        return
+
+    from voice_stream import VoiceStream
+
+    voice_stream = VoiceStream(
+        voice_pipeline,
+        sample_rate=sample_rate,
+        partial_interval=float(os.getenv('VOICE_PARTIAL_INTERVAL', '1.5')),
+        max_seconds=float(os.getenv('VOICE_MAX_SECONDS', '30'))
+    )
+    send({'event': 'ready'})
+
+    received = 0
+    idle_since = time.monotonic()
+    while not voice_stream.ended:
+        message = ws.receive(timeout=0.1)
+        if message is None:
+            if time.monotonic() - idle_since > VOICE_SOCKET_IDLE:
+                break
+            events = voice_stream.poll()
+        elif isinstance(message, (bytes, bytearray)):
+            idle_since = time.monotonic()
+            received += len(message)
+            if received > MAX_AUDIO_BYTES:
+                voice_stream.end()
+                events = [{'event': 'speech_end'}]
+            else:
+                events = voice_stream.feed(bytes(message))
+        else:
+            idle_since = time.monotonic()
+            try:
+                control = json.loads(message)
+            except ValueError:
+                control = {}
+            if control.get('type') == 'stop':
+                voice_stream.end()
+                events = [{'event': 'speech_end'}]
+            else:
+                events = []
+        for event in events:
+            send(event)
+
+    # Recognizing the rest of the speech and answering share one budget from here
+    request_deadline.set(time.monotonic() + VOICE_SOCKET_BUDGET)
+    for event in edu_mentor.stream_live_voice_query(voice_stream, student_info):
+        send(event)
+
+
+if sock is not None:
+    sock.route('/api/query/voice/ws')(handle_voice_socket)
+
+@app.errorhandler(413)
+def request_too_large(error):
+    """Return JSON instead of an HTML page when a body exceeds MAX_CONTENT_LENGTH"""
+    return jsonify({
+        'success': False,
+        'error': 'Upload is too large. Please send a smaller file.'
+    }), 413
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Report cache and worker statistics"""
+    return jsonify({
+        'success': True,
+        'response_cache': response_cache.stats(),
+        'upstream': upstream.stats(),
+        'sessions': student_sessions.stats(),
+        'ocr': ocr_pool.stats(),
+        'ocr_cache': ocr_cache.stats(),
+        'voice': voice_pipeline.stats(),
+        'answer_index': answer_index.stats(),
+        'prompts': prompt_registry.stats(),
+        'conversation_memory': conversation_memory.stats(),
+        'admission': admission.stats(),
+        'jobs': job_queue.stats(),
+        'compression': compressor.stats(),
+        'model_tiers': model_router.stats(),
+        'static': static_assets.stats()
+    })
+
+@app.route('/healthz', methods=['GET'])
+def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readiness():
+    """Readiness probe: 503 while draining or when a dependency isn't usable"""
+    checks = {
+        'accepting': not shutting_down.is_set(),
+    }
+    try:
+        len(student_sessions)
+        checks['session_store'] = True
+    except Exception as e:
+        print(f"Readiness check: session store unavailable: {e}")
+        checks['session_store'] = False
+    ready = all(checks.values())
+    return jsonify({
+        'status': 'ready' if ready else 'unavailable',
+        'checks': checks,
+        'pid': os.getpid(),
+        'warmed': sorted(warmed),
+        'ocr_pending': ocr_pool.pending,
+        'upstream_in_flight': upstream.in_flight,
+        # Without a key or with an open breaker the worker still serves local answers, so neither makes it unready
+        'upstream_configured': bool(upstream.api_key),
+        'upstream_breaker': upstream.breaker.state
+    }), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text-format metrics: per-stage latency histograms and counters"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def admin_allowed():
+    """With ADMIN_TOKEN set, the X-Admin-Token header must match; without it, only local requests are allowed"""
+    token = os.getenv('ADMIN_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), token.encode())
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/api/profiler', methods=['GET', 'POST'])
+def handle_profiler():
+    """Start/stop the sampling profiler (POST {"enabled": true, "interval_ms": 10}) or read it (GET)"""
+    if not admin_allowed():
+        return jsonify({
+            'success': False,
+            'error': 'Admin token required.'
+        }), 403
+
+    if request.method == 'POST':
+        data = request.json or {}
+        if data.get('enabled'):
+            interval_ms = float(data.get('interval_ms') or 10)
+            profiler.start(interval=max(1.0, interval_ms) / 1000, reset=data.get('reset', True))
+        else:
+            profiler.stop()
+
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    return jsonify({'success': True, 'profiler': profiler.report()})
+
 @app.route('/api/student/info/<session_id>', methods=['GET'])
 def get_student_info(session_id):
     """Get student information"""
-    if session_id not in student_sessions:
+    student_info = student_sessions.get(session_id)
+    if student_info is None:
         return jsonify({
             'success': False,
             'error': 'Student session not found'
@@ -552,9 +1621,115 @@ def get_student_info(session_id):
     
     return jsonify({
         'success': True,
-        'student_info': student_sessions[session_id]
+        'student_info': student_info
     })
 
+def log_startup():
+    """Print configuration warnings once the app is being served, not at import"""
+    if sock is None:
+        print("Warning: flask-sock not installed. Live voice input is disabled; recordings are uploaded instead.")
+    if not upstream.api_key:
+        print("WARNING: OPENAI_API_KEY not found in environment variables!")
+        print("Please set your OpenAI API key in a .env file or environment variable.")
+    else:
+        print("✓ OpenAI API key loaded successfully")
+
+
+# Libraries each kind of query needs. Importing main.py loads none of them;
+# warm_up() loads those named in WARM_UP ahead of the first request.
+WARM_UP_COMPONENTS = {
+    'text': lambda: upstream.client,
+    'image': ocr_pool.warm_up,
+    'voice': voice_pipeline.warm_up,
+}
+warmed = set()
+
+
+def warm_up(components=None):
+    """Load the libraries for WARM_UP components (text, image, voice, all or none)"""
+    if components is None:
+        components = os.getenv('WARM_UP', 'text')
+    names = list(WARM_UP_COMPONENTS) if components == 'all' else [
+        name.strip() for name in components.split(',') if name.strip() and name.strip() != 'none'
+    ]
+    for name in names:
+        if name in warmed:
+            continue
+        started = time.perf_counter()
+        try:
+            WARM_UP_COMPONENTS[name]()
+        except KeyError:
+            print(f"Unknown WARM_UP component {name!r}; choose from {', '.join(WARM_UP_COMPONENTS)}")
+            continue
+        except Exception as e:
+            # A missing optional dependency shows up again on first use with a proper error
+            print(f"Warm-up of {name} failed: {e}")
+        warmed.add(name)
+        print(f"🔥 Warmed up {name} in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+def start_warm_up(components=None):
+    """Warm up in a background thread so the server starts accepting requests at once"""
+    thread = threading.Thread(target=warm_up, args=(components,), name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+# Set once the process starts shutting down; /readyz then reports 503
+shutting_down = threading.Event()
+_drained = threading.Event()
+_drain_lock = threading.Lock()
+
+
+def reset_after_fork():
+    """Drop handles a forked worker must not share with the master process.
+
+    With gunicorn's preload_app the app is imported once in the master and
+    forked. SQLite connections and pooled HTTP connections opened there are
+    closed here and reopened lazily in each worker.
+    """
+    for component in (student_sessions, conversation_memory.store, job_queue.store, ocr_cache, upstream):
+        component.close()
+
+
+def drain(timeout=30.0):
+    """Stop taking work and let in-flight OCR, batch, memory and upstream calls finish"""
+    with _drain_lock:
+        if _drained.is_set():
+            return
+        _drained.set()
+    shutting_down.set()
+    started = time.monotonic()
+    print(f"Draining worker {os.getpid()}: {ocr_pool.pending} OCR jobs, {upstream.in_flight} upstream calls in flight")
+    batch_executor.shutdown(wait=True)
+    job_queue.shutdown(wait=True)
+    ocr_pool.shutdown(wait=True)
+    try:
+        conversation_memory.flush(timeout=max(0.1, timeout - (time.monotonic() - started)))
+    except Exception as e:
+        print(f"Conversation memory flush failed: {e}")
+    while upstream.in_flight and time.monotonic() - started < timeout:
+        time.sleep(0.05)
+    upstream.close()
+    print(f"Worker {os.getpid()} drained in {time.monotonic() - started:.1f}s")
+
+
+def create_app(warm=True):
+    """Return the app for a production WSGI server (see wsgi.py and gunicorn.conf.py).
+
+    Components are built when this module is imported, which loads prompts
+    and the answer index but none of the OpenAI, imaging or audio libraries.
+    With warm=True those named in WARM_UP load in a background thread; a
+    preforking server should pass warm=False and call warm_up() in the
+    master instead, so workers don't fork mid-import. The server calls
+    reset_after_fork() in each new worker and drain() when a worker stops.
+    """
+    log_startup()
+    if warm:
+        start_warm_up()
+    return app
+
+
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist
     os.makedirs('templates', exist_ok=True)
@@ -593,8 +1768,11 @@ if __name__ == '__main__':
     # For development (current setup)
     # Run Flask development server (works with IP access)
 
+    print("For production, run: gunicorn -c gunicorn.conf.py wsgi:app")
+    log_startup()
+    start_warm_up()
     app.run(
-        debug=True, 
+        debug=os.getenv('FLASK_DEBUG') == '1',
         host='0.0.0.0',  # Allow external connections
         port=5000,
         threaded=True    # Handle multiple requests
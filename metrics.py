@@ -0,0 +1,140 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# The endpoint being served, so spans deep in the call stack are labelled with it.
+# Work handed to thread pools should run in contextvars.copy_context() to keep it.
+current_endpoint = contextvars.ContextVar('current_endpoint', default='none')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return 1 if value else 0
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process counters and latency histograms rendered in Prometheus text format.
+
+    Everything is keyed by (metric name, sorted label pairs) behind one lock,
+    which keeps recording cheap. Stats from other components (caches, pools)
+    are pulled in through collectors only when /metrics is scraped.
+    """
+
+    def __init__(self, prefix='edumentor'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}    # name -> {labels: value}
+        self._histograms = {}  # name -> {labels: Histogram}
+        self._help = {}
+        self._collectors = []
+
+    def inc(self, name, amount=1, help='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name, seconds, help='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+            if help:
+                self._help.setdefault(name, help)
+
+    def stage(self, stage, seconds, endpoint=None):
+        """Record how long one stage of a request took"""
+        self.observe('stage_duration_seconds', seconds, help='Time spent in each request stage',
+                     endpoint=endpoint or current_endpoint.get(), stage=stage)
+
+    @contextmanager
+    def span(self, stage):
+        """Time the enclosed block as a stage of the current request"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage(stage, time.perf_counter() - started)
+
+    def error(self, kind, endpoint=None):
+        self.inc('errors_total', help='Errors by endpoint and type',
+                 endpoint=endpoint or current_endpoint.get(), type=kind)
+
+    def add_collector(self, name, collect):
+        """Expose a component's stats() dict as gauges named <prefix>_<name>_<field>"""
+        self._collectors.append((name, collect))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f'{self.prefix}_{name}'
+                lines.append(f'# HELP {full} {self._help.get(name, name)}')
+                lines.append(f'# TYPE {full} counter')
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{full}{_labels(labels)} {_number(value)}')
+
+            for name, series in sorted(self._histograms.items()):
+                full = f'{self.prefix}_{name}'
+                lines.append(f'# HELP {full} {self._help.get(name, name)}')
+                lines.append(f'# TYPE {full} histogram')
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{full}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+                    lines.append(f'{full}_sum{_labels(labels)} {histogram.total!r}')
+                    lines.append(f'{full}_count{_labels(labels)} {histogram.count}')
+
+        for component, collect in self._collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                print(f"Metrics collector {component} failed: {e}")
+                continue
+            for field, value in sorted(stats.items()):
+                # One level of nesting (e.g. per-queue stats) becomes <field>_<key>
+                items = sorted(value.items()) if isinstance(value, dict) else [(None, value)]
+                for key, item in items:
+                    if isinstance(item, (int, float)) and not isinstance(item, bool):
+                        full = f'{self.prefix}_{component}_{field}' + (f'_{key}' if key else '')
+                        lines.append(f'# TYPE {full} gauge')
+                        lines.append(f'{full} {_number(item)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
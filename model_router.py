@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import threading
+
+# Phrases that mark work needing a longer, more careful answer
+HARD_PATTERN = re.compile(
+    r'\b(deriv\w*|prove|proof|theorem|integra\w*|differentiat\w*|calculate|evaluate|solve|equations?|formula\w*|'
+    r'numericals?|analy[sz]e|critically|justify|mechanism|compare|step[- ]by[- ]step)\b'
+)
+MATH_PATTERN = re.compile(r'[=^√∫∑π]|\d\s*[-+*/×÷]\s*\d')
+SIMPLE_PATTERN = re.compile(r'^(what is|what are|who is|who was|define|meaning of|name)\b')
+CLASS_PATTERN = re.compile(r'(\d{1,2})')
+
+
+class Tier:
+    """One row of the tier table: the model and limits used for a band of scores"""
+
+    def __init__(self, name, model='gpt-3.5-turbo', max_tokens=1000, temperature=0.7, max_score=None):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.max_score = max_score
+        self.routed = 0
+        self.calls = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.total_first_token_seconds = 0.0
+        self.streamed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+def grade_level(class_level):
+    """Numeric level for a class name: 'Class 7' -> 7, Undergraduate -> 13, Postgraduate -> 15"""
+    text = (class_level or '').strip().lower()
+    if text.startswith(('post', 'pg', 'master')):
+        return 15
+    if text.startswith(('under', 'ug', 'bachelor', 'college')):
+        return 13
+    match = CLASS_PATTERN.search(text)
+    return int(match.group(1)) if match else None
+
+
+class ModelRouter:
+    """Picks the model, max_tokens and temperature for a question from a tier table.
+
+    Each question is scored locally in microseconds:
+    - points for the student's class level
+    - points for the question's length
+    - points for hard-work keywords (derive, prove, solve...) and maths
+    - points for OCR origin, since extracted text is often several questions
+    - a point off for short "what is / define" questions
+    The first tier whose max_score covers the score is used, and the last tier
+    takes everything above. With routing off, every question uses the default
+    tier. Latency and token use are recorded per tier, so the table can be
+    tuned from /api/stats and /metrics.
+    """
+
+    def __init__(self, tiers=None, default='standard', enabled=True):
+        self.tiers = tiers or [Tier(default)]
+        self.by_name = {tier.name: tier for tier in self.tiers}
+        self.default = self.by_name.get(default, self.tiers[-1])
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Load the tier table from MODEL_TIERS (JSON); MODEL_ROUTING=0 always uses the default tier"""
+        path = os.getenv('MODEL_TIERS', os.path.join('config', 'model_tiers.json'))
+        enabled = os.getenv('MODEL_ROUTING', '1') != '0'
+        try:
+            with open(path, encoding='utf-8') as f:
+                table = json.load(f)
+            tiers = [
+                Tier(row['name'], row['model'], int(row['max_tokens']), float(row['temperature']), row.get('max_score'))
+                for row in table['tiers']
+            ]
+            return cls(tiers, default=table.get('default', 'standard'), enabled=enabled)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Model tiers unavailable ({e}); every question uses gpt-3.5-turbo with 1000 tokens")
+            return cls(enabled=False)
+
+    def score(self, query, student_info, origin='text'):
+        """Difficulty score for a question; higher means a bigger model and a longer answer"""
+        text = query.strip().lower()
+        words = len(text.split())
+
+        level = grade_level(student_info.get('class'))
+        if level is None:
+            score = 1
+        elif level <= 5:
+            score = 0
+        elif level <= 8:
+            score = 1
+        elif level <= 10:
+            score = 2
+        elif level <= 12:
+            score = 3
+        else:
+            score = 4 if level < 15 else 5
+
+        score += 0 if words <= 12 else 1 if words <= 40 else 2 if words <= 100 else 3
+        if HARD_PATTERN.search(text):
+            score += 2
+        if MATH_PATTERN.search(text):
+            score += 1
+        if text.count('?') >= 2:
+            score += 1
+        if origin in ('image', 'pages'):
+            score += 1
+        if words <= 12 and SIMPLE_PATTERN.match(text):
+            score -= 1
+        return max(0, score)
+
+    def route(self, query, student_info, origin='text'):
+        """The tier to answer a question with"""
+        if not self.enabled:
+            tier = self.default
+        else:
+            score = self.score(query, student_info, origin)
+            tier = next((tier for tier in self.tiers if tier.max_score is not None and score <= tier.max_score),
+                        self.tiers[-1])
+        with self._lock:
+            tier.routed += 1
+        return tier
+
+    def record(self, tier, seconds, prompt_tokens=0, completion_tokens=0, first_token_seconds=None, failed=False):
+        """Record one upstream call made for a tier"""
+        with self._lock:
+            if failed:
+                tier.failures += 1
+                return
+            tier.calls += 1
+            tier.total_seconds += seconds
+            tier.prompt_tokens += prompt_tokens or 0
+            tier.completion_tokens += completion_tokens or 0
+            if first_token_seconds is not None:
+                tier.streamed += 1
+                tier.total_first_token_seconds += first_token_seconds
+
+    def stats(self):
+        """Return each tier's settings, traffic, latency and token use"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'default': self.default.name,
+                'tiers': {
+                    tier.name: {
+                        'model': tier.model,
+                        'max_tokens': tier.max_tokens,
+                        'temperature': tier.temperature,
+                        'routed': tier.routed,
+                        'calls': tier.calls,
+                        'failures': tier.failures,
+                        'avg_latency_ms': round(tier.total_seconds / tier.calls * 1000, 1) if tier.calls else 0.0,
+                        'avg_first_token_ms': round(tier.total_first_token_seconds / tier.streamed * 1000, 1)
+                        if tier.streamed else 0.0,
+                        'prompt_tokens': tier.prompt_tokens,
+                        'completion_tokens': tier.completion_tokens,
+                        'avg_completion_tokens': round(tier.completion_tokens / tier.calls, 1) if tier.calls else 0.0,
+                    }
+                    for tier in self.tiers
+                },
+            }
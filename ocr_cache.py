@@ -0,0 +1,196 @@
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+HASH_SIZE = 16      # 16x16 grid = 256 bits
+HASH_WORK_WIDTH = 512
+
+
+def perceptual_hash(image_bytes, hash_size=HASH_SIZE):
+    """Perceptual hash of where the ink is on a page, as an int.
+
+    A plain image hash is dominated by the page outline and lighting, so two
+    different worksheets shot the same way look alike. Instead this measures
+    dark strokes against the local paper colour, crops to the inked region (so
+    framing doesn't matter) and records which grid cells carry more ink than
+    the median. Re-photos of one page differ in a few bits; different pages in
+    many. Only a small thumbnail is decoded.
+    """
+    import numpy as np
+    from PIL import Image, ImageFilter, ImageOps
+
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == 'JPEG':
+        image.draft('L', (HASH_WORK_WIDTH, HASH_WORK_WIDTH))
+    image = ImageOps.exif_transpose(image).convert('L')
+    height = max(1, round(HASH_WORK_WIDTH * image.height / image.width))
+    image = image.resize((HASH_WORK_WIDTH, height), Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    gray = np.asarray(image, dtype=np.float32)
+    paper = np.asarray(image.filter(ImageFilter.BoxBlur(4)), dtype=np.float32)
+    ink = np.clip(paper - gray - 8, 0, None)
+
+    rows = np.flatnonzero(ink.mean(axis=1) > ink.mean() * 0.5)
+    cols = np.flatnonzero(ink.mean(axis=0) > ink.mean() * 0.5)
+    if len(rows) and len(cols):
+        ink = ink[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+    density = np.asarray(Image.fromarray(ink).resize((hash_size, hash_size), Image.Resampling.BOX))
+    bits = (density > np.median(density)).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class OCRCache:
+    """Content-addressed cache of OCR text keyed by perceptual image hash.
+
+    Lookups match exactly first, then accept the closest stored hash within
+    max_distance bits, so re-photographed worksheets reuse earlier OCR.
+    An optional SQLite file keeps entries across restarts.
+    """
+
+    def __init__(self, max_size=2048, max_distance=6, db_path=None, disk_max_size=50000):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.db_path = db_path
+        self.disk_max_size = disk_max_size
+        self._entries = OrderedDict()  # hash -> (text, ocr_ms)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.near_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.ocr_ms_saved = 0.0
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            conn = self._conn()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ocr_cache '
+                '(hash TEXT PRIMARY KEY, text TEXT NOT NULL, ocr_ms REAL NOT NULL, used_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ocr_cache_used ON ocr_cache (used_at)')
+            # Warm the memory tier with the most recently used pages
+            rows = conn.execute(
+                'SELECT hash, text, ocr_ms FROM ocr_cache ORDER BY used_at DESC LIMIT ?', (max_size,)
+            ).fetchall()
+            for image_hash, text, ocr_ms in reversed(rows):
+                self._entries[int(image_hash, 16)] = (text, ocr_ms)
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from OCR_CACHE_* environment variables"""
+        return cls(
+            max_size=int(os.getenv('OCR_CACHE_SIZE', '2048')),
+            max_distance=int(os.getenv('OCR_CACHE_MAX_DISTANCE', '6')),
+            db_path=os.getenv('OCR_CACHE_DB') or None,
+            disk_max_size=int(os.getenv('OCR_CACHE_DISK_SIZE', '50000')),
+        )
+
+    def close(self):
+        """Drop SQLite connections, e.g. in a forked worker; they reopen on next use"""
+        conn = getattr(self._local, 'conn', None)
+        self._local = threading.local()
+        if conn is not None:
+            conn.close()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, image_hash):
+        """Return (text, ocr_ms) for a matching image, or None"""
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(image_hash)
+            match = image_hash
+            if entry is None:
+                best = self.max_distance + 1
+                for candidate in self._entries:
+                    distance = bin(candidate ^ image_hash).count('1')
+                    if distance < best:
+                        best, match = distance, candidate
+                entry = self._entries.get(match) if best <= self.max_distance else None
+                if entry is not None:
+                    self.near_hits += 1
+            if entry is not None:
+                self._entries.move_to_end(match)
+                self.hits += 1
+                self.ocr_ms_saved += entry[1]
+                return entry
+
+        # Not in memory (e.g. evicted); the disk tier only answers exact matches
+        entry = self._disk_get(image_hash)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self.ocr_ms_saved += entry[1]
+            self._remember(image_hash, entry)
+        return entry
+
+    def put(self, image_hash, text, ocr_ms):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._remember(image_hash, (text, ocr_ms))
+        if self.db_path:
+            conn = self._conn()
+            conn.execute(
+                'INSERT OR REPLACE INTO ocr_cache (hash, text, ocr_ms, used_at) VALUES (?, ?, ?, ?)',
+                (format(image_hash, 'x'), text, ocr_ms, time.time())
+            )
+            conn.execute(
+                'DELETE FROM ocr_cache WHERE hash IN (SELECT hash FROM ocr_cache ORDER BY used_at DESC '
+                'LIMIT -1 OFFSET ?)', (self.disk_max_size,)
+            )
+
+    def _remember(self, image_hash, entry):
+        self._entries[image_hash] = entry
+        self._entries.move_to_end(image_hash)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, image_hash):
+        if not self.db_path:
+            return None
+        conn = self._conn()
+        key = format(image_hash, 'x')
+        row = conn.execute('SELECT text, ocr_ms FROM ocr_cache WHERE hash = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE ocr_cache SET used_at = ? WHERE hash = ?', (time.time(), key))
+        return row[0], row[1]
+
+    def stats(self):
+        """Return hit rate and OCR time saved for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'max_distance': self.max_distance,
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'ocr_ms_saved': round(self.ocr_ms_saved, 1),
+            }
+        if self.db_path:
+            stats['disk_size'] = self._conn().execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+        return stats
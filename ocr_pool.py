@@ -0,0 +1,332 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# OEM 3 = default + LSTM; PSM 6 = block of text
+TESSERACT_CONFIG = r'--oem 3 --psm 6'
+
+# White border around a cropped region; Tesseract misreads text touching the edge
+REGION_PADDING = 10
+
+
+class OCRBusyError(Exception):
+    """Raised when the OCR queue is full or a job takes too long"""
+
+
+class OCRError(Exception):
+    """Picklable stand-in for errors raised inside a worker (some pytesseract
+    errors can't cross the process boundary and would break the pool)"""
+
+
+def _init_worker():
+    # Each worker already gets its own core; stop Tesseract from spawning
+    # OpenMP threads on top of that and oversubscribing the CPU.
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+
+def ocr_image(image_bytes, pipeline=None):
+    """Preprocess an uploaded photo and run Tesseract on it.
+
+    Runs inside a pool worker, so it only takes and returns picklable values.
+    """
+    from image_preprocess import PreprocessPipeline
+
+    try:
+        return _ocr_image(image_bytes, pipeline or PreprocessPipeline())
+    except Exception as e:
+        raise OCRError(str(e)) from None
+
+
+def _ocr_image(image_bytes, pipeline):
+    import pytesseract
+
+    started = time.perf_counter()
+    image, stages = pipeline.run(image_bytes)
+    preprocessed = time.perf_counter()
+
+    # Use pytesseract with appropriate config for handwriting
+    text = pytesseract.image_to_string(image, config=TESSERACT_CONFIG)
+    finished = time.perf_counter()
+
+    return {
+        'text': text,
+        'preprocess_ms': round((preprocessed - started) * 1000, 1),
+        'ocr_ms': round((finished - preprocessed) * 1000, 1),
+        'stages': stages,
+    }
+
+
+def segment_page(image_bytes, pipeline=None, max_regions=24):
+    """Preprocess one page and cut it into text regions.
+
+    Returns the regions as small PNG crops in reading order, ready for
+    ocr_regions(), with their boxes and the time spent on each step.
+    """
+    from image_preprocess import PreprocessPipeline
+
+    try:
+        return _segment_page(image_bytes, pipeline or PreprocessPipeline(), max_regions)
+    except Exception as e:
+        raise OCRError(str(e)) from None
+
+
+def _segment_page(image_bytes, pipeline, max_regions):
+    import numpy as np
+    from PIL import ImageOps
+    from image_preprocess import find_text_regions
+
+    started = time.perf_counter()
+    image, stages = pipeline.run(image_bytes)
+    preprocessed = time.perf_counter()
+
+    boxes = find_text_regions(np.asarray(image, dtype=np.uint8), max_regions=max_regions)
+    regions = []
+    for box in boxes:
+        buffer = io.BytesIO()
+        ImageOps.expand(image.crop(box), border=REGION_PADDING, fill=255).save(buffer, format='PNG')
+        regions.append(buffer.getvalue())
+    finished = time.perf_counter()
+
+    return {
+        'regions': regions,
+        'boxes': boxes,
+        'preprocess_ms': round((preprocessed - started) * 1000, 1),
+        'segment_ms': round((finished - preprocessed) * 1000, 1),
+        'stages': stages,
+    }
+
+
+def ocr_regions(regions):
+    """Run Tesseract on already preprocessed region crops; returns [{'text', 'ocr_ms'}] in order"""
+    try:
+        return _ocr_regions(regions)
+    except Exception as e:
+        raise OCRError(str(e)) from None
+
+
+def _ocr_regions(regions):
+    import pytesseract
+    from PIL import Image
+
+    results = []
+    for region in regions:
+        started = time.perf_counter()
+        text = pytesseract.image_to_string(Image.open(io.BytesIO(region)), config=TESSERACT_CONFIG)
+        results.append({'text': text, 'ocr_ms': round((time.perf_counter() - started) * 1000, 1)})
+    return results
+
+
+class OCRPool:
+    """Dedicated process pool for OCR with a bounded queue, isolated from request threads"""
+
+    def __init__(self, workers=None, max_queue=None, timeout=60.0, start_method=None, pipeline=None,
+                 max_regions=24):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_queue = self.workers * 2 if max_queue is None else max_queue
+        self.timeout = timeout
+        self.start_method = start_method
+        self._pipeline = pipeline
+        self.max_regions = max_regions
+        # Jobs allowed in the system at once: one per worker plus the waiting queue
+        self._slots = threading.BoundedSemaphore(max(1, self.workers) + self.max_queue)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.pages = 0
+        self.regions = 0
+        self.total_ocr_ms = 0.0
+        self.total_wait_ms = 0.0
+        self.total_stage_ms = {}
+        self.last_job = None
+
+    @classmethod
+    def from_env(cls):
+        """Build a pool from OCR_* environment variables; OCR_WORKERS=0 runs OCR in a thread"""
+        workers = os.getenv('OCR_WORKERS')
+        max_queue = os.getenv('OCR_MAX_QUEUE')
+        return cls(
+            workers=int(workers) if workers else None,
+            max_queue=int(max_queue) if max_queue else None,
+            timeout=float(os.getenv('OCR_TIMEOUT', '60')),
+            start_method=os.getenv('OCR_START_METHOD') or None,
+            max_regions=int(os.getenv('OCR_MAX_REGIONS', '24')),
+        )
+
+    @property
+    def pipeline(self):
+        """Preprocessing settings (OCR_PIPELINE etc.), built on first use so
+        importing main.py doesn't load NumPy and Pillow"""
+        if self._pipeline is None:
+            from image_preprocess import PreprocessPipeline
+            self._pipeline = PreprocessPipeline.from_env()
+        return self._pipeline
+
+    def warm_up(self):
+        """Load the OCR libraries now rather than on the first image"""
+        import pytesseract  # noqa: F401
+        return self.pipeline
+
+    @property
+    def executor(self):
+        """Started on first use so importing main.py doesn't fork workers"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    if self.workers <= 0:
+                        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ocr')
+                    else:
+                        context = multiprocessing.get_context(self.start_method)
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=context,
+                            initializer=_init_worker
+                        )
+        return self._executor
+
+    def ocr(self, image_bytes):
+        """Run OCR on image bytes in the pool and return the worker's result dict"""
+        submitted = time.perf_counter()
+        result, = self._run(ocr_image, [(image_bytes, self.pipeline)])
+
+        elapsed_ms = (time.perf_counter() - submitted) * 1000
+        result['queue_ms'] = round(max(0.0, elapsed_ms - result['preprocess_ms'] - result['ocr_ms']), 1)
+        with self._stats_lock:
+            self.completed += 1
+            self.total_ocr_ms += result['preprocess_ms'] + result['ocr_ms']
+            self.total_wait_ms += result['queue_ms']
+            for stage, ms in result['stages'].items():
+                self.total_stage_ms[stage] = self.total_stage_ms.get(stage, 0.0) + ms
+            self.last_job = {key: value for key, value in result.items() if key != 'text'}
+        return result
+
+    def ocr_pages(self, pages):
+        """Cut each page into text regions and OCR all the regions in parallel.
+
+        Pages are segmented side by side, then the regions of every page are
+        dealt out across the workers, so a five-page upload keeps the whole
+        pool busy instead of reading one page block by block. Returns one dict
+        per page with its regions (box, text, ocr_ms) in reading order.
+        """
+        segments = self._run(segment_page, [(page, self.pipeline, self.max_regions) for page in pages])
+
+        # (page, region) pairs dealt round-robin into one chunk per worker
+        keys = [(page, index) for page, segment in enumerate(segments) for index in range(len(segment['regions']))]
+        lanes = max(1, min(self.workers, len(keys)))
+        chunks = [keys[lane::lanes] for lane in range(lanes)] if keys else []
+        results = self._run(ocr_regions, [([segments[page]['regions'][index] for page, index in chunk],)
+                                          for chunk in chunks])
+        texts = {key: result for chunk, chunk_results in zip(chunks, results)
+                 for key, result in zip(chunk, chunk_results)}
+
+        read = []
+        for page, segment in enumerate(segments):
+            regions = [
+                dict(texts[(page, index)], box=list(box))
+                for index, box in enumerate(segment['boxes'])
+            ]
+            read.append({
+                'regions': regions,
+                'preprocess_ms': segment['preprocess_ms'],
+                'segment_ms': segment['segment_ms'],
+                'ocr_ms': round(sum(region['ocr_ms'] for region in regions), 1),
+                'stages': segment['stages'],
+            })
+        with self._stats_lock:
+            self.pages += len(read)
+            self.regions += len(keys)
+        return read
+
+    def _run(self, fn, calls):
+        """Run fn(*args) for each args tuple in the pool and return the results in order.
+
+        Calls go in waves of at most one per worker; each wave takes its queue
+        slots up front and is refused with OCRBusyError if they aren't free.
+        """
+        results = []
+        wave = max(1, self.workers)
+        for start in range(0, len(calls), wave):
+            results.extend(self._run_wave(fn, calls[start:start + wave]))
+        return results
+
+    def _run_wave(self, fn, calls):
+        acquired = 0
+        while acquired < len(calls) and self._slots.acquire(blocking=False):
+            acquired += 1
+        if acquired < len(calls):
+            for _ in range(acquired):
+                self._slots.release()
+            with self._stats_lock:
+                self.rejected += 1
+            raise OCRBusyError('Too many images are being read right now. Please try again in a moment.')
+
+        with self._stats_lock:
+            self.pending += len(calls)
+        futures = []
+        try:
+            for args in calls:
+                future = self.executor.submit(fn, *args)
+                futures.append(future)
+                # A timed-out job can't be stopped once it runs, so its slot is held until it really ends
+                future.add_done_callback(self._release)
+            deadline = time.monotonic() + self.timeout
+            try:
+                return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+            except FutureTimeoutError:
+                for future in futures:
+                    future.cancel()
+                raise OCRBusyError('Reading this image took too long. Please try a smaller or clearer photo.')
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge photo); start a fresh pool next time
+            with self._stats_lock:
+                self.failed += 1
+            self.shutdown(wait=False)
+            raise
+        except Exception:
+            with self._stats_lock:
+                self.failed += 1
+            raise
+        finally:
+            # Calls that never made it into the pool
+            for _ in range(len(calls) - len(futures)):
+                self._release()
+
+    def _release(self, future=None):
+        with self._stats_lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def shutdown(self, wait=True):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=not wait)
+                self._executor = None
+
+    def stats(self):
+        """Return queue depth and per-job timing for monitoring"""
+        with self._stats_lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'pending': self.pending,
+                'queue_depth': max(0, self.pending - max(1, self.workers)),
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'pages': self.pages,
+                'regions': self.regions,
+                'avg_ocr_ms': round(self.total_ocr_ms / self.completed, 1) if self.completed else 0.0,
+                'avg_queue_ms': round(self.total_wait_ms / self.completed, 1) if self.completed else 0.0,
+                'avg_stage_ms': {
+                    stage: round(total / self.completed, 1) for stage, total in self.total_stage_ms.items()
+                },
+                'last_job': self.last_job,
+            }
@@ -0,0 +1,96 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock profiler that can be switched on and off at runtime.
+
+    A background thread snapshots every thread's stack with
+    sys._current_frames() every interval and counts the collapsed stacks.
+    Request threads are never instrumented, so overhead is one stack walk per
+    thread per interval, and nothing at all while stopped.
+    """
+
+    def __init__(self, interval=0.01, max_depth=48):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.samples = 0
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None, reset=True):
+        with self._lock:
+            if interval:
+                self.interval = interval
+            if reset:
+                self._stacks.clear()
+                self.samples = 0
+            if self.running:
+                return
+            self._stop.clear()
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=1.0)
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id, frame in frames.items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(names)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
+
+    def collapsed(self):
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope"""
+        with self._lock:
+            return '\n'.join(f'{stack} {count}' for stack, count in self._stacks.most_common()) + '\n'
+
+    def report(self, limit=25):
+        """Top stacks and the functions most often on top of a stack"""
+        with self._lock:
+            leaves = Counter()
+            for stack, count in self._stacks.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+            total = sum(self._stacks.values()) or 1
+            return {
+                'running': self.running,
+                'interval_ms': round(self.interval * 1000, 2),
+                'samples': self.samples,
+                'started_at': self.started_at,
+                'top_functions': [
+                    {'function': name, 'share': round(count / total, 4)} for name, count in leaves.most_common(limit)
+                ],
+                'top_stacks': [
+                    {'stack': stack.split(';')[-6:], 'share': round(count / total, 4)}
+                    for stack, count in self._stacks.most_common(limit)
+                ],
+            }
+
+
+profiler = SamplingProfiler()
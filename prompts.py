@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+STUDENT_INSTRUCTIONS = """Instructions: You are EduMentor AI. Respond according to the student's class level and language preference.
+Be encouraging, educational, and age-appropriate. Use simple language for younger students and more detailed
+explanations for older students. If the language preference includes mixed languages, respond in Romanized
+transliteration using English script only."""
+
+
+def normalize_prompt(text):
+    """Strip trailing whitespace so edits to a prompt file don't change its bytes by accident"""
+    return '\n'.join(line.rstrip() for line in text.strip().splitlines())
+
+
+class TokenCounter:
+    """Count tokens with tiktoken when installed, otherwise estimate ~4 characters per token"""
+
+    def __init__(self, model='gpt-3.5-turbo'):
+        self.exact = False
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+                self.exact = True
+            except Exception:
+                self._encoding = None
+
+    def count(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return max(1, round(len(text) / 4)) if text else 0
+
+    def count_messages(self, messages):
+        # Each chat message carries ~4 tokens of framing on top of its content
+        return sum(self.count(message['content']) + 4 for message in messages) + 2
+
+
+class PromptRegistry:
+    """System prompts loaded once from config/, with a memoized prefix per student profile.
+
+    The system message for a (class, board, language) profile is built once
+    and reused byte for byte. Only the question changes between requests, so
+    upstream prompt caching can reuse the shared prefix.
+    """
+
+    def __init__(self, config_dir='config', name='tutor', model='gpt-3.5-turbo', max_profiles=1024):
+        self.config_dir = config_dir
+        self.max_profiles = max_profiles
+        self.counter = TokenCounter(model)
+        self.prompts = {}
+        for filename in sorted(os.listdir(config_dir)):
+            if filename.endswith('.txt'):
+                with open(os.path.join(config_dir, filename), encoding='utf-8') as f:
+                    self.prompts[filename[:-4]] = normalize_prompt(f.read())
+        if name not in self.prompts:
+            raise ValueError(f'Unknown system prompt {name!r}; available: {", ".join(sorted(self.prompts))}')
+        self.name = name
+        self.system_prompt = self.prompts[name]
+        self.version = hashlib.sha1(self.system_prompt.encode('utf-8')).hexdigest()[:8]
+        self.system_tokens = self.counter.count(self.system_prompt)
+        self._prefixes = OrderedDict()  # profile -> (system message, prefix tokens)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prefix_tokens = 0
+        self.history_tokens = 0
+        self.question_tokens = 0
+        self.prefix_hits = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a registry from SYSTEM_PROMPT (a file name in config/, without .txt)"""
+        return cls(
+            config_dir=os.getenv('PROMPT_DIR', 'config'),
+            name=os.getenv('SYSTEM_PROMPT', 'tutor'),
+        )
+
+    @staticmethod
+    def profile(student_info):
+        return (
+            student_info.get('class') or 'Not specified',
+            student_info.get('board') or 'Not specified',
+            student_info.get('language') or 'English',
+        )
+
+    def prefix(self, student_info):
+        """Return (system message, token count) for the student's profile"""
+        profile = self.profile(student_info)
+        with self._lock:
+            entry = self._prefixes.get(profile)
+            if entry is not None:
+                self._prefixes.move_to_end(profile)
+                self.prefix_hits += 1
+                return entry
+
+        class_level, board, language = profile
+        content = (
+            f"{self.system_prompt}\n\n"
+            f"Student Information:\n"
+            f"- Class/Level: {class_level}\n"
+            f"- Academic Board: {board}\n"
+            f"- Language Preference: {language}\n\n"
+            f"{STUDENT_INSTRUCTIONS}"
+        )
+        entry = ({'role': 'system', 'content': content}, self.counter.count(content) + 4)
+        with self._lock:
+            self._prefixes[profile] = entry
+            while len(self._prefixes) > self.max_profiles:
+                self._prefixes.popitem(last=False)
+        return entry
+
+    def messages(self, query, student_info, history=None):
+        """Chat messages for a question: the profile's shared prefix, any conversation
+        history, then the question"""
+        system_message, prefix_tokens = self.prefix(student_info)
+        history = history or []
+        history_tokens = sum(self.counter.count(message['content']) + 4 for message in history)
+        question_tokens = self.counter.count(query) + 4
+        with self._lock:
+            self.requests += 1
+            self.prefix_tokens += prefix_tokens
+            self.history_tokens += history_tokens
+            self.question_tokens += question_tokens
+        return [system_message, *history, {'role': 'user', 'content': query}]
+
+    def stats(self):
+        """Return prompt version, sizes, and input-token averages and totals"""
+        with self._lock:
+            return {
+                'prompt': self.name,
+                'version': self.version,
+                'available': sorted(self.prompts),
+                'system_tokens': self.system_tokens,
+                'exact_tokens': self.counter.exact,
+                'profiles': len(self._prefixes),
+                'prefix_hits': self.prefix_hits,
+                'requests': self.requests,
+                'avg_prefix_tokens': round(self.prefix_tokens / self.requests, 1) if self.requests else 0.0,
+                'avg_history_tokens': round(self.history_tokens / self.requests, 1) if self.requests else 0.0,
+                'avg_question_tokens': round(self.question_tokens / self.requests, 1) if self.requests else 0.0,
+                # Running totals, so /metrics can chart input tokens per second by part
+                'prefix_tokens': self.prefix_tokens,
+                'history_tokens': self.history_tokens,
+                'question_tokens': self.question_tokens,
+            }
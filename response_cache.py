@@ -0,0 +1,220 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Normalize a question so trivially different phrasings share a cache entry"""
+    text = (query or '').lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip('?!. ')
+
+
+def make_cache_key(query, student_info, history=None, tier=None):
+    """Build a cache key from the query and the profile fields that shape the answer.
+
+    Follow-up questions depend on the conversation so far, so any history
+    sent with the question becomes part of the key. So does the model tier,
+    since each tier may use a different model and answer length.
+    """
+    context = ''
+    if history:
+        context = hashlib.sha1(json.dumps(history, sort_keys=True).encode('utf-8')).hexdigest()
+    return (
+        normalize_query(query),
+        (student_info.get('class') or '').strip().lower(),
+        (student_info.get('board') or '').strip().lower(),
+        (student_info.get('language') or 'English').strip().lower(),
+        context,
+        tier or '',
+    )
+
+
+class _Flight:
+    """A single in-progress upstream computation shared by concurrent callers"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+    def follow(self):
+        """Yield the finished value as a single token, or raise the leader's error"""
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        yield self.value
+
+
+class _StreamFlight(_Flight):
+    """An in-progress streamed completion; followers replay its tokens as they arrive"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._cond = threading.Condition()
+
+    def push(self, token):
+        with self._cond:
+            self.parts.append(token)
+            self._cond.notify_all()
+
+    def finish(self, value=None, error=None):
+        with self._cond:
+            self.value = value
+            self.error = error
+            self.event.set()
+            self._cond.notify_all()
+
+    def follow(self):
+        """Yield the leader's tokens from the first one, then raise its error if it failed"""
+        sent = 0
+        while True:
+            with self._cond:
+                while sent == len(self.parts) and not self.event.is_set():
+                    self._cond.wait()
+                tokens = self.parts[sent:]
+                finished = self.event.is_set()
+            sent += len(tokens)
+            yield from tokens
+            if finished:
+                break
+        if self.error is not None:
+            raise self.error
+
+
+class ResponseCache:
+    """Bounded LRU cache with TTL that coalesces concurrent identical misses"""
+
+    def __init__(self, max_size=512, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        """Return (value, cached) for key, calling compute() at most once per burst"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value, True
+                del self._entries[key]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        try:
+            value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            flight.value = value
+            self._store(key, value)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+        return value, False
+
+    def stream(self, key, open_stream):
+        """Return (tokens, source) for a streamed answer, opening at most one upstream stream per burst.
+
+        source is 'cache' for a fresh cached value (yielded as one token),
+        'coalesced' when another caller is already computing or streaming the
+        same key (its tokens are replayed, then followed live), or 'upstream'
+        when this caller leads: open_stream() is called, its tokens are shared
+        with followers, and the joined answer is cached once it finishes.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return iter((value,)), 'cache'
+                del self._entries[key]
+
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight.follow(), 'coalesced'
+            flight = _StreamFlight()
+            self._inflight[key] = flight
+            self.misses += 1
+
+        return self._lead_stream(key, flight, open_stream), 'upstream'
+
+    def _lead_stream(self, key, flight, open_stream):
+        error = RuntimeError('The answer stream was abandoned')
+        try:
+            for token in open_stream():
+                flight.push(token)
+                yield token
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            value = None if error is not None else ''.join(flight.parts).strip()
+            if value is not None:
+                self._store(key, value)
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.finish(value, error)
+
+    def _store(self, key, value):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'in_flight': len(self._inflight),
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
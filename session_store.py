@@ -0,0 +1,214 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemorySessionStore:
+    """Process-local session store with TTL expiry and an LRU size bound"""
+
+    def __init__(self, ttl=7 * 24 * 3600, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            now = time.time()
+            if expires_at <= now:
+                del self._entries[key]
+                self.expired += 1
+                return default
+            # Sliding expiry: active sessions stay alive
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def close(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'expired': self.expired,
+                'evictions': self.evictions,
+            }
+
+
+class SQLiteSessionStore:
+    """Session store in a local SQLite database (WAL mode), shared by every worker
+    process on the host and kept across restarts"""
+
+    PURGE_EVERY = 500  # writes between sweeps of expired rows
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=100000, namespace='sessions', cache_kib=2048):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = ''.join(c for c in namespace if c.isalnum() or c == '_')
+        self.cache_kib = cache_kib
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_expires ON {self.table} (expires_at)')
+
+    def _conn(self):
+        """One connection per thread; SQLite connections aren't thread-safe"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA cache_size=-{int(self.cache_kib)}')  # bounded page cache
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        now = time.time()
+        row = self._conn().execute(
+            f'SELECT value, expires_at FROM {self.table} WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires_at = row
+        if expires_at <= now:
+            self._conn().execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+            with self._lock:
+                self.expired += 1
+            return default
+        # Sliding expiry, refreshed lazily so most reads stay read-only
+        if expires_at - now < self.ttl / 2:
+            self._conn().execute(
+                f'UPDATE {self.table} SET expires_at = ? WHERE key = ?', (now + self.ttl, key)
+            )
+        return json.loads(value)
+
+    def __setitem__(self, key, value):
+        self._conn().execute(
+            f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time() + self.ttl)
+        )
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            self.purge()
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __delitem__(self, key):
+        self._conn().execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+
+    def __len__(self):
+        return self._conn().execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def close(self):
+        """Close this thread's connection and forget the others.
+
+        Called in forked workers, which must not share the parent's SQLite
+        handles; each thread reconnects on next use.
+        """
+        conn = getattr(self._local, 'conn', None)
+        self._local = threading.local()
+        if conn is not None:
+            conn.close()
+
+    def purge(self):
+        """Drop expired rows, then the soonest-to-expire rows beyond max_entries"""
+        conn = self._conn()
+        expired = conn.execute(f'DELETE FROM {self.table} WHERE expires_at <= ?', (time.time(),)).rowcount
+        overflow = len(self) - self.max_entries
+        evicted = 0
+        if overflow > 0:
+            evicted = conn.execute(
+                f'DELETE FROM {self.table} WHERE key IN '
+                f'(SELECT key FROM {self.table} ORDER BY expires_at LIMIT ?)', (overflow,)
+            ).rowcount
+        with self._lock:
+            self.expired += expired
+            self.evictions += evicted
+
+    def stats(self):
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'size': len(self),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'expired': self.expired,
+            'evictions': self.evictions,
+        }
+
+
+def create_session_store(namespace='sessions', ttl=None, max_entries=None):
+    """Build the store selected by SESSION_STORE (memory or sqlite).
+
+    ttl and max_entries default to SESSION_TTL and SESSION_MAX_ENTRIES.
+    """
+    backend = os.getenv('SESSION_STORE', 'memory').lower()
+    if ttl is None:
+        ttl = int(os.getenv('SESSION_TTL', str(7 * 24 * 3600)))
+    if max_entries is None:
+        max_entries = int(os.getenv('SESSION_MAX_ENTRIES', '100000'))
+
+    if backend == 'sqlite':
+        path = os.getenv('SESSION_DB_PATH', os.path.join('data', 'sessions.db'))
+        return SQLiteSessionStore(path, ttl=ttl, max_entries=max_entries, namespace=namespace)
+    if backend != 'memory':
+        raise ValueError(f'Unknown SESSION_STORE backend: {backend}')
+    return MemorySessionStore(ttl=ttl, max_entries=max_entries)
@@ -4,6 +4,7 @@ let currentInputMethod = 'text';
 let mediaRecorder = null;
 let audioChunks = [];
 let isRecording = false;
+let liveVoice = null;
 let studentRegistered = false;
 
 // Generate unique session ID
@@ -176,24 +177,10 @@ async function submitTextQuery() {
     showLoading(true);
 
     try {
-        const response = await fetch('/api/query/text', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                session_id: sessionId,
-                query: query
-            })
-        });
-
-        const result = await response.json();
-
-        if (result.success) {
-            addMessage(result.response, 'ai');
-        } else {
-            showError(result.error || 'Failed to process your question');
-        }
+        await streamQuery('/api/query/text/stream', {
+            session_id: sessionId,
+            query: query
+        }, 'Failed to process your question');
     } catch (error) {
         showError('Network error. Please check your connection.');
         console.error('Text query error:', error);
@@ -202,18 +189,107 @@ async function submitTextQuery() {
     }
 }
 
+// Post a query to a streaming endpoint and render the answer as tokens arrive.
+// Blobs (photos, recordings) are sent as the raw request body; anything else as JSON.
+async function streamQuery(url, payload, failureMessage) {
+    const isBlob = payload instanceof Blob;
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: isBlob ? {} : {
+            'Content-Type': 'application/json',
+        },
+        body: isBlob ? payload : JSON.stringify(payload)
+    });
+
+    // Session errors and other failures come back as plain JSON
+    if (!response.ok || !response.body) {
+        const result = await response.json();
+        showError(result.error || failureMessage);
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    const handleEvent = answerEventHandler(failureMessage);
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let name = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    name = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice(6);
+                }
+            });
+            if (data) {
+                handleEvent(name, JSON.parse(data));
+            }
+        }
+    }
+}
+
+// Render answer events (transcripts, tokens, errors) as they arrive.
+// Shared by the SSE endpoints and the live voice WebSocket.
+function answerEventHandler(failureMessage) {
+    let answer = '';
+    let answerDiv = null;
+
+    return (name, data) => {
+        switch (name) {
+            case 'extracted_text':
+                addMessage(`Extracted text: "${data.extracted_text}"`, 'extracted-text');
+                break;
+            case 'transcribed_text':
+                addMessage(`You said: "${data.transcribed_text}"`, 'transcribed-text');
+                break;
+            case 'token':
+                if (!answerDiv) {
+                    showLoading(false);
+                    answerDiv = addMessage('', 'ai');
+                }
+                answer += data.content;
+                answerDiv.innerHTML = '<i class="fas fa-robot"></i> ' + formatText(answer);
+                const responseArea = document.getElementById('responseArea');
+                responseArea.scrollTop = responseArea.scrollHeight;
+                break;
+            case 'error':
+                showError(data.error || failureMessage);
+                break;
+            case 'done':
+                if (data.timing) {
+                    console.log('Answer timing (ms):', data.timing);
+                }
+                break;
+        }
+    };
+}
+
 // Handle image upload
 function handleImageUpload(input) {
     const file = input.files[0];
     if (file) {
-        const reader = new FileReader();
-        reader.onload = function(e) {
-            const preview = document.getElementById('imagePreview');
-            const img = document.getElementById('previewImg');
-            img.src = e.target.result;
-            preview.classList.remove('hidden');
-        };
-        reader.readAsDataURL(file);
+        const preview = document.getElementById('imagePreview');
+        const img = document.getElementById('previewImg');
+        // Object URLs point at the file itself; no base64 copy in memory
+        if (img.src.startsWith('blob:')) {
+            URL.revokeObjectURL(img.src);
+        }
+        img.src = URL.createObjectURL(file);
+        preview.classList.remove('hidden');
     }
 }
 
@@ -231,48 +307,26 @@ async function submitImageQuery() {
     }
 
     const file = fileInput.files[0];
-    const reader = new FileReader();
+
+    // Add user message
+    addMessage('📸 Image uploaded for analysis', 'user');
     
-    reader.onload = async function(e) {
-        const imageData = e.target.result;
-        
-        // Add user message
-        addMessage('📸 Image uploaded for analysis', 'user');
-        
-        // Show loading
-        showLoading(true);
-
-        try {
-            const response = await fetch('/api/query/image', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    session_id: sessionId,
-                    image_data: imageData
-                })
-            });
+    // Show loading
+    showLoading(true);
 
-            const result = await response.json();
+    try {
+        await streamQuery(uploadUrl('/api/query/image/upload'), file, 'Failed to process the image');
+    } catch (error) {
+        showError('Network error. Please check your connection.');
+        console.error('Image query error:', error);
+    } finally {
+        showLoading(false);
+    }
+}
 
-            if (result.success) {
-                if (result.extracted_text) {
-                    addMessage(`Extracted text: "${result.extracted_text}"`, 'extracted-text');
-                }
-                addMessage(result.response, 'ai');
-            } else {
-                showError(result.error || 'Failed to process the image');
-            }
-        } catch (error) {
-            showError('Network error. Please check your connection.');
-            console.error('Image query error:', error);
-        } finally {
-            showLoading(false);
-        }
-    };
-    
-    reader.readAsDataURL(file);
+// Binary upload endpoints take the session in the query string so the body can be raw bytes
+function uploadUrl(path) {
+    return `${path}?stream=1&session_id=${encodeURIComponent(sessionId)}`;
 }
 
 // Start voice recording
@@ -297,6 +351,11 @@ async function startRecording() {
             } 
         });
 
+        // Stream audio while the student talks when the server supports it
+        if (await startLiveRecording(stream)) {
+            return;
+        }
+
         // Try to use WAV format first, fallback to supported formats
         let mimeType = 'audio/wav';
         if (!MediaRecorder.isTypeSupported(mimeType)) {
@@ -329,11 +388,7 @@ async function startRecording() {
             const audioBlob = new Blob(audioChunks, { 
                 type: mediaRecorder.mimeType || 'audio/wav' 
             });
-            const reader = new FileReader();
-            reader.onload = function() {
-                submitVoiceQuery(reader.result);
-            };
-            reader.readAsDataURL(audioBlob);
+            submitVoiceQuery(audioBlob);
         };
 
         mediaRecorder.start();
@@ -382,8 +437,144 @@ async function startRecording() {
     }
 }
 
+// Live voice: send 16 kHz PCM over a WebSocket while the student is speaking.
+// The server detects the end of speech and answers straight away.
+// Resolves false if live voice isn't available so the caller can record a clip instead.
+function startLiveRecording(stream) {
+    if (!window.WebSocket || !(window.AudioContext || window.webkitAudioContext)) {
+        return Promise.resolve(false);
+    }
+
+    return new Promise(resolve => {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${window.location.host}/api/query/voice/ws`);
+        const handleEvent = answerEventHandler('Failed to process voice message');
+        let started = false;
+        let partialDiv = null;
+
+        socket.onopen = () => {
+            socket.send(JSON.stringify({ type: 'start', session_id: sessionId, sample_rate: 16000 }));
+        };
+        socket.onclose = () => {
+            if (!started) {
+                resolve(false);
+                return;
+            }
+            stopLiveCapture();
+            showLoading(false);
+            document.getElementById('voiceStatus').textContent = '';
+            liveVoice = null;
+        };
+        socket.onmessage = (message) => {
+            const data = JSON.parse(message.data);
+            switch (data.event) {
+                case 'ready':
+                    started = true;
+                    liveVoice = { socket, stream, capture: startPcmCapture(stream, socket) };
+                    isRecording = true;
+                    document.getElementById('recordBtn').disabled = true;
+                    document.getElementById('recordBtn').classList.add('recording');
+                    document.getElementById('stopBtn').disabled = false;
+                    document.getElementById('voiceStatus').innerHTML = '🔴 Listening... I will answer when you pause';
+                    resolve(true);
+                    break;
+                case 'speech_start':
+                    document.getElementById('voiceStatus').innerHTML = '🔴 Hearing you...';
+                    break;
+                case 'partial':
+                    if (!partialDiv) {
+                        partialDiv = addMessage('', 'transcribed-text');
+                    }
+                    partialDiv.innerHTML = '<i class="fas fa-microphone"></i> ' + formatText(`${data.text}...`);
+                    break;
+                case 'speech_end':
+                    stopLiveCapture();
+                    break;
+                case 'transcribed_text':
+                    if (partialDiv) {
+                        partialDiv.remove();
+                    }
+                    handleEvent(data.event, data);
+                    break;
+                case 'done':
+                case 'error':
+                    if (!started) {
+                        // e.g. session not found: report it rather than falling back
+                        started = true;
+                        resolve(true);
+                    }
+                    handleEvent(data.event, data);
+                    socket.close();
+                    break;
+                default:
+                    handleEvent(data.event, data);
+            }
+        };
+    });
+}
+
+// Capture microphone audio, downsample to 16 kHz 16-bit PCM and send each block
+function startPcmCapture(stream, socket) {
+    const context = new (window.AudioContext || window.webkitAudioContext)();
+    const source = context.createMediaStreamSource(stream);
+    const processor = context.createScriptProcessor(4096, 1, 1);
+    const ratio = context.sampleRate / 16000;
+
+    processor.onaudioprocess = (event) => {
+        const input = event.inputBuffer.getChannelData(0);
+        const output = new Int16Array(Math.floor(input.length / ratio));
+        for (let i = 0; i < output.length; i++) {
+            // Average the input samples that fall into each output sample
+            const start = Math.floor(i * ratio);
+            const end = Math.min(input.length, Math.floor((i + 1) * ratio));
+            let sum = 0;
+            for (let j = start; j < end; j++) {
+                sum += input[j];
+            }
+            const sample = Math.max(-1, Math.min(1, sum / Math.max(1, end - start)));
+            output[i] = sample * 0x7fff;
+        }
+        if (socket.readyState === WebSocket.OPEN) {
+            socket.send(output.buffer);
+        }
+    };
+
+    source.connect(processor);
+    processor.connect(context.destination);
+    return { context, source, processor };
+}
+
+// Stop the microphone for a live recording; the socket stays open for the answer
+function stopLiveCapture() {
+    if (!liveVoice || !liveVoice.capture) {
+        return;
+    }
+    const { capture, stream } = liveVoice;
+    capture.processor.disconnect();
+    capture.source.disconnect();
+    capture.context.close();
+    stream.getTracks().forEach(track => track.stop());
+    liveVoice.capture = null;
+    isRecording = false;
+
+    addMessage('🎤 Voice message recorded', 'user');
+    showLoading(true);
+    document.getElementById('recordBtn').disabled = false;
+    document.getElementById('recordBtn').classList.remove('recording');
+    document.getElementById('stopBtn').disabled = true;
+    document.getElementById('voiceStatus').textContent = 'Processing audio...';
+}
+
 // Stop voice recording
 function stopRecording() {
+    if (liveVoice) {
+        stopLiveCapture();
+        if (liveVoice.socket.readyState === WebSocket.OPEN) {
+            liveVoice.socket.send(JSON.stringify({ type: 'stop' }));
+        }
+        return;
+    }
+
     if (mediaRecorder && isRecording) {
         mediaRecorder.stop();
         mediaRecorder.stream.getTracks().forEach(track => track.stop());
@@ -398,7 +589,7 @@ function stopRecording() {
 }
 
 // Submit voice query
-async function submitVoiceQuery(audioData) {
+async function submitVoiceQuery(audioBlob) {
     // Add user message
     addMessage('🎤 Voice message recorded', 'user');
     
@@ -406,27 +597,7 @@ async function submitVoiceQuery(audioData) {
     showLoading(true);
 
     try {
-        const response = await fetch('/api/query/voice', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                session_id: sessionId,
-                audio_data: audioData
-            })
-        });
-
-        const result = await response.json();
-
-        if (result.success) {
-            if (result.transcribed_text) {
-                addMessage(`You said: "${result.transcribed_text}"`, 'transcribed-text');
-            }
-            addMessage(result.response, 'ai');
-        } else {
-            showError(result.error || 'Failed to process voice message');
-        }
+        await streamQuery(uploadUrl('/api/query/voice/upload'), audioBlob, 'Failed to process voice message');
     } catch (error) {
         showError('Network error. Please check your connection.');
         console.error('Voice query error:', error);
@@ -494,6 +665,8 @@ function addMessage(content, type) {
     
     // Scroll to bottom
     responseArea.scrollTop = responseArea.scrollHeight;
+
+    return messageDiv;
 }
 
 // Show loading state
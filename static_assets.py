@@ -0,0 +1,114 @@
+import hashlib
+import mimetypes
+import os
+import threading
+
+
+class StaticAsset:
+    __slots__ = ('path', 'mtime', 'size', 'digest', 'mimetype', 'bodies')
+
+    def __init__(self, path, mtime, size, digest, mimetype, bodies):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+        self.mimetype = mimetype
+        self.bodies = bodies  # coding ('identity', 'gzip', 'br') -> bytes
+
+
+class StaticAssets:
+    """Content-hashed URLs and pre-compressed copies of the files in static/.
+
+    url_for('static', ...) gains ?v=<hash of the file>, so a page can tell
+    browsers to keep its assets for a year. A new deploy changes the hash and
+    the URL, and the next page load fetches the new file. Files up to
+    max_bytes are read once, hashed and compressed ahead of time. Each copy is
+    rebuilt when the file's mtime or size changes. Bigger files fall back to
+    Flask's own send_file.
+    """
+
+    def __init__(self, folder, compressor=None, enabled=True, max_bytes=2 * 1024 * 1024, max_age=31536000):
+        self.folder = folder
+        self.enabled = enabled
+        self.compressor = compressor
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._assets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.not_modified = 0
+        self.builds = 0
+
+    @classmethod
+    def from_env(cls, folder, compressor=None):
+        """Build from STATIC_CACHE / STATIC_MAX_AGE / STATIC_MAX_BYTES environment variables"""
+        return cls(
+            folder,
+            compressor=compressor,
+            enabled=os.getenv('STATIC_CACHE', '1') != '0',
+            max_bytes=int(os.getenv('STATIC_MAX_BYTES', str(2 * 1024 * 1024))),
+            max_age=int(os.getenv('STATIC_MAX_AGE', '31536000')),
+        )
+
+    def get(self, filename):
+        """The asset for a path under the folder, or None if it's missing, outside it or too big"""
+        if not self.enabled:
+            return None
+        path = os.path.realpath(os.path.join(self.folder, filename))
+        if not path.startswith(os.path.realpath(self.folder) + os.sep):
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size > self.max_bytes:
+            return None
+
+        asset = self._assets.get(path)
+        if asset is not None and asset.mtime == stat.st_mtime_ns and asset.size == stat.st_size:
+            return asset
+        with open(path, 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        bodies = {'identity': data}
+        if self.compressor is not None and mimetype.startswith(('text/', 'application/javascript', 'application/json',
+                                                                'image/svg+xml')):
+            for coding in self.compressor.codings:
+                compressed = self.compressor.encode(data, coding)
+                if len(compressed) < len(data):
+                    bodies[coding] = compressed
+        asset = StaticAsset(path, stat.st_mtime_ns, stat.st_size, hashlib.sha256(data).hexdigest()[:16],
+                            mimetype, bodies)
+        with self._lock:
+            self._assets[path] = asset
+            self.builds += 1
+        return asset
+
+    def version(self, filename):
+        """Short content hash for a URL, or None if the file isn't served from memory"""
+        asset = self.get(filename)
+        return asset.digest if asset is not None else None
+
+    def count(self, not_modified=False):
+        with self._lock:
+            self.hits += 1
+            if not_modified:
+                self.not_modified += 1
+
+    def stats(self):
+        """Return cached assets with their sizes per coding, and how often browsers revalidated"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'assets': {
+                    os.path.relpath(asset.path, self.folder): {
+                        'version': asset.digest,
+                        **{f'{coding}_bytes': len(body) for coding, body in asset.bodies.items()},
+                    }
+                    for asset in self._assets.values()
+                },
+                'requests': self.hits,
+                'not_modified': self.not_modified,
+                'builds': self.builds,
+                'max_age': self.max_age,
+            }
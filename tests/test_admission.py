@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, WorkClass
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def test_session_cap_applies_to_concurrent_requests():
+    admission = AdmissionController(slots=10, rate=0, session_max_in_flight=1)
+    barrier = threading.Barrier(20)
+    tickets, reasons = [], []
+
+    def admit():
+        barrier.wait()
+        try:
+            tickets.append(admission.admit('text', 'student'))
+        except AdmissionRejected as e:
+            reasons.append(e.reason)
+
+    threads = [threading.Thread(target=admit) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(tickets) == 1
+    assert reasons == ['session_busy'] * 19
+    tickets[0].release()
+    admission.admit('text', 'student').release()
+
+
+def test_rate_limit_and_refund_when_the_queue_is_full():
+    admission = AdmissionController(slots=1, classes=[WorkClass('text', max_queue=0)], rate=0.001, burst=2,
+                                    session_max_in_flight=0)
+    held = admission.admit('text', 'a')
+
+    # Turned away by the server, so b's tokens are given back each time
+    for _ in range(3):
+        with pytest.raises(AdmissionRejected) as rejected:
+            admission.admit('text', 'b')
+        assert rejected.value.reason == 'queue_full'
+
+    held.release()
+    admission.admit('text', 'b').release()
+    admission.admit('text', 'b').release()
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit('text', 'b')
+    assert rejected.value.status == 429
+    assert rejected.value.reason == 'rate_limited'
+
+
+def test_waiter_past_its_deadline_is_shed():
+    admission = AdmissionController(slots=1, classes=[WorkClass('text', deadline=0.05)], rate=0,
+                                    session_max_in_flight=0)
+    held = admission.admit('text', 'a')
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit('text', 'b')
+    assert rejected.value.reason == 'deadline'
+    held.release()
+    assert admission.stats()['in_flight'] == 0
+
+
+def test_freed_slots_are_shared_by_weight():
+    admission = AdmissionController(
+        slots=1,
+        classes=[WorkClass('text', weight=3, deadline=10), WorkClass('heavy', weight=1, deadline=10)],
+        rate=0, session_max_in_flight=0,
+    )
+    held = admission.admit('text', 'holder')
+    order = []
+
+    def admit(work):
+        ticket = admission.admit(work, None)
+        order.append(work)
+        ticket.release()
+
+    threads = [threading.Thread(target=admit, args=(work,)) for work in ['text'] * 4 + ['heavy'] * 4]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: admission.stats()['text']['queued'] == 4 and admission.stats()['heavy']['queued'] == 4)
+
+    held.release()
+    for thread in threads:
+        thread.join()
+    assert order[:4].count('text') == 3
+    assert sorted(order) == ['heavy'] * 4 + ['text'] * 4
+    assert admission.stats()['in_flight'] == 0
+
+
+
+def test_ticket_release_is_idempotent_across_threads():
+    admission = AdmissionController(slots=4, rate=0, session_max_in_flight=0)
+    for _ in range(50):
+        ticket = admission.admit('text', 'a')
+        barrier = threading.Barrier(4)
+
+        def release():
+            barrier.wait()
+            ticket.release()
+
+        threads = [threading.Thread(target=release) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert admission.stats()['in_flight'] == 0
@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+from answer_index import AnswerIndex
+
+SOURCE = os.path.join(os.path.dirname(__file__), '..', 'data', 'answers.json')
+
+
+@pytest.fixture(scope='module')
+def index():
+    return AnswerIndex(SOURCE, index_path=None)
+
+
+@pytest.mark.parametrize('query, class_level, answer_id', [
+    ('What is photosynthesis?', 'Class 4', 'photosynthesis-primary'),
+    ('explain photosynthesis', 'Class 8', 'photosynthesis-secondary'),
+    ('how do plants make food', 'Class 12', 'photosynthesis-senior'),
+    ('What is AI?', 'Class 8', 'ai-secondary'),
+    ('explain the water cycle', 'Class 4', 'water-cycle-primary'),
+    ("State Newton's laws", 'Class 9', 'newtons-laws-secondary'),
+    ('explain fractions', 'Class 3', 'fractions-primary'),
+])
+def test_common_questions_are_served_locally(index, query, class_level, answer_id):
+    doc, confidence = index.search(query, {'class': class_level})
+    assert doc['id'] == answer_id
+    assert confidence >= index.min_confidence
+    assert index.lookup(query, {'class': class_level}) is not None
+
+
+@pytest.mark.parametrize('query, class_level', [
+    ('what is a plant', 'Class 4'),
+    ('what is a computer', 'Class 8'),
+    ('what is learning', 'Class 8'),
+    ('what is water', 'Class 4'),
+    ('what is force', 'Class 9'),
+    ('what is a half', 'Class 3'),
+    ('explain photosynthesis in C4 plants with the Calvin cycle', 'Class 12'),
+])
+def test_off_topic_questions_miss(index, query, class_level):
+    assert index.lookup(query, {'class': class_level}) is None
+
+
+def test_demo_only_answers_are_not_served_with_an_api_key(index):
+    assert index.lookup('Help me with maths', {'class': 'Class 8'}) is None
+    assert index.lookup('Help me with maths', {'class': 'Class 8'}, demo=True) is not None
+
+
+def test_demo_mode_falls_back_to_the_generic_answer(index):
+    assert index.lookup('what is a volcano', {'class': 'Class 8'}, demo=True)
+
+
+def test_saved_index_is_reused(tmp_path):
+    path = tmp_path / 'index.json'
+    AnswerIndex(SOURCE, index_path=str(path))
+    saved = json.loads(path.read_text(encoding='utf-8'))
+    assert not list(tmp_path.glob('*.tmp'))
+
+    reloaded = AnswerIndex(SOURCE, index_path=str(path))
+    assert reloaded.build_ms == saved['build_ms']
+    assert reloaded.lookup('What is photosynthesis?', {'class': 'Class 4'}) is not None
+
+
+def test_unwritable_index_path_keeps_the_index_in_memory(tmp_path):
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+    index = AnswerIndex(SOURCE, index_path=str(blocker / 'index.json'))
+    assert index.lookup('What is photosynthesis?', {'class': 'Class 4'}) is not None
@@ -0,0 +1,57 @@
+import time
+
+from upstream import CircuitBreaker
+
+
+def test_opens_on_error_rate_after_min_calls():
+    breaker = CircuitBreaker(window=10, min_calls=4, error_threshold=0.5, cooldown=60)
+    breaker.record(True, 0.1)
+    breaker.record(False, 0.1)
+    breaker.record(True, 0.1)
+    assert breaker.state == 'closed'
+    breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_opens_on_slow_calls():
+    breaker = CircuitBreaker(window=10, min_calls=2, slow_threshold=0.5, slow_seconds=1.0, cooldown=60)
+    breaker.record(True, 0.1)
+    breaker.record(True, 2.0)
+    assert breaker.state == 'open'
+
+
+def test_probe_after_cooldown_closes_or_reopens():
+    breaker = CircuitBreaker(window=4, min_calls=1, cooldown=0.05)
+    breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()  # one probe at a time
+    breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == 'closed'
+    assert breaker.stats()['trips'] == 2
+
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker(window=4, min_calls=1, cooldown=0.05)
+    breaker.record(False, 0.1)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.cancel()  # e.g. the request's budget ran out before the call reached upstream
+    assert breaker.allow()
+
+
+def test_disabled_breaker_always_allows():
+    breaker = CircuitBreaker(enabled=False, min_calls=1)
+    breaker.record(False, 0.1)
+    assert breaker.allow()
+    assert breaker.state == 'closed'
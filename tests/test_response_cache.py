@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+def test_identical_misses_share_one_computation():
+    cache = ResponseCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'answer'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute)))
+               for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [('answer', False)] + [('answer', True)] * 9
+    assert cache.stats()['coalesced'] == 9
+    assert cache.get_or_compute('key', compute) == ('answer', True)
+
+
+def test_leader_error_reaches_followers_and_is_not_cached():
+    cache = ResponseCache()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError('upstream down')
+
+    errors = []
+
+    def ask(compute):
+        try:
+            cache.get_or_compute('key', compute)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=ask, args=(fail,))
+    leader.start()
+    started.wait()
+    ask(lambda: 'never called')
+    leader.join()
+
+    assert errors == ['upstream down', 'upstream down']
+    assert cache.get_or_compute('key', lambda: 'fresh') == ('fresh', False)
+
+
+def test_stream_followers_replay_tokens_then_follow_live():
+    cache = ResponseCache()
+    step = threading.Semaphore(0)
+
+    def open_stream():
+        for token in ('Plants ', 'make ', 'food.'):
+            step.acquire()
+            yield token
+
+    leader, source = cache.stream('key', open_stream)
+    assert source == 'upstream'
+    step.release()
+    assert next(leader) == 'Plants '
+
+    follower, source = cache.stream('key', lambda: pytest.fail('a second stream was opened'))
+    assert source == 'coalesced'
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(follower))
+    reader.start()
+
+    step.release()
+    step.release()
+    assert list(leader) == ['make ', 'food.']
+    reader.join(timeout=5)
+    assert ''.join(received) == 'Plants make food.'
+
+    tokens, source = cache.stream('key', lambda: pytest.fail('the answer should be cached'))
+    assert source == 'cache'
+    assert list(tokens) == ['Plants make food.']
+
+
+def test_abandoned_stream_fails_followers_and_is_not_cached():
+    cache = ResponseCache()
+    leader, _ = cache.stream('key', lambda: iter(('one ', 'two')))
+    assert next(leader) == 'one '
+    follower, source = cache.stream('key', lambda: iter(()))
+    assert source == 'coalesced'
+    leader.close()
+
+    assert next(follower) == 'one '
+    with pytest.raises(RuntimeError):
+        next(follower)
+    _, source = cache.stream('key', lambda: iter(('again',)))
+    assert source == 'upstream'
+
+
+def test_plain_request_joins_an_in_flight_stream():
+    cache = ResponseCache()
+    leader, _ = cache.stream('key', lambda: iter(('Hello ', 'there')))
+    assert next(leader) == 'Hello '
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(cache.get_or_compute('key', lambda: 'other')))
+    waiter.start()
+    assert list(leader) == ['there']
+    waiter.join(timeout=5)
+    assert result == [('Hello there', True)]
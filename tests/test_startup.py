@@ -0,0 +1,34 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', '600'))
+
+# Loaded on first use by image and voice requests (or the first upstream call), never at import
+HEAVY_MODULES = ('openai', 'httpx', 'numpy', 'PIL', 'pytesseract', 'speech_recognition', 'vosk', 'voice_stream',
+                 'image_preprocess')
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({'import_ms': import_ms, 'loaded': [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def import_main():
+    env = dict(os.environ, WARM_UP='none', PYTHONPATH=ROOT)
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True,
+                            timeout=60, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_import_main_is_fast_and_leaves_heavy_libraries_unloaded():
+    runs = [import_main() for _ in range(3)]
+    assert all(run['loaded'] == [] for run in runs), runs[0]['loaded']
+    median_ms = statistics.median(run['import_ms'] for run in runs)
+    assert median_ms < BUDGET_MS, f'import main took {median_ms:.0f}ms, over the {BUDGET_MS:.0f}ms budget'
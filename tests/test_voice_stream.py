@@ -0,0 +1,77 @@
+import numpy as np
+
+from voice_pipeline import VoicePipeline
+from voice_stream import VoiceStream
+
+
+class FakeRecognizer:
+    """Recognizes every language instantly; en-US is the one that understands"""
+
+    languages = ('en-IN', 'en-US', 'en')
+
+    def __init__(self):
+        self.calls = []
+
+    def recognize(self, pcm, sample_rate):
+        return self.recognize_with_language(pcm, sample_rate)[0]
+
+    def recognize_with_language(self, pcm, sample_rate, languages=None):
+        languages = tuple(languages or self.languages)
+        self.calls.append(languages)
+        if 'en-US' in languages:
+            return f'{len(pcm) // 2} samples', 'en-US'
+        return '', None
+
+
+def tone(seconds, rate=16000):
+    t = np.arange(int(seconds * rate)) / rate
+    return (np.sin(2 * np.pi * 220 * t) * 0.3 * 32767).astype('<i2').tobytes()
+
+
+def speak(stream, seconds, chunk=0.1):
+    for _ in range(int(seconds / chunk)):
+        stream.feed(tone(chunk))
+        # Let the partial thread finish so the next one is started on schedule
+        if stream._partial_future is not None:
+            stream._partial_future.result()
+
+
+def test_partials_detect_the_language_once_then_use_only_it():
+    recognizer = FakeRecognizer()
+    stream = VoiceStream(VoicePipeline(recognizer=recognizer), partial_interval=0.5)
+    speak(stream, 2.5)
+
+    assert len(recognizer.calls) >= 3
+    assert recognizer.calls[0] == FakeRecognizer.languages
+    assert all(languages == ('en-US',) for languages in recognizer.calls[1:])
+    assert stream.language == 'en-US'
+
+
+def test_finish_reuses_a_partial_covering_the_whole_utterance():
+    recognizer = FakeRecognizer()
+    stream = VoiceStream(VoicePipeline(recognizer=recognizer), partial_interval=0.5)
+    # Stop talking right as a partial starts on everything said so far
+    while not (stream._partial_future is not None and stream._partial_at == stream._samples):
+        stream.feed(tone(0.1))
+    stream.end()
+
+    text, timings = stream.finish()
+
+    assert timings['reused_partial']
+    assert len(recognizer.calls) == stream._partial_runs
+    assert text == f'{stream._samples} samples'
+    assert stream.pipeline.completed == 1
+
+
+def test_finish_recognizes_again_when_the_partial_is_stale():
+    recognizer = FakeRecognizer()
+    stream = VoiceStream(VoicePipeline(recognizer=recognizer), partial_interval=0.5)
+    speak(stream, 0.7)
+    stream.end()
+    calls = len(recognizer.calls)
+
+    text, timings = stream.finish()
+
+    assert 'reused_partial' not in timings
+    assert len(recognizer.calls) == calls + 1
+    assert text == f'{stream._samples} samples'
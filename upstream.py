@@ -0,0 +1,621 @@
+import contextvars
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Monotonic time by which the current request must be answered, set from its
+# endpoint's latency budget; upstream calls never wait past it
+request_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+
+class UpstreamTimeoutError(Exception):
+    """Raised when a completion can't finish within its deadline"""
+
+
+class DeadlineExhaustedError(UpstreamTimeoutError):
+    """Raised when the deadline runs out before a call reaches upstream (queueing, OCR, a slot wait)"""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling upstream while it's failing or too slow, then probes until it's back.
+
+    - closed: calls go through, and the last `window` outcomes are kept. It
+      trips open once at least min_calls are in the window and either the
+      error rate or the share of calls slower than slow_seconds reaches its
+      threshold.
+    - open: calls fail straight away with CircuitOpenError for `cooldown` seconds.
+    - half_open: one probe call at a time goes through. A fast success closes
+      the breaker; a failure or a slow call opens it again.
+    """
+
+    STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+    def __init__(self, enabled=True, window=20, min_calls=10, error_threshold=0.5, slow_threshold=0.5,
+                 slow_seconds=15.0, cooldown=30.0):
+        self.enabled = enabled
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.slow_threshold = slow_threshold
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self._outcomes = deque(maxlen=window)  # (ok, slow)
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.rejected = 0
+        self.probes = 0
+
+    def allow(self):
+        """Whether a call may go upstream now"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == 'open':
+                if now - self._opened_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self.state = 'half_open'
+                self._probe_started = None
+            if self.state == 'half_open':
+                # A probe that never reported back (e.g. an abandoned stream) doesn't block forever
+                if self._probe_started is not None and now - self._probe_started < max(self.cooldown, self.slow_seconds):
+                    self.rejected += 1
+                    return False
+                self._probe_started = now
+                self.probes += 1
+            return True
+
+    def record(self, ok, seconds):
+        """Record a finished call: whether it succeeded and how long it took"""
+        if not self.enabled:
+            return
+        with self._lock:
+            healthy = ok and seconds < self.slow_seconds
+            if self.state == 'half_open':
+                if healthy:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                    print("✅ Upstream circuit breaker closed: the probe succeeded")
+                else:
+                    self._trip()
+                return
+            if self.state == 'open':
+                return  # A call that started before the breaker tripped
+            self._outcomes.append((ok, seconds >= self.slow_seconds))
+            if len(self._outcomes) >= self.min_calls:
+                errors = sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes)
+                slow = sum(1 for _, slow in self._outcomes if slow) / len(self._outcomes)
+                if errors >= self.error_threshold or slow >= self.slow_threshold:
+                    self._trip()
+
+    def cancel(self):
+        """Forget an allowed call that never reached upstream, so a half-open probe isn't held up"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == 'half_open':
+                self._probe_started = None
+
+    def _trip(self):
+        self.state = 'open'
+        self._opened_at = time.monotonic()
+        self._probe_started = None
+        self._outcomes.clear()
+        self.trips += 1
+        print(f"⚡ Upstream circuit breaker open: answering locally for {self.cooldown:g}s")
+
+    def stats(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                'enabled': self.enabled,
+                'state': self.state,
+                'state_code': self.STATES[self.state],
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'probes': self.probes,
+                'window_calls': len(outcomes),
+                'window_error_rate': round(sum(1 for ok, _ in outcomes if not ok) / len(outcomes), 3)
+                if outcomes else 0.0,
+                'window_slow_rate': round(sum(1 for _, slow in outcomes if slow) / len(outcomes), 3)
+                if outcomes else 0.0,
+            }
+
+
+class LatencyTracker:
+    """Recent call latencies per key (model, or model time to first token), for hedging delays"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key, pct):
+        """The pct-th percentile of recent samples, or None with too few of them"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, len(ordered) * pct // 100)]
+
+
+@lru_cache(maxsize=None)
+def retryable_errors():
+    """Errors worth retrying: the request may well succeed a moment later"""
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+class UpstreamClient:
+    """Shared OpenAI client with pooled keep-alive connections, an in-flight cap,
+    per-call deadlines, jittered exponential backoff, optional hedging and a
+    circuit breaker"""
+
+    def __init__(self, api_key=None, base_url=None, max_connections=20, max_in_flight=16,
+                 timeout=30.0, deadline=60.0, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 breaker=None, hedge_ratio=0.0, hedge_min_delay=0.5):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(enabled=False)
+        self.latency = LatencyTracker()
+        self.hedge_ratio = hedge_ratio
+        self.hedge_min_delay = hedge_min_delay
+        self._hedge_executor = None
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.hedge_eligible = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a client from OPENAI_* and UPSTREAM_* environment variables"""
+        return cls(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            base_url=os.getenv('OPENAI_BASE_URL') or None,
+            max_connections=int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '20')),
+            max_in_flight=int(os.getenv('UPSTREAM_MAX_IN_FLIGHT', '16')),
+            timeout=float(os.getenv('UPSTREAM_TIMEOUT', '30')),
+            deadline=float(os.getenv('UPSTREAM_DEADLINE', '60')),
+            max_retries=int(os.getenv('UPSTREAM_MAX_RETRIES', '3')),
+            breaker=CircuitBreaker(
+                enabled=os.getenv('BREAKER', '1') != '0',
+                window=int(os.getenv('BREAKER_WINDOW', '20')),
+                min_calls=int(os.getenv('BREAKER_MIN_CALLS', '10')),
+                error_threshold=float(os.getenv('BREAKER_ERROR_RATE', '0.5')),
+                slow_threshold=float(os.getenv('BREAKER_SLOW_RATE', '0.5')),
+                slow_seconds=float(os.getenv('BREAKER_SLOW_SECONDS', '15')),
+                cooldown=float(os.getenv('BREAKER_COOLDOWN', '30')),
+            ),
+            hedge_ratio=float(os.getenv('UPSTREAM_HEDGE_RATIO', '0')),
+            hedge_min_delay=float(os.getenv('UPSTREAM_HEDGE_MIN_DELAY', '0.5')),
+        )
+
+    @property
+    def client(self):
+        """The underlying OpenAI client, created on first use.
+
+        openai and httpx are imported here rather than at module level; they
+        take a large share of the app's import time.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import httpx
+                    import openai
+
+                    http_client = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                            keepalive_expiry=60.0
+                        ),
+                        timeout=httpx.Timeout(self.timeout, connect=5.0)
+                    )
+                    # Retries are handled here so they share the call's deadline
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=http_client,
+                        max_retries=0
+                    )
+        return self._client
+
+    def close(self):
+        """Close pooled connections; the client is recreated on next use"""
+        with self._client_lock:
+            client, self._client = self._client, None
+            executor, self._hedge_executor = self._hedge_executor, None
+        if client is not None:
+            client.close()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def complete(self, messages, model='gpt-3.5-turbo', max_tokens=1000, temperature=0.7, deadline=None,
+                 on_usage=None):
+        """Return the text of a chat completion, retrying transient failures until the deadline.
+
+        on_usage, if given, is called with (prompt_tokens, completion_tokens).
+        Fails straight away with CircuitOpenError while the breaker is open. With
+        hedging on, a second identical call starts once the first passes the
+        recent p95 latency, and whichever finishes first wins.
+        """
+        expires_at = self._expires_at(deadline)
+        if not self.breaker.allow():
+            raise CircuitOpenError('The AI service is unavailable right now')
+
+        started = time.monotonic()
+        call = lambda: self._complete(messages, model, max_tokens, temperature, expires_at)
+        try:
+            hedge_after = self._hedge_delay(model)
+            text, usage = self._hedged(call, hedge_after, expires_at) if hedge_after is not None else call()
+        except Exception as e:
+            if self._is_failure(e):
+                self.breaker.record(False, time.monotonic() - started)
+            else:
+                self.breaker.cancel()
+            raise
+        elapsed = time.monotonic() - started
+        self.breaker.record(True, elapsed)
+        self.latency.observe(model, elapsed)
+        if on_usage is not None and usage is not None:
+            on_usage(*usage)
+        return text
+
+    def _complete(self, messages, model, max_tokens, temperature, expires_at):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            with self._slot(expires_at, after=error):
+                try:
+                    response = self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        timeout=self._remaining(expires_at)
+                    )
+                    usage = self._record_usage(response)
+                    return response.choices[0].message.content.strip(), usage
+                except retryable_errors() as e:
+                    error = e
+            self._backoff(attempt, expires_at, error)
+
+    def stream(self, messages, model='gpt-3.5-turbo', max_tokens=1000, temperature=0.7, deadline=None):
+        """Yield content tokens from a streamed chat completion.
+
+        Failures are only retried before the first token, since tokens already
+        yielded can't be taken back. Hedging and the breaker work on the time
+        to the first token, since the total depends on the answer's length.
+        """
+        expires_at = self._expires_at(deadline)
+        if not self.breaker.allow():
+            raise CircuitOpenError('The AI service is unavailable right now')
+
+        started = time.monotonic()
+        key = f'{model}:first_token'
+        make = lambda: self._stream(messages, model, max_tokens, temperature, expires_at)
+        hedge_after = self._hedge_delay(key)
+        tokens = self._hedged_stream(make, hedge_after, expires_at) if hedge_after is not None else make()
+        first_token = None
+        try:
+            for token in tokens:
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                    self.latency.observe(key, first_token)
+                yield token
+        except Exception as e:
+            if self._is_failure(e):
+                self.breaker.record(False, time.monotonic() - started)
+            else:
+                self.breaker.cancel()
+            raise
+        else:
+            self.breaker.record(True, first_token if first_token is not None else time.monotonic() - started)
+        finally:
+            tokens.close()
+
+    def _stream(self, messages, model, max_tokens, temperature, expires_at):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            started = False
+            with self._slot(expires_at, after=error):
+                try:
+                    response = self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        stream=True,
+                        timeout=self._remaining(expires_at)
+                    )
+                    try:
+                        for chunk in response:
+                            if not chunk.choices:
+                                continue
+                            token = chunk.choices[0].delta.content
+                            if token:
+                                started = True
+                                yield token
+                    finally:
+                        # Hand the connection back even when the reader stops early
+                        response.response.close()
+                    return
+                except retryable_errors() as e:
+                    if started:
+                        raise
+                    error = e
+            self._backoff(attempt, expires_at, error)
+
+    def _expires_at(self, deadline):
+        """When a call must finish: its own deadline, or sooner if the request's budget runs out first"""
+        expires_at = time.monotonic() + (deadline or self.deadline)
+        budget = request_deadline.get()
+        return min(expires_at, budget) if budget is not None else expires_at
+
+    @staticmethod
+    def _is_failure(error):
+        """Errors that say upstream is unhealthy (not e.g. a bad API key, or a budget spent before the call)"""
+        if isinstance(error, DeadlineExhaustedError):
+            return False
+        return isinstance(error, (UpstreamTimeoutError,) + retryable_errors())
+
+    def _hedge_delay(self, key):
+        """Seconds to wait before hedging, or None when hedging is off or there's no p95 yet"""
+        if self.hedge_ratio <= 0:
+            return None
+        p95 = self.latency.percentile(key, 95)
+        return max(self.hedge_min_delay, p95) if p95 is not None else None
+
+    def _take_hedge(self):
+        """Hedge at most hedge_ratio of eligible calls, so a slow upstream isn't sent double the load"""
+        with self._stats_lock:
+            self.hedge_eligible += 1
+            if self.hedges >= self.hedge_ratio * self.hedge_eligible:
+                return False
+            self.hedges += 1
+            return True
+
+    @property
+    def hedge_executor(self):
+        if self._hedge_executor is None:
+            with self._client_lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(max_workers=self.max_in_flight * 2,
+                                                              thread_name_prefix='upstream-hedge')
+        return self._hedge_executor
+
+    def _hedged(self, call, delay, expires_at):
+        """Run call(), starting a duplicate if it takes longer than delay; the first success wins"""
+        primary = self.hedge_executor.submit(call)
+        done, _ = wait([primary], timeout=min(delay, max(0.0, expires_at - time.monotonic())))
+        if done or not self._take_hedge():
+            try:
+                return primary.result(timeout=max(0.0, expires_at - time.monotonic()))
+            except FuturesTimeoutError:
+                raise UpstreamTimeoutError('Upstream deadline exceeded') from None
+
+        hedge = self.hedge_executor.submit(call)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, expires_at - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise UpstreamTimeoutError('Upstream deadline exceeded')
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._stats_lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _hedged_stream(self, make, delay, expires_at):
+        """Yield tokens from make(), or from a duplicate stream if that produces a token first"""
+        events = queue.Queue()
+        stop = [threading.Event(), threading.Event()]
+
+        def pump(index):
+            tokens = make()
+            try:
+                for token in tokens:
+                    if stop[index].is_set():
+                        break
+                    events.put((index, 'token', token))
+                events.put((index, 'done', None))
+            except Exception as e:
+                events.put((index, 'error', e))
+            finally:
+                tokens.close()
+
+        self.hedge_executor.submit(pump, 0)
+        running = 1
+        hedge_at = time.monotonic() + delay
+        winner = None
+        try:
+            while True:
+                now = time.monotonic()
+                wait_until = expires_at if winner is not None or hedge_at is None else min(hedge_at, expires_at)
+                try:
+                    index, kind, value = events.get(timeout=max(0.0, wait_until - now))
+                except queue.Empty:
+                    if winner is None and hedge_at is not None and time.monotonic() < expires_at:
+                        hedge_at = None
+                        if self._take_hedge():
+                            self.hedge_executor.submit(pump, 1)
+                            running += 1
+                        continue
+                    raise UpstreamTimeoutError('Upstream deadline exceeded')
+
+                if winner is None and kind != 'error':
+                    winner = index
+                    stop[1 - index].set()
+                    if index == 1:
+                        with self._stats_lock:
+                            self.hedge_wins += 1
+                if kind == 'error':
+                    running -= 1
+                    if index == winner or running == 0:
+                        raise value
+                elif index == winner:
+                    if kind == 'done':
+                        return
+                    yield value
+        finally:
+            for event in stop:
+                event.set()
+
+    @contextmanager
+    def _slot(self, expires_at, after=None):
+        """Hold an in-flight slot, giving up on waiting when the deadline passes.
+
+        after is the error of an earlier attempt that reached upstream; running
+        out of time before a retry is then an upstream timeout, not a local one.
+        """
+        try:
+            timeout = self._remaining(expires_at)
+            with self._stats_lock:
+                self.waiting += 1
+            acquired = self._slots.acquire(timeout=timeout)
+            with self._stats_lock:
+                self.waiting -= 1
+                if acquired:
+                    self.in_flight += 1
+                    self.calls += 1
+                else:
+                    self.timeouts += 1
+            if not acquired:
+                raise DeadlineExhaustedError('Timed out waiting for a free upstream connection')
+        except DeadlineExhaustedError:
+            if after is None:
+                raise
+            raise UpstreamTimeoutError('Upstream deadline exceeded') from after
+
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _remaining(self, expires_at):
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise DeadlineExhaustedError('Upstream deadline exceeded')
+        return remaining
+
+    def _backoff(self, attempt, expires_at, error):
+        """Sleep before the next attempt, or re-raise when out of retries or time"""
+        import openai
+
+        if isinstance(error, openai.APITimeoutError) and time.monotonic() >= expires_at - 0.05:
+            # The client timeout was cut to the time left, so this is the deadline running out
+            with self._stats_lock:
+                self.failures += 1
+            raise UpstreamTimeoutError('Upstream deadline exceeded') from error
+        if attempt >= self.max_retries:
+            with self._stats_lock:
+                self.failures += 1
+            raise error
+
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        if time.monotonic() + delay >= expires_at:
+            with self._stats_lock:
+                self.failures += 1
+            raise error
+
+        with self._stats_lock:
+            self.retries += 1
+        time.sleep(delay)
+
+    def _record_usage(self, response):
+        """Count a response's tokens; returns (prompt_tokens, completion_tokens) or None"""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return None
+        with self._stats_lock:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+        return usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+    def stats(self):
+        """Return call, retry, hedging and concurrency counters, and the breaker's state"""
+        with self._stats_lock:
+            return {
+                'configured': bool(self.api_key),
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'calls': self.calls,
+                'retries': self.retries,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'breaker': self.breaker.stats(),
+            }
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, if it said so"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
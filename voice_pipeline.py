@@ -0,0 +1,352 @@
+import io
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# NumPy and SpeechRecognition are imported where they're used, so that
+# importing main.py stays fast on instances that never receive audio.
+
+TARGET_SAMPLE_RATE = 16000  # what every recognizer backend expects for speech
+
+
+class VoiceInputError(Exception):
+    """Raised when a recording can't be decoded or no speech is recognized"""
+
+
+def decode_audio(audio_bytes, mime_type='', sample_rate=TARGET_SAMPLE_RATE, timeout=30.0):
+    """Decode a recording in memory; returns (mono float32 samples, sample rate).
+
+    WAV is read with the wave module. Anything else (webm/opus, mp4/aac, ogg)
+    is piped through ffmpeg, which decodes straight to mono PCM at
+    sample_rate, so nothing touches the disk either way.
+    """
+    if audio_bytes[:4] == b'RIFF' and audio_bytes[8:12] == b'WAVE':
+        return _decode_wav(audio_bytes)
+
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise VoiceInputError(
+            f'Cannot decode {mime_type or "this"} audio: ffmpeg is not installed. Please record as WAV or type your question.'
+        )
+    try:
+        result = subprocess.run(
+            [ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+             '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1'],
+            input=audio_bytes, capture_output=True, timeout=timeout, check=False
+        )
+    except subprocess.TimeoutExpired:
+        raise VoiceInputError('Decoding the recording took too long. Please try a shorter message.')
+    if result.returncode != 0 or not result.stdout:
+        detail = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        print(f"Audio decode error: {detail[-1] if detail else result.returncode}")
+        raise VoiceInputError('The recording could not be decoded. Please try recording again.')
+    import numpy as np
+    samples = np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768.0
+    return samples, sample_rate
+
+
+def _decode_wav(audio_bytes):
+    import numpy as np
+
+    try:
+        with wave.open(io.BytesIO(audio_bytes)) as wav:
+            channels = wav.getnchannels()
+            width = wav.getsampwidth()
+            rate = wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise VoiceInputError(f'The WAV recording could not be read ({e}). Please try recording again.')
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768.0
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8)
+                | (raw[:, 2].astype(np.int8).astype(np.int32) << 16))
+        samples = ints.astype(np.float32) / 8388608.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise VoiceInputError(f'Unsupported WAV sample width: {width * 8} bits.')
+
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def resample(samples, rate, target_rate=TARGET_SAMPLE_RATE):
+    """Resample mono audio with linear interpolation.
+
+    When downsampling, a moving average over the rate ratio first removes
+    content above the new Nyquist frequency so it doesn't alias into speech.
+    """
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    import numpy as np
+    ratio = rate / target_rate
+    if ratio > 1:
+        width = int(np.ceil(ratio))
+        if width > 1:
+            kernel = np.ones(width, dtype=np.float32) / width
+            samples = np.convolve(samples, kernel, mode='same')
+    count = max(1, int(round(len(samples) / ratio)))
+    positions = np.arange(count, dtype=np.float64) * ratio
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def to_pcm16(samples):
+    """Convert float samples in [-1, 1] to little-endian 16-bit PCM bytes"""
+    import numpy as np
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+class GoogleRecognizer:
+    """Google Web Speech API, trying several languages at once.
+
+    Every language is requested concurrently and the first one that returns
+    text wins, so a miss on en-IN no longer costs a full extra round trip.
+    """
+
+    name = 'google'
+
+    def __init__(self, languages=('en-IN', 'en-US', 'en'), max_workers=8, timeout=15.0):
+        self.languages = tuple(languages)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='speech')
+
+    def _attempt(self, audio, language):
+        import speech_recognition as sr
+        recognizer = sr.Recognizer()
+        recognizer.operation_timeout = self.timeout
+        return recognizer.recognize_google(audio, language=language)
+
+    def recognize(self, pcm, sample_rate):
+        return self.recognize_with_language(pcm, sample_rate)[0]
+
+    def recognize_with_language(self, pcm, sample_rate, languages=None):
+        """(text, language that produced it) using the given languages, or all of them"""
+        import speech_recognition as sr
+        audio = sr.AudioData(pcm, sample_rate, 2)
+        attempts = {self._executor.submit(self._attempt, audio, language): language
+                    for language in (languages or self.languages)}
+        pending = set(attempts)
+        deadline = time.monotonic() + self.timeout
+        service_error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    text = future.result()
+                except sr.UnknownValueError:
+                    continue
+                except sr.RequestError as e:
+                    service_error = e
+                    continue
+                if text:
+                    # Later attempts finish in the background; their results are dropped
+                    for other in pending:
+                        other.cancel()
+                    return text, attempts[future]
+        if pending and service_error is None:
+            raise VoiceInputError('Speech recognition took too long. Please try again later.')
+        if service_error is not None:
+            raise VoiceInputError(f'Speech recognition service error: {service_error}. Please try again later.')
+        return '', None
+
+
+class SphinxRecognizer:
+    """Offline CMU PocketSphinx recognition (pip install pocketsphinx)"""
+
+    name = 'sphinx'
+
+    def __init__(self, language='en-US'):
+        self.language = language
+
+    def recognize(self, pcm, sample_rate):
+        import speech_recognition as sr
+        try:
+            return sr.Recognizer().recognize_sphinx(sr.AudioData(pcm, sample_rate, 2), language=self.language)
+        except sr.UnknownValueError:
+            return ''
+        except sr.RequestError as e:
+            raise VoiceInputError(f'Offline speech recognition is not available: {e}')
+
+
+class VoskRecognizer:
+    """Offline Kaldi recognition with Vosk (pip install vosk; download a model
+    from https://alphacephei.com/vosk/models and point VOSK_MODEL_PATH at it).
+
+    The model is loaded once and shared; each request gets its own recognizer.
+    """
+
+    name = 'vosk'
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    try:
+                        from vosk import Model, SetLogLevel
+                    except ImportError:
+                        raise VoiceInputError('Offline speech recognition is not available: vosk is not installed.')
+                    if not self.model_path or not os.path.isdir(self.model_path):
+                        raise VoiceInputError('Offline speech recognition is not available: set VOSK_MODEL_PATH.')
+                    SetLogLevel(-1)
+                    self._model = Model(self.model_path)
+        return self._model
+
+    def recognize(self, pcm, sample_rate):
+        stream = self.open_stream(sample_rate)
+        stream.accept(pcm)
+        return stream.finish()
+
+    def open_stream(self, sample_rate):
+        """Incremental recognition: feed audio as it arrives, read partial text"""
+        return _VoskStream(self.model, sample_rate)
+
+
+class _VoskStream:
+    def __init__(self, model, sample_rate):
+        from vosk import KaldiRecognizer
+
+        self._recognizer = KaldiRecognizer(model, sample_rate)
+        self._final = []
+
+    def accept(self, pcm):
+        """Feed PCM16 audio; returns the transcript so far"""
+        if self._recognizer.AcceptWaveform(pcm):
+            self._final.append(json.loads(self._recognizer.Result()).get('text', ''))
+            partial = ''
+        else:
+            partial = json.loads(self._recognizer.PartialResult()).get('partial', '')
+        return ' '.join(t for t in self._final + [partial] if t)
+
+    def finish(self):
+        self._final.append(json.loads(self._recognizer.FinalResult()).get('text', ''))
+        return ' '.join(t for t in self._final if t)
+
+
+RECOGNIZERS = {
+    'google': GoogleRecognizer,
+    'sphinx': SphinxRecognizer,
+    'vosk': VoskRecognizer,
+}
+
+
+class VoicePipeline:
+    """Decode, resample and recognize recordings without temporary files"""
+
+    def __init__(self, recognizer=None, sample_rate=TARGET_SAMPLE_RATE, decode_timeout=30.0):
+        self.recognizer = recognizer or GoogleRecognizer()
+        self.sample_rate = sample_rate
+        self.decode_timeout = decode_timeout
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.total_ms = {}
+        self.last_job = None
+
+    @classmethod
+    def from_env(cls):
+        """Build a pipeline from VOICE_RECOGNIZER (google, sphinx or vosk) and related settings"""
+        backend = os.getenv('VOICE_RECOGNIZER', 'google').lower()
+        if backend == 'google':
+            languages = os.getenv('VOICE_LANGUAGES', 'en-IN,en-US,en')
+            recognizer = GoogleRecognizer(
+                languages=[l.strip() for l in languages.split(',') if l.strip()],
+                timeout=float(os.getenv('VOICE_TIMEOUT', '15'))
+            )
+        elif backend == 'sphinx':
+            recognizer = SphinxRecognizer()
+        elif backend == 'vosk':
+            recognizer = VoskRecognizer(os.getenv('VOSK_MODEL_PATH', os.path.join('models', 'vosk')))
+        else:
+            raise ValueError(f'Unknown VOICE_RECOGNIZER backend: {backend}')
+        return cls(recognizer=recognizer, sample_rate=int(os.getenv('VOICE_SAMPLE_RATE', str(TARGET_SAMPLE_RATE))))
+
+    def warm_up(self):
+        """Load the audio libraries (and a Vosk model) now rather than on the first recording"""
+        import numpy  # noqa: F401
+        if isinstance(self.recognizer, VoskRecognizer):
+            self.recognizer.model
+        else:
+            import speech_recognition  # noqa: F401
+
+    def transcribe(self, audio_bytes, mime_type=''):
+        """Return (text, {'decode_ms', 'resample_ms', 'recognize_ms'}) for a recording"""
+        started = time.perf_counter()
+        try:
+            samples, rate = decode_audio(audio_bytes, mime_type, self.sample_rate, self.decode_timeout)
+        except Exception:
+            self.record_job(None)
+            raise
+        return self.recognize_samples(samples, rate, {'decode_ms': _elapsed_ms(started)})
+
+    def recognize_samples(self, samples, rate, timings=None):
+        """Resample already-decoded mono samples and run the recognizer on them"""
+        timings = dict(timings or {})
+        try:
+            started = time.perf_counter()
+            pcm = to_pcm16(resample(samples, rate, self.sample_rate))
+            timings['resample_ms'] = _elapsed_ms(started)
+            timings['audio_seconds'] = round(len(pcm) / 2 / self.sample_rate, 2)
+            if not pcm:
+                raise VoiceInputError('No speech detected. Please speak louder and try again.')
+
+            started = time.perf_counter()
+            text = self.recognizer.recognize(pcm, self.sample_rate).strip()
+            timings['recognize_ms'] = _elapsed_ms(started)
+            if not text:
+                raise VoiceInputError('Could not understand the audio. Please speak clearly and try again.')
+        except Exception:
+            self.record_job(None)
+            raise
+
+        self.record_job(timings)
+        return text, timings
+
+    def record_job(self, timings):
+        """Count a finished recognition; timings=None records a failure"""
+        with self._lock:
+            if timings is None:
+                self.failed += 1
+                return
+            self.completed += 1
+            for stage, ms in timings.items():
+                if stage.endswith('_ms'):
+                    self.total_ms[stage] = self.total_ms.get(stage, 0.0) + ms
+            self.last_job = timings
+
+    def stats(self):
+        """Return per-stage timing averages for monitoring"""
+        with self._lock:
+            return {
+                'recognizer': self.recognizer.name,
+                'sample_rate': self.sample_rate,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_ms': {
+                    stage: round(total / self.completed, 1) for stage, total in self.total_ms.items()
+                } if self.completed else {},
+                'last_job': self.last_job,
+            }
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
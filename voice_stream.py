@@ -0,0 +1,254 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from voice_pipeline import VoiceInputError, resample, to_pcm16
+
+# Partial transcripts for backends without incremental recognition re-run the
+# recognizer on the utterance so far; this pool bounds how many run at once.
+_partial_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('VOICE_PARTIAL_WORKERS', '4')), thread_name_prefix='partial'
+)
+
+
+class VoiceActivityDetector:
+    """Energy-based voice activity detection over fixed-length frames.
+
+    The noise floor is tracked continuously from non-speech frames, so
+    calibration happens while the student is already talking instead of
+    costing a fixed half second up front.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, ratio=3.0, min_rms=0.006,
+                 start_ms=120, end_silence_ms=800):
+        self.frame = max(1, sample_rate * frame_ms // 1000)
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.end_frames = max(1, end_silence_ms // frame_ms)
+        self.noise = min_rms
+        self.in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._rest = np.zeros(0, dtype=np.float32)
+
+    def feed(self, samples):
+        """Process samples; returns the transitions seen ('start' / 'end')"""
+        samples = np.concatenate([self._rest, samples])
+        count = len(samples) // self.frame
+        self._rest = samples[count * self.frame:]
+        if count == 0:
+            return []
+
+        frames = samples[:count * self.frame].reshape(count, self.frame)
+        levels = np.sqrt((frames.astype(np.float64) ** 2).mean(axis=1))
+        changes = []
+        for level in levels:
+            speech = level > max(self.min_rms, self.noise * self.ratio)
+            if not speech:
+                self.noise += 0.1 * (level - self.noise)
+            if not self.in_speech:
+                self._speech_run = self._speech_run + 1 if speech else 0
+                if self._speech_run >= self.start_frames:
+                    self.in_speech = True
+                    self._silence_run = 0
+                    changes.append('start')
+            else:
+                self._silence_run = 0 if speech else self._silence_run + 1
+                if self._silence_run >= self.end_frames:
+                    self.in_speech = False
+                    self._speech_run = 0
+                    changes.append('end')
+        return changes
+
+
+class VoiceStream:
+    """One live utterance: PCM16 chunks in, speech events and partial transcripts out.
+
+    Recognition overlaps recording. Backends with incremental decoding (Vosk)
+    are fed every chunk. Others are re-run on the utterance so far every
+    partial_interval seconds in a background thread, one run at a time. The
+    first partial tries every language; later ones use only the language it
+    detected (or the primary one), and a partial that already covers the
+    whole utterance becomes the final transcript.
+    """
+
+    def __init__(self, pipeline, sample_rate=16000, partial_interval=1.5, max_seconds=30.0,
+                 preroll_seconds=0.4):
+        self.pipeline = pipeline
+        self.sample_rate = sample_rate
+        self.partial_interval = partial_interval
+        self.max_seconds = max_seconds
+        self.vad = VoiceActivityDetector(sample_rate)
+        self._preroll = deque()
+        self._preroll_samples = int(preroll_seconds * sample_rate)
+        self._chunks = []
+        self._samples = 0
+        self._partial_future = None
+        self._partial_at = 0
+        self._partial_runs = 0
+        self._last_partial = None  # (text, samples it covered)
+        self.language = None
+        self._pending_partial = None
+        self._live = None
+        self.partial_text = ''
+        self.partials = 0
+        self.speaking = False
+        self.ended = False
+        self.speech_ended_at = None
+
+    def feed(self, pcm):
+        """Add a chunk of 16-bit little-endian mono PCM; returns events to send"""
+        if self.ended:
+            return []
+        samples = np.frombuffer(pcm[:len(pcm) - len(pcm) % 2], dtype='<i2').astype(np.float32) / 32768.0
+        events = []
+        changes = self.vad.feed(samples)
+
+        if self.speaking:
+            self._append(samples)
+        elif 'start' in changes:
+            self.speaking = True
+            events.append({'event': 'speech_start'})
+            for chunk in self._preroll:
+                self._append(chunk)
+            self._preroll.clear()
+            self._append(samples)
+        else:
+            self._preroll.append(samples)
+            while sum(len(c) for c in self._preroll) - len(self._preroll[0]) > self._preroll_samples:
+                self._preroll.popleft()
+
+        if self.speaking and ('end' in changes or self._samples >= self.max_seconds * self.sample_rate):
+            self.end()
+            events.append({'event': 'speech_end'})
+        events.extend(self.poll())
+        return events
+
+    def _append(self, samples):
+        self._chunks.append(samples)
+        self._samples += len(samples)
+        if self._live is None and hasattr(self.pipeline.recognizer, 'open_stream'):
+            self._live = self.pipeline.recognizer.open_stream(self.pipeline.sample_rate)
+        if self._live is not None:
+            text = self._live.accept(to_pcm16(resample(samples, self.sample_rate, self.pipeline.sample_rate)))
+            self._set_partial(text)
+
+    def _set_partial(self, text):
+        text = (text or '').strip()
+        if text and text != self.partial_text:
+            self.partial_text = text
+            self.partials += 1
+            self._pending_partial = text
+
+    def poll(self):
+        """Collect a finished partial transcript and start the next one if due"""
+        if self._live is None and self.speaking and not self.ended and self.partial_interval > 0:
+            future = self._partial_future
+            if future is not None and future.done():
+                self._partial_future = None
+                try:
+                    self._collect_partial(future.result())
+                except Exception as e:
+                    print(f"Partial recognition error: {e}")
+            if self._partial_future is None and self._samples - self._partial_at >= self.partial_interval * self.sample_rate:
+                self._partial_at = self._samples
+                utterance = np.concatenate(self._chunks)
+                self._partial_future = _partial_executor.submit(self._recognize_partial, utterance,
+                                                                self._partial_languages())
+                self._partial_runs += 1
+
+        text = self._pending_partial
+        if text is None:
+            return []
+        self._pending_partial = None
+        return [{'event': 'partial', 'text': text}]
+
+    def _partial_languages(self):
+        languages = getattr(self.pipeline.recognizer, 'languages', None)
+        if not languages or (self._partial_runs == 0 and self.language is None):
+            return None
+        return (self.language or languages[0],)
+
+    def _recognize_partial(self, utterance, languages):
+        """(text, detected language, samples covered) for the utterance so far"""
+        pcm = to_pcm16(resample(utterance, self.sample_rate, self.pipeline.sample_rate))
+        recognizer = self.pipeline.recognizer
+        if hasattr(recognizer, 'recognize_with_language'):
+            text, language = recognizer.recognize_with_language(pcm, self.pipeline.sample_rate, languages)
+        else:
+            text, language = recognizer.recognize(pcm, self.pipeline.sample_rate), None
+        return text, language, len(utterance)
+
+    def _collect_partial(self, result):
+        text, language, samples = result
+        if language:
+            self.language = language
+        self._last_partial = ((text or '').strip(), samples)
+        self._set_partial(text)
+
+    def _final_from_partial(self):
+        """Final (text, timings) from a partial covering every sample, or None"""
+        started = time.perf_counter()
+        future = self._partial_future
+        if future is not None and self._partial_at == self._samples:
+            # Already recognizing exactly this utterance: wait instead of starting over
+            self._partial_future = None
+            try:
+                self._collect_partial(future.result())
+            except Exception as e:
+                print(f"Partial recognition error: {e}")
+                return None
+        if self._last_partial is None:
+            return None
+        text, samples = self._last_partial
+        if not text or samples != self._samples:
+            return None
+        timings = {
+            'audio_seconds': round(self._samples / self.sample_rate, 2),
+            'recognize_ms': round((time.perf_counter() - started) * 1000, 2),
+            'reused_partial': True,
+        }
+        self.pipeline.record_job(timings)
+        return text, timings
+
+    def end(self):
+        """Mark end of speech (detected, or the student pressed stop)"""
+        if not self.ended:
+            self.ended = True
+            self.speech_ended_at = time.perf_counter()
+
+    def finish(self):
+        """Final transcript once speech has ended; returns (text, voice_timing)"""
+        self.end()
+        if not self._chunks:
+            if self._partial_future is not None:
+                self._partial_future.cancel()
+            raise VoiceInputError('No speech detected. Please speak louder and try again.')
+
+        if self._live is None:
+            final = self._final_from_partial()
+            if self._partial_future is not None:
+                self._partial_future.cancel()
+            if final is None:
+                final = self.pipeline.recognize_samples(np.concatenate(self._chunks), self.sample_rate)
+            text, timings = final
+        else:
+            started = time.perf_counter()
+            text = self._live.finish().strip()
+            timings = {
+                'audio_seconds': round(self._samples / self.sample_rate, 2),
+                'recognize_ms': round((time.perf_counter() - started) * 1000, 2),
+            }
+            if not text:
+                self.pipeline.record_job(None)
+                raise VoiceInputError('Could not understand the audio. Please speak clearly and try again.')
+            self.pipeline.record_job(timings)
+
+        timings['partials'] = self.partials
+        # What the student waits for: end of speech to final transcript
+        timings['final_ms'] = round((time.perf_counter() - self.speech_ended_at) * 1000, 2)
+        return text, timings
@@ -0,0 +1,9 @@
+"""Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py warms up libraries itself, around the fork.
+"""
+from main import create_app
+
+app = create_app(warm=False)